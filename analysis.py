@@ -0,0 +1,563 @@
+import argparse
+import glob
+import hashlib
+import os
+import re
+
+import pandas as pd
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.patches import Patch
+
+from results_store import load_frame
+from resources import resource_fields
+
+# Analysis of any number of sweeps. Every source (result CSV or results
+# database) is parsed into one long-format frame with one row per run; the
+# cells are then aggregated with a single groupby and joined with the
+# baseline snapshotter on their index, so a cell missing for one snapshotter
+# gives NaN instead of shifting the others.
+
+cell_columns = ["snapshotter", "bandwidth_mbps", "container", "rtt_ms"]
+# Columns identifying one cell of a sweep
+
+run_columns = cell_columns + ["iteration", "status", "seconds", "metrics_sum", "cache_state", "source"] + resource_fields
+# Columns of the long-format runs frame
+
+cache_dir = ".fleetbench_cache"
+# Directory of the parsed sources, keyed by path, size and modification time
+
+parse_version = 3
+# Version of the parse of a source, bumped when it changes so that older cached parses are not reused
+
+snapshotter_styles = {
+    "overlayfs": {"color": "#0080ff", "marker": "s", "label": "OverlayFS"},
+    "stargz": {"color": "#FFA500", "marker": "o", "label": "eStargz"},
+    "fleet": {"color": "g", "marker": "d", "label": "Fleet"},
+}
+# Plot style of the known snapshotters, others get the default color cycle
+
+result_file_pattern = re.compile(r"provisioning_times_(overlayfs|stargz|fleet)_(.*)fleetbench\.csv$")
+# Result file name written by bench.py, with an optional tag such as "200bw_"
+
+resources_csv_columns = {
+    "CPU Seconds": "cpu_seconds",
+    "Peak RSS": "peak_rss_bytes",
+    "Disk Read": "disk_read_bytes",
+    "Disk Write": "disk_write_bytes",
+    "Network": "net_bytes",
+    "Context Switches": "context_switches",
+}
+# Columns of the resources file written by bench.py mapped to their run column
+
+def parse_result_csv(result_file):
+    """
+    Parse a provisioning_times_*.csv file and its metrics_sum_*.csv and
+    resources_*.csv files.
+
+    Metrics and resources rows are joined on (container, iteration, RTT,
+    bandwidth, cache state) and their order of occurrence, not on their
+    position in the file. Metrics rows written before the metrics file had a
+    cache state are joined without it.
+
+    Args:
+        result_file (str): The result file.
+
+    Returns:
+        pandas.DataFrame: The runs, with the columns of run_columns.
+    """
+    match = result_file_pattern.search(os.path.basename(result_file))
+    if not match:
+        raise ValueError(f"Cannot infer the snapshotter from {result_file}")
+    df = pd.read_csv(result_file, dtype={"Time": str})
+
+    runs = pd.DataFrame({
+        "snapshotter": match.group(1),
+        "bandwidth_mbps": df["Bandwidth"].str.removesuffix("Mbps").astype(float),
+        "container": df["Container"],
+        "rtt_ms": df["RTT"].str.removesuffix("ms").astype(float),
+        "iteration": df["Iteration"].astype(int),
+    })
+    time_parts = df["Time"].fillna("").str.extract(r"^(\d+)m([\d.]+)s$").astype(float)
+    runs["seconds"] = time_parts[0] * 60 + time_parts[1]
+    # Older files mark timeouts in the Time column, and their rows are padded
+    # with an empty Status when ensure_header upgrades the file
+    status = np.where(runs["seconds"].notna(), "ok", "timeout")
+    if "Status" in df.columns:
+        status = df["Status"].replace("", np.nan).fillna(pd.Series(status, index=df.index))
+    runs["status"] = status
+    # Files written before cache states only hold cold runs
+    runs["cache_state"] = df["Cache State"].fillna("cold") if "Cache State" in df.columns else "cold"
+    runs["source"] = os.path.basename(result_file)
+    # Rows written before iteration IDs are padded with an empty one and never superseded
+    runs["iteration_id"] = df["Iteration ID"] if "Iteration ID" in df.columns else np.nan
+
+    directory, name = os.path.split(result_file)
+    metrics_file = os.path.join(directory, name.replace("provisioning_times_", "metrics_sum_", 1))
+    join_columns = ["container", "iteration", "rtt_ms", "bandwidth_mbps"]
+    if os.path.isfile(metrics_file):
+        metrics = pd.read_csv(metrics_file)
+        metrics = pd.DataFrame({
+            "container": metrics["Container"],
+            "iteration": metrics["Iteration"].astype(int),
+            "rtt_ms": metrics["RTT"].str.removesuffix("ms").astype(float),
+            "bandwidth_mbps": metrics["Bandwidth"].str.removesuffix("Mbps").astype(float),
+            # Rows written before the metrics file had the column are padded with an empty cache state
+            "match_state": metrics["Cache State"].fillna("") if "Cache State" in metrics.columns else "",
+            "metrics_sum": metrics["Metrics Sum"].astype(float),
+        })
+        # The rows without a cache state come first and are matched with the first runs by order alone,
+        # the later ones on their cache state too, as runs without metrics have no row
+        untagged = metrics[metrics["match_state"] == ""].groupby(join_columns).size().rename("untagged")
+        order = runs.groupby(join_columns).cumcount()
+        first = order < runs.join(untagged, on=join_columns)["untagged"].fillna(0)
+        runs["match_state"] = runs["cache_state"].where(~first, "")
+        runs["occurrence"] = runs.groupby(join_columns + ["match_state"]).cumcount()
+        metrics["occurrence"] = metrics.groupby(join_columns + ["match_state"]).cumcount()
+        runs = runs.merge(metrics, on=join_columns + ["match_state", "occurrence"], how="left")
+        runs = runs.drop(columns=["match_state", "occurrence"])
+    else:
+        runs["metrics_sum"] = np.nan
+
+    resources_file = os.path.join(directory, name.replace("provisioning_times_", "resources_", 1))
+    if os.path.isfile(resources_file):
+        resources = pd.read_csv(resources_file)
+        resources = pd.DataFrame({
+            "container": resources["Container"],
+            "iteration": resources["Iteration"].astype(int),
+            "rtt_ms": resources["RTT"].str.removesuffix("ms").astype(float),
+            "bandwidth_mbps": resources["Bandwidth"].str.removesuffix("Mbps").astype(float),
+            "cache_state": resources["Cache State"],
+            **{column: resources[header].astype(float) for header, column in resources_csv_columns.items()},
+        })
+        # Runs without resources, e.g. with --no-resources, have no row, so the cache state is joined too
+        join_columns = join_columns + ["cache_state"]
+        runs["occurrence"] = runs.groupby(join_columns).cumcount()
+        resources["occurrence"] = resources.groupby(join_columns).cumcount()
+        runs = runs.merge(resources, on=join_columns + ["occurrence"], how="left").drop(columns="occurrence")
+    else:
+        for column in resource_fields:
+            runs[column] = np.nan
+    return latest_attempts(runs)[run_columns]
+
+def latest_attempts(runs):
+    """
+    Drop the attempts of an iteration superseded by a retry with --resume.
+
+    Args:
+        runs (pandas.DataFrame): Runs in the order they ran, with an "iteration_id"
+            column, NaN for runs written before iteration IDs.
+
+    Returns:
+        pandas.DataFrame: The runs without the attempts followed by a later one of the
+            same iteration ID.
+    """
+    superseded = runs["iteration_id"].notna() & runs.duplicated("iteration_id", keep="last")
+    return runs[~superseded]
+
+def parse_database(path):
+    """
+    Load the runs of a results database.
+
+    Args:
+        path (str): The SQLite results database.
+
+    Returns:
+        pandas.DataFrame: The runs, with the columns of run_columns. Concurrent runs and
+            the attempts superseded by a retry are left out.
+    """
+    runs = load_frame(path, where="parallel IS NULL OR parallel = 1")
+    # Imported runs have no timestamp and stay in the order of the table
+    runs = runs.sort_values("timestamp", kind="stable", na_position="first")
+    if "iteration_id" not in runs.columns:
+        # Databases written before iteration IDs do not have the column
+        runs["iteration_id"] = np.nan
+    runs = latest_attempts(runs)
+    runs["source"] = os.path.basename(path)
+    runs["metrics_sum"] = runs["metrics_sum"].astype(float)
+    runs["cache_state"] = runs["cache_state"].fillna("cold")
+    for column in resource_fields:
+        # Databases written before resource accounting do not have the column
+        runs[column] = runs[column].astype(float) if column in runs.columns else np.nan
+    return runs[run_columns]
+
+def load_source(path, use_cache=True):
+    """
+    Load the runs of one source, reusing the cached parse if the file did not change.
+
+    Args:
+        path (str): A result CSV file or a .sqlite results database.
+        use_cache (bool): Read and write the cache in cache_dir.
+
+    Returns:
+        pandas.DataFrame: The runs of the source.
+    """
+    stat = os.stat(path)
+    # The columns are part of the key, so parses cached before a column was added are not reused
+    key = hashlib.sha1(
+        f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{parse_version}:{','.join(run_columns)}".encode()
+    ).hexdigest()
+    cache_file = os.path.join(cache_dir, f"{key}.pkl")
+    if use_cache and os.path.isfile(cache_file):
+        return pd.read_pickle(cache_file)
+
+    if path.endswith((".sqlite", ".db")):
+        runs = parse_database(path)
+    else:
+        runs = parse_result_csv(path)
+    if use_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        runs.to_pickle(cache_file)
+    return runs
+
+def load_runs(sources, use_cache=True):
+    """
+    Load several sources into one long-format frame.
+
+    Args:
+        sources (list): Result CSV files, results databases or glob patterns of them.
+        use_cache (bool): Reuse the parsed sources that did not change.
+
+    Returns:
+        pandas.DataFrame: One row per run, with the columns of run_columns.
+    """
+    paths = []
+    for source in sources:
+        paths.extend(sorted(glob.glob(source)) or [source])
+    return pd.concat([load_source(path, use_cache) for path in paths], ignore_index=True)
+
+def select_runs(runs, snapshotters=None, bandwidths=None, containers=None, cache_state="cold", completed=True):
+    """
+    Keep the completed runs of the selected snapshotters, bandwidths and containers.
+
+    Runs of different cache states are not comparable, so only one is kept.
+
+    Args:
+        runs (pandas.DataFrame): The runs returned by load_runs.
+        snapshotters (list): Snapshotters to keep, all if None.
+        bandwidths (list): Bandwidths in Mbps to keep, all if None.
+        containers (list): Containers to keep, all if None.
+        cache_state (str): The cache state to keep.
+        completed (bool): Only keep the runs that completed, not those that timed out or failed.
+
+    Returns:
+        pandas.DataFrame: The selected runs.
+    """
+    mask = runs["cache_state"] == cache_state
+    if completed:
+        mask &= runs["status"] == "ok"
+    if snapshotters:
+        mask &= runs["snapshotter"].isin(snapshotters)
+    if bandwidths:
+        mask &= runs["bandwidth_mbps"].isin([float(bw) for bw in bandwidths])
+    if containers:
+        mask &= runs["container"].isin(containers)
+    return runs[mask]
+
+def aggregate(runs, baseline="overlayfs"):
+    """
+    Aggregate the runs per cell and compute the acceleration rate against the baseline.
+
+    Args:
+        runs (pandas.DataFrame): The selected runs.
+        baseline (str): The snapshotter the acceleration rate is relative to.
+
+    Returns:
+        pandas.DataFrame: Indexed by cell_columns, with the mean time ("seconds"),
+            mean on-demand fetch count ("metrics_sum"), number of runs ("runs") and
+            "acceleration" = baseline time / time of the same cell, NaN when the
+            baseline has no run for the cell.
+    """
+    cells = runs.groupby(cell_columns).agg(
+        seconds=("seconds", "mean"),
+        metrics_sum=("metrics_sum", "mean"),
+        runs=("seconds", "size"),
+    )
+    if baseline in cells.index.unique("snapshotter"):
+        baseline_seconds = cells.xs(baseline, level="snapshotter")["seconds"].rename("baseline_seconds")
+        cells = cells.join(baseline_seconds, on=cell_columns[1:])
+    else:
+        cells["baseline_seconds"] = np.nan
+    cells["acceleration"] = cells["baseline_seconds"] / cells["seconds"]
+    return cells
+
+def resource_costs(runs, baseline="overlayfs"):
+    """
+    Aggregate the resources used by the services per cell and their cost per
+    millisecond saved against the baseline.
+
+    Args:
+        runs (pandas.DataFrame): The selected runs.
+        baseline (str): The snapshotter the time saved and the extra resources are relative to.
+
+    Returns:
+        pandas.DataFrame: Indexed by cell_columns, with the mean of every resource
+            field, the time saved over the baseline in milliseconds ("saved_ms") and
+            "<field>_per_ms_saved" = (mean - baseline mean) / saved_ms, NaN when the
+            cell is not faster than the baseline or has no resources.
+    """
+    cells = runs.groupby(cell_columns)[["seconds"] + resource_fields].mean()
+    if baseline not in cells.index.unique("snapshotter"):
+        cells["saved_ms"] = np.nan
+        for field in resource_fields:
+            cells[f"{field}_per_ms_saved"] = np.nan
+        return cells
+    baseline_cells = cells.xs(baseline, level="snapshotter").add_prefix("baseline_")
+    joined = cells.join(baseline_cells, on=cell_columns[1:])
+    saved_ms = (joined["baseline_seconds"] - joined["seconds"]) * 1000
+    cells["saved_ms"] = saved_ms
+    for field in resource_fields:
+        cells[f"{field}_per_ms_saved"] = ((joined[field] - joined[f"baseline_{field}"]) / saved_ms).where(saved_ms > 0)
+    return cells
+
+def figure_path(out, bw, bandwidths):
+    """
+    Name the figure of a bandwidth.
+
+    Args:
+        out (str): Output image file.
+        bw (float): The bandwidth of the figure in Mbps.
+        bandwidths (list): All bandwidths plotted.
+
+    Returns:
+        str: out, with the bandwidth added before the extension when there are several.
+    """
+    if len(bandwidths) > 1:
+        root, ext = os.path.splitext(out)
+        return f"{root}_{bw:g}Mbps{ext}"
+    return out
+
+def snapshotter_style(snapshotter, index):
+    """
+    Get the plot style of a snapshotter.
+
+    Args:
+        snapshotter (str): The snapshotter.
+        index (int): Position of the snapshotter in the plot, to pick a default color.
+
+    Returns:
+        dict: The color, marker and label.
+    """
+    default = {"color": f"C{index}", "marker": "o", "label": snapshotter}
+    return snapshotter_styles.get(snapshotter, default)
+
+def ordered_snapshotters(snapshotters, baseline="overlayfs"):
+    """
+    Order snapshotters for the plots: the baseline first, then the known snapshotters in their usual order.
+
+    Args:
+        snapshotters (list): The snapshotters to plot.
+        baseline (str): The baseline snapshotter.
+
+    Returns:
+        list: The ordered snapshotters.
+    """
+    known = list(snapshotter_styles)
+    return sorted(
+        snapshotters,
+        key=lambda snapshotter: (snapshotter != baseline,
+                                 known.index(snapshotter) if snapshotter in known else len(known), snapshotter),
+    )
+
+def plot_cells(cells, runs, out, baseline="overlayfs", errors=None, show=True):
+    """
+    Plot the provisioning time, on-demand fetch count and acceleration rate of
+    every container against the RTT, one figure per bandwidth.
+
+    Args:
+        cells (pandas.DataFrame): The aggregated cells returned by aggregate.
+        runs (pandas.DataFrame): The selected runs, used for the axis limits.
+        out (str): Output image file; with several bandwidths, the bandwidth is
+            added before the extension.
+        baseline (str): The snapshotter the acceleration rate is relative to.
+        errors (dict): Column name to a (lower, upper) pair of Series aligned with
+            cells, drawn as error bars, optional.
+        show (bool): Display the figures.
+    """
+    plt.rcParams['axes.labelsize'] = 16  # Font size for x and y labels
+    plt.rcParams['axes.titlesize'] = 16  # Font size for title
+    plt.rcParams['xtick.labelsize'] = 16 # Font size for x-tick labels
+    plt.rcParams['ytick.labelsize'] = 15 # Font size for y-tick labels
+    errors = errors or {}
+
+    snapshotters = ordered_snapshotters(cells.index.unique("snapshotter"), baseline)
+    compared = [snapshotter for snapshotter in snapshotters if snapshotter != baseline]
+    bandwidths = list(cells.index.unique("bandwidth_mbps"))
+    for bw in bandwidths:
+        bw_cells = cells.xs(bw, level="bandwidth_mbps")
+        bw_runs = runs[runs["bandwidth_mbps"] == bw]
+        containers = list(bw_cells.index.unique("container"))
+        fig, axs = plt.subplots(3, len(containers), figsize=(len(containers) * 4, 10), squeeze=False)
+
+        max_provisioning_time = bw_runs["seconds"].max() * 1.1
+        max_metrics_sum = bw_cells["metrics_sum"].max() * 1.1
+        ymax_rate = bw_cells.drop(baseline, level="snapshotter", errors="ignore")["acceleration"].max() * 1.1
+        width = 34 / max(len(compared), 1)
+
+        for i, container in enumerate(containers):
+            for k, snapshotter in enumerate(snapshotters):
+                if (snapshotter, container) not in bw_cells.index.droplevel("rtt_ms"):
+                    continue
+                data = bw_cells.loc[(snapshotter, container)]
+                style = snapshotter_style(snapshotter, k)
+
+                def error_bars(column):
+                    if column not in errors:
+                        return None
+                    lower, upper = (bound.xs(bw, level="bandwidth_mbps").loc[(snapshotter, container)]
+                                    for bound in errors[column])
+                    return np.vstack([data[column] - lower, upper - data[column]]).clip(min=0)
+
+                axs[0, i].errorbar(data.index, data["seconds"], yerr=error_bars("seconds"),
+                                   color=style["color"], marker=style["marker"], label=style["label"],
+                                   markeredgecolor='white', markeredgewidth=1, capsize=3)
+                if data["metrics_sum"].notna().any():
+                    axs[1, i].plot(data.index, data["metrics_sum"], color=style["color"],
+                                   marker=style["marker"], label=style["label"],
+                                   markeredgecolor='white', markeredgewidth=1)
+                if snapshotter != baseline:
+                    offset = (compared.index(snapshotter) - len(compared) / 2) * width
+                    axs[2, i].bar(data.index + offset, data["acceleration"], yerr=error_bars("acceleration"),
+                                  color=style["color"], width=width, align='edge', capsize=2)
+
+            axs[0, i].set_yscale('log')  # Set y-axis to logarithmic scale
+            axs[1, i].set_yscale('log')
+
+            axs[0, i].set_title(container)
+            axs[0, i].set_xlabel('RTT (ms)')
+            axs[0, i].set_ylabel('Provisioning Time (s)')
+
+            axs[1, i].set_xlabel('RTT (ms)')
+            axs[1, i].set_ylabel('On-demand Fetch')
+
+            axs[2, i].set_xlabel('RTT (ms)')
+            axs[2, i].set_ylabel('Acceleration Rate')
+
+            axs[0, i].set_ylim([1, max_provisioning_time])
+            if max_metrics_sum > 1:
+                axs[1, i].set_ylim([1, max_metrics_sum])
+            if ymax_rate > 0:
+                axs[2, i].set_ylim([0, ymax_rate])
+
+        legend_elements = [
+            Patch(facecolor=snapshotter_style(snapshotter, k)["color"], edgecolor='r',
+                  label=snapshotter_style(snapshotter, k)["label"])
+            for k, snapshotter in enumerate(snapshotters)
+        ]
+
+        # Align the y labels of each column whatever the width of their tick labels
+        fig.align_ylabels(axs)
+        # Place the legend higher position
+        fig.legend(handles=legend_elements, loc='lower center', ncol=len(legend_elements),
+                   bbox_to_anchor=(0.5, 0.06), fontsize=16)
+
+        # Adjust the layout to fit the legend and add space between subplots
+        plt.subplots_adjust(bottom=0.2, hspace=0.5, wspace=0.4)
+
+        path = figure_path(out, bw, bandwidths)
+        plt.savefig(path, format=os.path.splitext(path)[1][1:] or 'png', bbox_inches='tight')
+        print(f"Saved {path}")
+
+    if show:
+        plt.show()
+
+def plot_costs(costs, out, baseline="overlayfs", show=True):
+    """
+    Plot the CPU time and peak memory of the services and the CPU time spent
+    per millisecond saved of every container against the RTT, one figure per
+    bandwidth.
+
+    Args:
+        costs (pandas.DataFrame): The cells returned by resource_costs.
+        out (str): Output image file; with several bandwidths, the bandwidth is
+            added before the extension.
+        baseline (str): The snapshotter the time saved is relative to.
+        show (bool): Display the figures.
+    """
+    snapshotters = ordered_snapshotters(costs.index.unique("snapshotter"), baseline)
+    compared = [snapshotter for snapshotter in snapshotters if snapshotter != baseline]
+    bandwidths = list(costs.index.unique("bandwidth_mbps"))
+    width = 34 / max(len(compared), 1)
+    for bw in bandwidths:
+        bw_costs = costs.xs(bw, level="bandwidth_mbps")
+        containers = list(bw_costs.index.unique("container"))
+        fig, axs = plt.subplots(3, len(containers), figsize=(len(containers) * 4, 10), squeeze=False)
+        for i, container in enumerate(containers):
+            for k, snapshotter in enumerate(snapshotters):
+                if (snapshotter, container) not in bw_costs.index.droplevel("rtt_ms"):
+                    continue
+                data = bw_costs.loc[(snapshotter, container)]
+                style = snapshotter_style(snapshotter, k)
+                axs[0, i].plot(data.index, data["cpu_seconds"], color=style["color"], marker=style["marker"],
+                               markeredgecolor='white', markeredgewidth=1)
+                axs[1, i].plot(data.index, data["peak_rss_bytes"] / 2**20, color=style["color"],
+                               marker=style["marker"], markeredgecolor='white', markeredgewidth=1)
+                if snapshotter != baseline:
+                    offset = (compared.index(snapshotter) - len(compared) / 2) * width
+                    # CPU milliseconds per millisecond saved
+                    axs[2, i].bar(data.index + offset, data["cpu_seconds_per_ms_saved"] * 1000,
+                                  color=style["color"], width=width, align='edge')
+
+            axs[0, i].set_title(container)
+            for row, label in enumerate(['CPU Time (s)', 'Peak RSS (MiB)', 'CPU ms per ms Saved']):
+                axs[row, i].set_xlabel('RTT (ms)')
+                axs[row, i].set_ylabel(label)
+            axs[2, i].axhline(0, color='black', linewidth=0.8)
+
+        legend_elements = [
+            Patch(facecolor=snapshotter_style(snapshotter, k)["color"], edgecolor='r',
+                  label=snapshotter_style(snapshotter, k)["label"])
+            for k, snapshotter in enumerate(snapshotters)
+        ]
+        fig.align_ylabels(axs)
+        fig.legend(handles=legend_elements, loc='lower center', ncol=len(legend_elements),
+                   bbox_to_anchor=(0.5, 0.06), fontsize=16)
+        plt.subplots_adjust(bottom=0.2, hspace=0.5, wspace=0.4)
+
+        path = figure_path(out, bw, bandwidths)
+        plt.savefig(path, format=os.path.splitext(path)[1][1:] or 'png', bbox_inches='tight')
+        print(f"Saved {path}")
+
+    if show:
+        plt.show()
+
+def build_parser(description):
+    """
+    Build the command line parser shared by the analysis scripts.
+
+    Args:
+        description (str): Description of the script.
+
+    Returns:
+        argparse.ArgumentParser: Parser of the sources and cell selection options.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('sources', nargs='+',
+                        help="provisioning_times_*.csv files, results databases or glob patterns of them.")
+    parser.add_argument('--snapshotters', nargs='+', help="Snapshotters to compare (default: all).")
+    parser.add_argument('--bandwidths', nargs='+', type=float, help="Bandwidths in Mbps to keep (default: all).")
+    parser.add_argument('--containers', nargs='+', help="Containers to keep (default: all).")
+    parser.add_argument('--baseline', type=str, default="overlayfs",
+                        help="Snapshotter the acceleration rate is relative to.")
+    parser.add_argument('--cache-state', type=str, default="cold",
+                        help="Cache state of the runs to compare: cold, base, images, pagecache or warm.")
+    parser.add_argument('--no-cache', action='store_true', help=f"Reparse every source instead of using {cache_dir}.")
+    return parser
+
+if __name__ == "__main__":
+    parser = build_parser("Compare snapshotters across any number of sweeps.")
+    parser.add_argument('--out', type=str, default="Fleet.png", help="Output figure.")
+    parser.add_argument('--cost-out', type=str, default="Cost.png",
+                        help="Output figure of the resources used by the services and their cost per ms saved.")
+    parser.add_argument('--no-show', action='store_true', help="Only save the figures.")
+    args = parser.parse_args()
+
+    runs = select_runs(load_runs(args.sources, use_cache=not args.no_cache),
+                       args.snapshotters, args.bandwidths, args.containers, args.cache_state)
+    cells = aggregate(runs, args.baseline)
+    print(cells.to_string())
+    costs = resource_costs(runs, args.baseline)
+    if costs["cpu_seconds"].notna().any():
+        print(costs[["saved_ms"] + [f"{field}_per_ms_saved" for field in resource_fields]].to_string())
+        plot_costs(costs, args.cost_out, baseline=args.baseline, show=False)
+    plot_cells(cells, runs, args.out, baseline=args.baseline, show=not args.no_show)
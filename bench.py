@@ -1,10 +1,27 @@
 import os
+import re
 import time
 import csv
-import re
+import json
 import requests
 import subprocess
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from phases import phase_names, split_phases
+from probes import wait_until, unit_state, unix_socket_ready, http_ready
+from journal import journal_file_template, cell_key, append_entry, load_journal
+from convergence import confidence_interval, relative_width, converged
+from metrics import MetricsCollector, delta, select, merge_buckets, histogram_quantile
+from sampler import MetricsSampler
+from resources import ResourceMonitor, resource_fields
+from planner import plan_sweep, load_history, DurationModel, estimate_plan, print_plan, SweepClock
+from readiness import ReadinessEngine, parse_probe, probe_name, free_port
+from patterns import ready_patterns
+from results_store import ResultsStore, results_db, new_run_id, phase_columns
+from netproxy import ShapingProxy, probe_link
+from registry_trace import RegistryTracer, access_profile, write_trace
 
 # Global variables
 latency_set = [0, 50, 100, 150, 200, 250, 300, 350, 400]
@@ -21,16 +38,12 @@ containers_extend = [
 ]
 # List of container images to be tested
 
-ready_messages = {
-    "httpd": "Apache/2.4.57 (Unix) configured -- resuming normal operations",
-    "tensorflow": "Skipped non-installed server(s)",
-    "nginx": "start worker process",
-    "tomcat": "org.apache.catalina.startup.Catalina.start Server startup",
-    "redis": "Ready to accept connections",
-    "rabbitmq": "Server startup complete; 3 plugins started.",
-    "wordpress": "Complete! WordPress has been successfully copied to /var/www/html",
-}
-# Dictionary mapping container names to their ready messages
+ready_probes = {}
+# Dictionary mapping container names to active readiness probes, "tcp:PORT" or "http:PORT/PATH"
+# on a container port, e.g. {"redis": ["tcp:6379"]}; the port is published on a free host port
+
+output_log_template = "container_output_{snapshotter}_fleetbench.log"
+# Template for the log file the output of the containers is teed to, with timestamps
 
 result_file_template = "provisioning_times_{snapshotter}_fleetbench.csv"
 # Template for the result file name
@@ -38,27 +51,256 @@ result_file_template = "provisioning_times_{snapshotter}_fleetbench.csv"
 metrics_file_template = "metrics_sum_{snapshotter}_fleetbench.csv"
 # Template for the metrics file name
 
+parallel_file_template = "parallel_times_{snapshotter}_fleetbench.csv"
+# Template for the per-container result file name in concurrent mode
+
+parallel_summary_file_template = "parallel_summary_{snapshotter}_fleetbench.csv"
+# Template for the per-batch throughput and tail latency file name in concurrent mode
+
+nerdctl_bin = os.environ.get("NERDCTL", "nerdctl")
+# nerdctl binary to invoke, can point to fake_nerdctl.py for testing without containerd
+
+registry = "158.132.255.111:5000"
+# Registry the benchmarked images are pulled from
+
+run_timeout = 900
+# Timeout in seconds for a container to become ready or exit
+
+result_header = ["Container", "Iteration", "Time", "RTT", "Bandwidth"] + phase_names + ["Reset", "Status",
+                                                                                    "Ready Signal", "Cache State",
+                                                                                    "Iteration ID"]
+# Columns of the result file, the phase and reset durations are in seconds. The attempts of an
+# iteration retried with --resume share their Iteration ID, and the last one supersedes the others
+
+parallel_header = [
+    "Batch", "Slot", "Container", "Iteration", "Time", "RTT", "Bandwidth", "Parallel", "Mode",
+] + phase_names + ["Status", "Ready Signal", "Cache State"]
+# Columns of the per-container result file in concurrent mode
+
+parallel_summary_header = [
+    "Batch", "Iteration", "Parallel", "Mode", "Ready", "Wall Time", "Throughput",
+    "P50", "P95", "P99", "Max", "Metrics Sum", "RTT", "Bandwidth", "Reset", "Cache State",
+]
+# Columns of the per-batch summary file in concurrent mode
+
+convergence_file_template = "convergence_{snapshotter}_fleetbench.csv"
+# Template for the per-cell confidence interval file name in adaptive mode
+
+convergence_header = [
+    "Container", "RTT", "Bandwidth", "Iterations", "Samples", "Mean",
+    "CI Low", "CI High", "Relative Width", "Converged", "Cache State",
+]
+# Columns of the confidence interval file, the mean and bounds are in seconds
+
+target_width = 0.05
+# Target relative half-width of the 95% confidence interval in adaptive mode
+
+min_iterations = 3
+# Minimum number of iterations per cell in adaptive mode
+
+max_iterations = 15
+# Maximum number of iterations per cell in adaptive mode
+
+reset_timeout = 30
+# Maximum time in seconds to wait for each readiness check during a reset
+
+snapshotter_sockets = {
+    "overlayfs": "/run/containerd/containerd.sock",
+    "stargz": "/run/containerd-stargz-grpc/containerd-stargz-grpc.sock",
+    "fleet": "/run/containerd-fleet-grpc/containerd-fleet-grpc.sock",
+}
+# gRPC socket that must accept connections after restarting each snapshotter's service
+
+metrics_endpoints = {
+    "stargz": "http://127.0.0.1:8234/metrics",
+    "fleet": "http://127.0.0.1:8334/metrics",
+}
+# Metrics endpoint of each remote snapshotter
+
+cache_states = ["cold", "base", "images", "pagecache", "warm"]
+# Cache states a run can start from, coldest first: "cold" removes the images, snapshots and
+# snapshotter caches; "base" is cold with the related image of shared_bases pulled first;
+# "images" keeps the pulled images but removes their snapshots, the snapshotter caches and the
+# page cache; "pagecache" only drops the page cache; "warm" only removes the previous container
+
+cache_state_set = ["cold"]
+# List of cache states to be tested
+
+shared_bases = {
+    "ghost": "node",
+    "tensorflow": "ubuntu",
+    "pytorch": "ubuntu",
+}
+# Dictionary mapping container names to a related image sharing its base layers, pulled first
+# in the "base" cache state
+
+snapshotter_caches = {
+    "stargz": ["/var/lib/containerd-stargz-grpc/stargz/httpcache", "/var/lib/containerd-stargz-grpc/stargz/fscache"],
+    "fleet": ["/var/lib/containerd-fleet-grpc/fleet/httpcache", "/var/lib/containerd-fleet-grpc/fleet/fscache"],
+}
+# Local chunk caches of each remote snapshotter, dropped in the "images" cache state
+
+ctr_bin = "ctr"
+# ctr binary used to remove snapshots while keeping the images
+
+containerd_namespace = "default"
+# containerd namespace nerdctl runs the containers in
+
 iterations = 5
 # Number of iterations to run for each container
 
-delay = 2
-# Delay in seconds between certain operations
-
 rtt = "0ms"
 # Default round-trip time (RTT) for network conditions
 
 Bandwidth = "0Mbps"
 # Default bandwidth for network conditions
 
-metrics_pattern_estargz = re.compile(
-    r'stargz_fs_operation_count{.*operation_type="on_demand_remote_registry_fetch_count"} (\d+)'
-)
-# Regex pattern to extract estargz metrics
+metrics_prefixes = {
+    "stargz": "stargz",
+    "fleet": "fleet",
+}
+# Prefix of the metric families exposed by each remote snapshotter
+
+fetch_count_operation = "on_demand_remote_registry_fetch_count"
+# operation_type of the {prefix}_fs_operation_count series summed into Metrics Sum
+
+fetch_latency_operation = "remote_registry_get"
+# operation_type of the {prefix}_fs_operation_duration_milliseconds histogram used for fetch latency
+
+metrics_header = [
+    "Container", "Iteration", "Metrics Sum", "RTT", "Bandwidth", "Fetch P50", "Fetch P95", "Fetch P99",
+    "Cache State",
+]
+# Columns of the metrics file, the fetch latency percentiles are in milliseconds
+
+metrics_detail_file_template = "metrics_detail_{snapshotter}_fleetbench.jsonl"
+# Template for the file holding the per-run delta of every metric family
+
+sample_interval = 0
+# Interval in seconds of the background metrics sampler running alongside each container, 0 disables it
+
+sample_interval_range = (50, 200)
+# Allowed --sample-interval in milliseconds, shorter polls make the sampler overhead dominate the run
+
+sample_proc = False
+# Also sample host-wide /proc counters (network bytes received, busy CPU time)
+
+sampled_operations = [fetch_count_operation, "on_demand_bytes_fetched"]
+# operation_type of the {prefix}_fs_operation_count series recorded by the sampler
+
+samples_dir_template = "samples_{snapshotter}_fleetbench"
+# Template for the directory holding one metrics time series per run
+
+samples_index_header = [
+    "Container", "Iteration", "RTT", "Bandwidth", "File", "Polls", "Errors",
+    "Mean Poll", "Max Poll", "CPU Time", "Duty Cycle",
+]
+# Columns of the index of the time series, with the sampler overhead in seconds
+
+resource_services = {
+    "overlayfs": ["containerd"],
+    "stargz": ["containerd", "stargz-snapshotter"],
+    "fleet": ["containerd", "fleet-snapshotter"],
+}
+# Services whose resources are accounted during every run: systemd units, or process names when no such unit runs
+
+account_resources = True
+# Account the CPU, memory, disk, network and context switches of resource_services during every run
+
+resources_file_template = "resources_{snapshotter}_fleetbench.csv"
+# Template for the file holding the resources used by every run
+
+resources_header = [
+    "Container", "Iteration", "RTT", "Bandwidth", "Cache State", "CPU Seconds", "Peak RSS", "Disk Read",
+    "Disk Write", "Network", "Context Switches", "Monitor Polls", "Monitor CPU", "Monitor Duty Cycle",
+]
+# Columns of the resources file, the memory, disk and network columns are in bytes and the
+# monitor CPU in seconds
 
-metrics_pattern_fleet = re.compile(
-    r'fleet_fs_operation_count{.*operation_type="on_demand_remote_registry_fetch_count"} (\d+)'
-)
-# Regex pattern to extract fleet metrics
+store = None
+# Results store every run is written to, opened by main
+
+collectors = {}
+# Metrics collector of each snapshotter, reused across runs to keep the HTTP connection
+
+output_logs = {}
+# Container output log file of each snapshotter, opened on first use
+
+primed = None
+# (snapshotter, containers) whose images and caches the last priming runs left on the node
+
+shaping = "ssh"
+# How the network conditions of a cell are applied: "ssh" runs nw.sh on the registry
+# server, "proxy" pulls through a local shaping proxy, "none" leaves the network as is
+
+proxy_listen = "127.0.0.1:5001"
+# Address of the shaping proxy in proxy mode
+
+ssh_password = os.environ.get("SSHPASS", "gh")
+# Password of the registry server in ssh mode, passed to sshpass through its environment
+
+probe_network = True
+# Measure the RTT and throughput actually achieved at the start of every cell
+
+network_file_template = "network_{snapshotter}_fleetbench.csv"
+# File name template for the network conditions measured in every cell
+
+network_header = ["RTT", "Bandwidth", "Shaping", "Measured RTT", "Measured Bandwidth"]
+# Header of the network file; the measured RTT is in ms and the bandwidth in Mbps
+
+proxy = None
+# Shaping proxy the images are pulled through in proxy mode, started by main
+
+link = {"rtt": None, "bandwidth": None}
+# RTT and bandwidth measured at the start of the current cell
+
+trace_registry = False
+# Trace the registry requests of every run through the proxy, which passes the
+# traffic through unshaped unless shaping is "proxy"
+
+traces_dir_template = "traces_{snapshotter}_fleetbench"
+# Template for the directory holding one registry trace per run
+
+access_profile_file_template = "access_profile_{snapshotter}_fleetbench.csv"
+# File name template for the registry access profile of every run
+
+access_profile_header = [
+    "Container", "Iteration", "RTT", "Bandwidth", "File", "Requests", "Manifests", "Blobs", "Ranges",
+    "Bytes", "Unique Bytes", "Image Bytes", "Fetched Fraction", "Size P50", "Size P95", "Max In Flight",
+    "Duration", "Cache State",
+]
+# Columns of the access profile file; sizes are in bytes and the duration in seconds
+
+tracer = None
+# Registry tracer fed by the proxy, created by main when tracing
+
+def ensure_header(path, header):
+    """
+    Create a CSV file with the given header, or upgrade the header of an existing
+    file written by an older version, padding its rows for the new columns.
+
+    Args:
+        path (str): The CSV file.
+        header (list): The expected column names.
+    """
+    if not os.path.isfile(path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+        return
+
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    if not rows or rows[0] == header:
+        return
+    if rows[0] != header[:len(rows[0])]:
+        raise ValueError(f"{path} has unexpected columns {rows[0]}, expected {header}")
+    print(f"Upgrading {path} with columns {header[len(rows[0]):]}")
+    padding = [""] * (len(header) - len(rows[0]))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(row + padding for row in rows[1:])
 
 def create_results_files(snapshotter):
     """
@@ -69,136 +311,469 @@ def create_results_files(snapshotter):
     """
     result_file = result_file_template.format(snapshotter=snapshotter)
     metrics_file = metrics_file_template.format(snapshotter=snapshotter)
+    resources_file = resources_file_template.format(snapshotter=snapshotter)
 
-    if not os.path.isfile(result_file):
-        with open(result_file, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Container", "Iteration", "Time", "RTT", "Bandwidth"])
+    ensure_header(result_file, result_header)
+    ensure_header(metrics_file, metrics_header)
+    ensure_header(resources_file, resources_header)
 
-    if not os.path.isfile(metrics_file):
-        with open(metrics_file, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(
-                ["Container", "Iteration", "Metrics Sum", "RTT", "Bandwidth"]
-            )
+def create_parallel_files(snapshotter):
+    """
+    Create the concurrent mode result files if they don't exist.
+
+    Args:
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+    """
+    parallel_file = parallel_file_template.format(snapshotter=snapshotter)
+    summary_file = parallel_summary_file_template.format(snapshotter=snapshotter)
+
+    ensure_header(parallel_file, parallel_header)
+    ensure_header(summary_file, parallel_summary_header)
+
+def wait_for(description, check, timeout=reset_timeout):
+    """
+    Wait for a readiness check during a reset.
+
+    Args:
+        description (str): What is being waited for, used in messages.
+        check (callable): Function returning True once ready.
+        timeout (float): Maximum time to wait in seconds.
 
-def reset_snapshotter(snapshotter, delay=delay):
+    Raises:
+        RuntimeError: If the check did not pass within the timeout.
+    """
+    start_time = time.perf_counter()
+    if not wait_until(check, timeout):
+        raise RuntimeError(f"Timed out after {timeout}s waiting for {description}")
+    print(f"{description} after {time.perf_counter() - start_time:.3f}s")
+
+def restart_service(unit, socket_path, metrics_url=None, timeout=reset_timeout):
+    """
+    Restart a systemd service and wait until it is usable.
+
+    Args:
+        unit (str): The systemd unit to restart.
+        socket_path (str): The gRPC socket that must accept connections.
+        metrics_url (str): The metrics endpoint that must answer, optional.
+        timeout (float): Maximum time to wait for each check in seconds.
+    """
+    subprocess.run(["sudo", "systemctl", "restart", unit], check=True)
+    wait_for(f"{unit} active", lambda: unit_state(unit) == "active", timeout)
+    wait_for(f"{socket_path} accepting connections", lambda: unix_socket_ready(socket_path), timeout)
+    if metrics_url:
+        wait_for(f"{metrics_url} answering", lambda: http_ready(metrics_url), timeout)
+
+def remove_snapshots(snapshotter):
+    """
+    Remove every snapshot of a snapshotter through containerd, children first,
+    keeping the images in the content store.
+
+    Args:
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+    """
+    command = ["sudo", ctr_bin, "-n", containerd_namespace, "snapshots", "--snapshotter", snapshotter]
+    while True:
+        listing = subprocess.run(command + ["ls"], capture_output=True, text=True, check=True).stdout
+        # KEY PARENT KIND, the parent is empty for the bottom layer
+        snapshots = [line.split() for line in listing.splitlines()[1:] if line.strip()]
+        parents = {fields[1] for fields in snapshots if len(fields) == 3}
+        leaves = [fields[0] for fields in snapshots if fields[0] not in parents]
+        if not leaves:
+            break
+        subprocess.run(command + ["rm"] + leaves, capture_output=True, text=True, check=True)
+
+def drop_page_cache():
+    """Write back dirty pages and drop the page cache, dentries and inodes."""
+    subprocess.run("sync && echo 3 | sudo tee /proc/sys/vm/drop_caches", shell=True, capture_output=True,
+                   text=True, check=True)
+
+def reset_snapshotter(snapshotter, timeout=reset_timeout, level="cold"):
     """
     Reset the snapshotter by stopping all containers, pruning images,
     and restarting the snapshotter service.
     
+    Instead of fixed sleeps, every restart is followed by readiness checks on
+    the systemd unit state, the gRPC socket and the metrics endpoint. Lower
+    levels keep part of the state: "images" keeps the pulled images but removes
+    their snapshots and the snapshotter caches, "pagecache" only drops the page
+    cache and "warm" only removes the containers.
+
     Args:
         snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
-        delay (int): Delay in seconds between operations.
+        timeout (float): Maximum time to wait for each readiness check in seconds.
+        level (str): cold, images, pagecache or warm.
+
+    Returns:
+        float: The time taken by the reset in seconds.
+
+    Raises:
+        RuntimeError: If a service did not become ready within the timeout.
     """
-    print(f"Resetting {snapshotter} snapshotter...")
-    time.sleep(delay)
+    print(f"Resetting {snapshotter} snapshotter ({level})...")
+    start_time = time.perf_counter()
     # Stop all containers
-    subprocess.run("nerdctl stop $(nerdctl ps -q)", shell=True)
-    time.sleep(1)
-    subprocess.run("nerdctl rm $(nerdctl ps -a -q)", shell=True)
-    time.sleep(1)
-    subprocess.run(["nerdctl", "image", "prune", "-af"], check=True)
-    time.sleep(1)
-
-    if snapshotter in ["stargz", "fleet"]:
-        subprocess.run(["sudo", "systemctl", "restart", f"{snapshotter}-snapshotter"], check=True)
-        time.sleep(1)
-        subprocess.run(["sudo", "systemctl", "stop", f"{snapshotter}-snapshotter"], check=True)
-        time.sleep(1)
-        subprocess.run(
-            f"sudo rm -rf /var/lib/containerd-{snapshotter}-grpc/*",
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        time.sleep(1)
-        subprocess.run(["sudo", "systemctl", "restart", f"{snapshotter}-snapshotter"], check=True)
-
-    elif snapshotter == "overlayfs":
-        subprocess.run(
-            "sudo rm -rf /var/lib/containerd/io.containerd.snapshotter.v1.overlayfs/*",
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        time.sleep(1)
-        subprocess.run(["sudo", "systemctl", "restart", "containerd"], check=True)
+    subprocess.run(f"{nerdctl_bin} stop $({nerdctl_bin} ps -q)", shell=True)
+    subprocess.run(f"{nerdctl_bin} rm $({nerdctl_bin} ps -a -q)", shell=True)
+
+    if level == "cold":
+        subprocess.run([nerdctl_bin, "image", "prune", "-af"], check=True)
+        if snapshotter in ["stargz", "fleet"]:
+            unit = f"{snapshotter}-snapshotter"
+            socket_path = snapshotter_sockets[snapshotter]
+            restart_service(unit, socket_path, timeout=timeout)
+            subprocess.run(["sudo", "systemctl", "stop", unit], check=True)
+            wait_for(f"{unit} stopped", lambda: unit_state(unit) in ["inactive", "failed"], timeout)
+            subprocess.run(
+                f"sudo rm -rf /var/lib/containerd-{snapshotter}-grpc/*",
+                shell=True,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            restart_service(unit, socket_path, metrics_endpoints[snapshotter], timeout)
+
+        elif snapshotter == "overlayfs":
+            subprocess.run(
+                "sudo rm -rf /var/lib/containerd/io.containerd.snapshotter.v1.overlayfs/*",
+                shell=True,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            restart_service("containerd", snapshotter_sockets["overlayfs"], timeout=timeout)
+
+    elif level == "images":
+        remove_snapshots(snapshotter)
+        if snapshotter in snapshotter_caches:
+            unit = f"{snapshotter}-snapshotter"
+            subprocess.run(["sudo", "systemctl", "stop", unit], check=True)
+            wait_for(f"{unit} stopped", lambda: unit_state(unit) in ["inactive", "failed"], timeout)
+            subprocess.run(["sudo", "rm", "-rf"] + snapshotter_caches[snapshotter], check=True)
+            restart_service(unit, snapshotter_sockets[snapshotter], metrics_endpoints[snapshotter], timeout)
+        drop_page_cache()
+
+    elif level == "pagecache":
+        drop_page_cache()
+
+    reset_time = time.perf_counter() - start_time
+    print(f"Reset complete in {reset_time:.3f}s.")
+    return reset_time
+
+def pull_image(container, snapshotter):
+    """
+    Pull and unpack an image without running it.
+
+    Args:
+        container (str): The container image to pull.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+
+    Returns:
+        float: The time taken by the pull in seconds.
+    """
+    start_time = time.perf_counter()
+    subprocess.run(
+        [nerdctl_bin, "pull", "--insecure-registry", f"--snapshotter={snapshotter}",
+         f"{pull_registry()}/{container}:{snapshotter[:3]}"],
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start_time
 
-    time.sleep(1)
-    print("Reset complete.")
+def prepare_cache(containers, snapshotter, state="cold"):
+    """
+    Reset the node to a cache state before a run.
+
+    The warmer states need the images to have been run on the node. The first
+    time a set of containers is run in one of them, the node is reset cold and
+    every container is run once, unrecorded, before the reset at the state's
+    level; the following runs of the same containers start from the state
+    their previous run left.
+
+    Args:
+        containers (list): The container images about to be run.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        state (str): One of cache_states.
+
+    Returns:
+        tuple: The time taken by the reset in seconds and the base images pulled.
+
+    Raises:
+        RuntimeError: If a service did not become ready or a priming run failed.
+    """
+    global primed
+    containers = list(dict.fromkeys(containers))
+    if state in ["cold", "base"]:
+        primed = None
+        reset_time = reset_snapshotter(snapshotter)
+        bases = []
+        if state == "base":
+            bases = list(dict.fromkeys(shared_bases[container] for container in containers
+                                       if container in shared_bases))
+            for base in bases:
+                print(f"Pulled the shared base {base} in {pull_image(base, snapshotter):.3f}s.")
+        return reset_time, bases
+
+    if primed != (snapshotter, tuple(containers)):
+        reset_snapshotter(snapshotter)
+        for container in containers:
+            print(f"Priming the caches with an unrecorded run of {container}")
+            result = run_container(container, snapshotter)
+            if result["status"] != "ok":
+                raise RuntimeError(f"Priming run of {container} ended with status {result['status']}")
+        primed = (snapshotter, tuple(containers))
+    return reset_snapshotter(snapshotter, level=state), []
+
+def format_time(elapsed_time):
+    """
+    Format a duration the way it is stored in the result files.
+
+    Args:
+        elapsed_time (float): The duration in seconds.
+
+    Returns:
+        str: The duration formatted as "<minutes>m<seconds>s".
+    """
+    minutes, seconds = divmod(elapsed_time, 60)
+    return f"{int(minutes)}m{seconds:.3f}s"
 
-def run_container(container, snapshotter, delay=delay):
+def get_output_log(snapshotter):
+    """
+    Get the container output log of a snapshotter, opening it on first use.
+
+    Args:
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+
+    Returns:
+        file: The log file, opened for appending.
+    """
+    if snapshotter not in output_logs:
+        output_logs[snapshotter] = open(output_log_template.format(snapshotter=snapshotter), "a")
+    return output_logs[snapshotter]
+
+def run_container(container, snapshotter, sampler=None, monitor=None):
     """
     Run the specified container using the specified snapshotter and measure the time taken.
     
+    Readiness is decided by a ReadinessEngine: the first of the container's
+    ready_patterns and ready_probes to fire, or a successful exit for
+    containers without any. The output is teed to the container output log
+    instead of the terminal. A watchdog kills the container if it is neither
+    ready nor exited after run_timeout seconds, so a hung container cannot
+    stall the sweep.
+
     Args:
         container (str): The container image to run.
         snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
-        delay (int): Delay in seconds between operations.
+        sampler (MetricsSampler): Background sampler running for the whole run, optional.
+        monitor (ResourceMonitor): Resource monitor of the services running for the whole run, optional.
     
     Returns:
-        str: The formatted time taken to run the container.
+        dict: The status of the run ("status": ok, timeout or failed), the
+            formatted time taken to run the container ("time", empty unless ok),
+            the same duration in seconds ("seconds", None unless ok) and the
+            duration of every phase of the run ("phases"), the readiness signal
+            that fired ("signal": "log:K" for the K-th ready pattern, a probe
+            name or "exit", None unless ok), plus the sampler overhead
+            ("sampler") when a sampler was given and the resources used by the
+            services ("resources") when a monitor was given.
     """
-    formatted_time = "90s (timeout) init"
+    formatted_time = ""
+    status = "failed"
     print(f"Running container {container}...")
     image = f"{container}:{snapshotter[:3]}"
+    probes = [parse_probe(spec) for spec in ready_probes.get(container, [])]
+    ports = {port: free_port() for _, port, _ in probes}
 
     command = [
-        "nerdctl",
+        nerdctl_bin,
         "run",
         "--rm",
         "--insecure-registry",
         f"--snapshotter={snapshotter}",
-        f"158.132.255.111:5000/{image}",
     ]
+    for port, host_port in ports.items():
+        command += ["-p", f"127.0.0.1:{host_port}:{port}"]
+    command.append(f"{pull_registry()}/{image}")
 
+    engine = ReadinessEngine(ready_patterns.get(container, []), probes, ports,
+                             log=get_output_log(snapshotter), label=container)
+    if engine.long_running:
+        signals = ready_patterns.get(container, []) + [probe_name(probe) for probe in probes]
+        print(f"Long-term container. Waiting for the first of: {', '.join(signals)}")
+    else:
+        print("Short-term container.")
+
+    if monitor:
+        monitor.start()
+    if sampler:
+        sampler.start()
     start_time = time.perf_counter()
     process = subprocess.Popen(
         command,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        universal_newlines=True,
     )
+    timed_out = threading.Event()
 
-    if container in ready_messages:
-        print(f"Long-term container. Monitoring the ready message: {ready_messages[container]}")
-        for line in iter(process.stdout.readline, ""):
-            print(line)
-            if ready_messages[container] in line:
-                elapsed_time = time.perf_counter() - start_time
-                minutes, seconds = divmod(elapsed_time, 60)
-                formatted_time = f"{int(minutes)}m{seconds:.3f}s"
-                print("break: " + line)
-                print(f"terminating container: {container}")
-                process.kill()
-                print(f"send terminating container: {container}")
-                process.wait()
-                print(f"complete terminating container: {container}")
-                break
-    else:
-        try:
-            print("Short-term container.")
-            for line in iter(process.stdout.readline, ""):
-                print(line)
-            process.wait(timeout=900)  # Set timeout to 90 seconds, for example
-            elapsed_time = time.perf_counter() - start_time
-            minutes, seconds = divmod(elapsed_time, 60)
-            formatted_time = f"{int(minutes)}m{seconds:.3f}s"
-        except subprocess.TimeoutExpired:
-            print("Process took too long to complete. Terminating...")
-            process.kill()
-            formatted_time = "90s (timeout)"
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    watchdog = threading.Timer(run_timeout, kill_on_timeout)
+    watchdog.start()
+
+    signal, elapsed_time, events = engine.watch(process, start_time)
+    if signal is not None:
+        formatted_time = format_time(elapsed_time)
+        status = "ok"
+        print(f"Ready signal: {signal}")
+    if engine.long_running:
+        process.kill()
+        process.wait()
+    get_output_log(snapshotter).flush()
+
+    watchdog.cancel()
+    if status != "ok" and timed_out.is_set():
+        print(f"Process took longer than {run_timeout}s. Terminated.")
+        status = "timeout"
 
     process.terminate()  # Stop the container
     process.wait()
-    print(f"Container run complete in {formatted_time}.")
+    overhead = sampler.stop() if sampler else None
+    resources = monitor.stop() if monitor else None
+    if status == "ok":
+        print(f"Container run complete in {formatted_time}.")
+    else:
+        print(f"Container run {status} (exit code {process.returncode}).")
+
+    phases = split_phases(events, elapsed_time)
+    print("Phases: " + ", ".join(
+        f"{name} {'-' if phases[name] is None else f'{phases[name]:.3f}s'}" for name in phase_names
+    ))
+
+    return {"status": status, "time": formatted_time, "seconds": elapsed_time, "phases": phases,
+            "signal": signal, "sampler": overhead, "resources": resources}
+
+def make_batches(containers, parallel, burst=False):
+    """
+    Split the containers into batches that are launched together.
+
+    Args:
+        containers (list): List of container images to be tested.
+        parallel (int): Number of containers launched at once.
+        burst (bool): Launch the same image `parallel` times instead of a mix of images.
+
+    Returns:
+        list: The batches, each a list of `parallel` container images.
+    """
+    if burst:
+        return [[container] * parallel for container in containers]
+    batches = []
+    for start in range(0, len(containers), parallel):
+        # Wrap around so the last batch is as large as the others
+        batches.append([containers[(start + k) % len(containers)] for k in range(parallel)])
+    return batches
+
+def batch_label(batch):
+    """
+    Name a concurrent batch in the journal.
+
+    Args:
+        batch (list): The container images launched together.
+
+    Returns:
+        str: "image*N" for a burst of the same image, otherwise the images joined with "+".
+    """
+    if len(set(batch)) == 1:
+        return f"{batch[0]}*{len(batch)}"
+    return "+".join(batch)
+
+def batch_cache_states(batch):
+    """
+    Get the cache states of cache_state_set a batch is run in.
 
-    return formatted_time
+    Args:
+        batch (list): The container images launched together.
+
+    Returns:
+        list: The cache states, without "base" if no container of the batch has a shared base.
+    """
+    return [
+        state for state in cache_state_set
+        if state != "base" or any(container in shared_bases for container in batch)
+    ]
+
+def percentile(values, q):
+    """
+    Compute the q-th percentile of the values with linear interpolation.
+
+    Args:
+        values (list): The sample values.
+        q (float): The percentile to compute, between 0 and 100.
+
+    Returns:
+        float: The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def run_batch(batch, snapshotter):
+    """
+    Launch all containers of a batch together through a worker pool and
+    measure the aggregate throughput and tail latency.
+
+    Args:
+        batch (list): The container images to launch at once.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
 
-def record_results(container, i, formatted_time, snapshotter, RTT=rtt, Bandwidth=Bandwidth):
+    Returns:
+        tuple: The per-container results of run_container and a dict with the
+            batch wall time, throughput (containers ready per second) and latency percentiles.
+    """
+    print(f"Launching {len(batch)} containers at once: {' '.join(batch)}")
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+        results = list(pool.map(lambda container: run_container(container, snapshotter), batch))
+    wall_time = time.perf_counter() - start_time
+
+    ready_times = [result["seconds"] for result in results if result["seconds"] is not None]
+    # The batch is done once its slowest container is ready
+    ready_wall_time = max(ready_times) if ready_times else wall_time
+    summary = {
+        "ready": len(ready_times),
+        "wall_time": ready_wall_time,
+        "throughput": len(ready_times) / ready_wall_time if ready_wall_time > 0 else 0.0,
+        "p50": percentile(ready_times, 50),
+        "p95": percentile(ready_times, 95),
+        "p99": percentile(ready_times, 99),
+        "max": max(ready_times) if ready_times else None,
+    }
+    print(
+        f"Batch ready: {summary['ready']}/{len(batch)} in {ready_wall_time:.3f}s, "
+        f"{summary['throughput']:.3f} containers/s, p95 {summary['p95']}"
+    )
+    return results, summary
+
+def format_phases(phases):
+    """
+    Format the phase durations of a run as result file columns.
+
+    Args:
+        phases (dict): The duration in seconds of every phase, as returned by split_phases.
+
+    Returns:
+        list: One column per phase in phase_names, empty when the phase is unknown.
+    """
+    phases = phases or {}
+    return ["" if phases.get(name) is None else f"{phases[name]:.3f}" for name in phase_names]
+
+def record_results(container, i, formatted_time, snapshotter, RTT=rtt, Bandwidth=Bandwidth, phases=None,
+                   reset_time=None, status="ok", signal=None, cache_state="cold", iteration_id=None):
     """
     Record the results of running the container to a CSV file.
     
@@ -209,58 +784,275 @@ def record_results(container, i, formatted_time, snapshotter, RTT=rtt, Bandwidth
         snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
         RTT (str): The round-trip time in milliseconds.
         Bandwidth (str): The bandwidth in Mbps.
+        phases (dict): The duration in seconds of every phase of the run.
+        reset_time (float): The time taken by the reset before the run in seconds.
+        status (str): The status of the run (ok, timeout or failed).
+        signal (str): The readiness signal that fired first.
+        cache_state (str): The cache state the run started from.
+        iteration_id (str): The ID shared by the attempts of the iteration.
     """
+    phase_columns = format_phases(phases) + ["" if reset_time is None else f"{reset_time:.3f}", status,
+                                             signal or "", cache_state, iteration_id or ""]
     result_file = result_file_template.format(snapshotter=snapshotter)
     with open(result_file, "a", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(
-            [container, i + 1, formatted_time, str(RTT) + "ms", str(Bandwidth) + "Mbps"]
+            [container, i + 1, formatted_time, str(RTT) + "ms", str(Bandwidth) + "Mbps"] + phase_columns
+        )
+    print(f"Recorded time for iteration {i+1}: {formatted_time or status}")
+
+def get_collector(snapshotter):
+    """
+    Get the metrics collector of a snapshotter, creating it on first use.
+
+    Args:
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+
+    Returns:
+        MetricsCollector: The collector, None for overlayfs.
+    """
+    if snapshotter not in metrics_endpoints:
+        return None
+    if snapshotter not in collectors:
+        collectors[snapshotter] = MetricsCollector(metrics_endpoints[snapshotter])
+    return collectors[snapshotter]
+
+def create_sampler(snapshotter):
+    """
+    Create the background sampler for a run, if sampling is enabled.
+
+    Args:
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+
+    Returns:
+        MetricsSampler: The sampler, None if there is nothing to sample.
+    """
+    collector = get_collector(snapshotter)
+    if sample_interval <= 0 or (collector is None and not sample_proc):
+        return None
+    family = f"{metrics_prefixes[snapshotter]}_fs_operation_count" if collector else None
+    series = {operation: (family, operation) for operation in sampled_operations} if collector else {}
+    return MetricsSampler(collector, series, interval=sample_interval, proc=sample_proc)
+
+def record_samples(container, i, sampler, overhead, snapshotter, RTT=rtt, Bandwidth=Bandwidth):
+    """
+    Write the time series of a run and its sampler overhead.
+
+    Args:
+        container (str): The container image that was run.
+        i (int): The iteration number.
+        sampler (MetricsSampler): The stopped sampler.
+        overhead (dict): The overhead returned by MetricsSampler.stop.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+    """
+    samples_dir = samples_dir_template.format(snapshotter=snapshotter)
+    os.makedirs(samples_dir, exist_ok=True)
+    name = f"{container}_{Bandwidth}Mbps_{RTT}ms_{i + 1}.csv"
+    sampler.write(os.path.join(samples_dir, name))
+
+    index_file = os.path.join(samples_dir, "index.csv")
+    ensure_header(index_file, samples_index_header)
+    with open(index_file, "a", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [container, i + 1, str(RTT) + "ms", str(Bandwidth) + "Mbps", name, overhead["polls"],
+             overhead["errors"], f"{overhead['mean_poll']:.5f}", f"{overhead['max_poll']:.5f}",
+             f"{overhead['cpu_time']:.5f}", f"{overhead['duty_cycle']:.4f}"]
+        )
+    print(
+        f"Recorded {overhead['polls']} samples, sampler overhead: {overhead['mean_poll'] * 1000:.2f}ms per poll, "
+        f"{overhead['cpu_time']:.3f}s CPU, {overhead['duty_cycle']:.1%} duty cycle"
+    )
+
+def create_monitor(snapshotter):
+    """
+    Create the resource monitor for a run, if resources are accounted.
+
+    Args:
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+
+    Returns:
+        ResourceMonitor: The monitor of the services of the snapshotter, None if disabled.
+    """
+    if not account_resources:
+        return None
+    return ResourceMonitor(resource_services[snapshotter])
+
+def record_resources(container, i, resources, snapshotter, cache_state="cold", RTT=rtt, Bandwidth=Bandwidth):
+    """
+    Record the resources used by the services during a run to a CSV file.
+
+    Args:
+        container (str): The container image that was run.
+        i (int): The iteration number.
+        resources (dict): The resources returned by ResourceMonitor.stop.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        cache_state (str): The cache state the run started from.
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+    """
+    def fmt(field):
+        value = resources[field]
+        if value is None:
+            return ""
+        return f"{value:.3f}" if field == "cpu_seconds" else str(value)
+
+    monitor = resources["monitor"]
+    resources_file = resources_file_template.format(snapshotter=snapshotter)
+    with open(resources_file, "a", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [container, i + 1, str(RTT) + "ms", str(Bandwidth) + "Mbps", cache_state]
+            + [fmt(field) for field in resource_fields]
+            + [monitor["polls"], f"{monitor['cpu_time']:.3f}", f"{monitor['duty_cycle']:.4f}"]
         )
-    print(f"Recorded time for iteration {i+1}: {formatted_time}")
+    print(
+        f"Resource monitor overhead: {monitor['mean_poll'] * 1000:.2f}ms per poll, "
+        f"{monitor['cpu_time']:.3f}s CPU, {monitor['duty_cycle'] * 100:.2f}% duty cycle"
+    )
+    if resources["cpu_seconds"] is None:
+        print(f"No process of {', '.join(resources['services'])} found, no resources recorded")
+        return
+    print(
+        f"Resources: {resources['cpu_seconds']:.3f}s CPU, {resources['peak_rss_bytes'] / 2**20:.1f}MiB peak RSS, "
+        f"{resources['context_switches']} context switches"
+    )
+
+def snapshot_metrics(snapshotter):
+    """
+    Scrape the snapshotter's metrics endpoint before a run.
+
+    Args:
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+
+    Returns:
+        dict: The parsed scrape, None for overlayfs or if the endpoint is unreachable.
+    """
+    collector = get_collector(snapshotter)
+    if collector is None:
+        return None  # No metrics for overlayfs
+    try:
+        return collector.scrape()
+    except requests.RequestException as e:
+        print(f"Error scraping metrics: {e}")
+        return None
 
-def capture_metrics(snapshotter):
+def capture_metrics(snapshotter, before=None):
     """
     Capture the metrics from the snapshotter's metrics endpoint.
     
+    The counters are cumulative since the snapshotter started, so the
+    scrape taken before the run is subtracted to get per-run values.
+
     Args:
         snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        before (dict): The scrape taken by snapshot_metrics before the run.
     
     Returns:
-        int: The sum of the metrics captured.
-    """
-    if snapshotter == "stargz":
-        print("Capturing metrics...")
-        response = requests.get("http://127.0.0.1:8234/metrics")
-        metrics_matches = metrics_pattern_estargz.findall(response.text)
-    elif snapshotter == "fleet":
-        print("Capturing metrics...")
-        response = requests.get("http://127.0.0.1:8334/metrics")
-        metrics_matches = metrics_pattern_fleet.findall(response.text)
-    else:
+        dict: The sum of the on-demand fetch counts ("sum"), the fetch latency
+            percentiles in milliseconds ("p50", "p95", "p99") and the delta of
+            every metric family ("families"). None for overlayfs.
+    """
+    if snapshotter not in metrics_endpoints:
         return None  # No metrics for overlayfs
+    print("Capturing metrics...")
+    after = snapshot_metrics(snapshotter)
+    if after is None:
+        return None
+    families = delta(before, after)
 
-    metrics_sum = sum(int(m) for m in metrics_matches)
-    return metrics_sum
+    prefix = metrics_prefixes[snapshotter]
+    fetches = select(families, f"{prefix}_fs_operation_count", operation_type=fetch_count_operation)
+    latency = merge_buckets(
+        select(families, f"{prefix}_fs_operation_duration_milliseconds", operation_type=fetch_latency_operation)
+    )
+    return {
+        "sum": int(sum(series["value"] for series in fetches)),
+        "p50": histogram_quantile(0.50, latency),
+        "p95": histogram_quantile(0.95, latency),
+        "p99": histogram_quantile(0.99, latency),
+        "families": families,
+    }
 
-def record_metrics(container, i, metrics_sum, snapshotter, RTT=rtt, Bandwidth=Bandwidth):
+def record_metrics(container, i, metrics, snapshotter, cache_state="cold", RTT=rtt, Bandwidth=Bandwidth):
     """
-    Record the metrics sum to a CSV file.
+    Record the metrics sum and fetch latency to a CSV file, and the delta of
+    every metric family to a JSON lines file.
     
     Args:
         container (str): The container image that was run.
         i (int): The iteration number.
-        metrics_sum (int): The sum of the metrics captured.
+        metrics (dict): The metrics captured by capture_metrics.
         snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        cache_state (str): The cache state the run started from.
         RTT (str): The round-trip time in milliseconds.
         Bandwidth (str): The bandwidth in Mbps.
     """
+    percentiles = ["" if metrics[q] is None else f"{metrics[q]:.3f}" for q in ("p50", "p95", "p99")]
     metrics_file = metrics_file_template.format(snapshotter=snapshotter)
     with open(metrics_file, "a", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(
-            [container, i + 1, metrics_sum, str(RTT) + "ms", str(Bandwidth) + "Mbps"]
+            [container, i + 1, metrics["sum"], str(RTT) + "ms", str(Bandwidth) + "Mbps"] + percentiles
+            + [cache_state]
+        )
+
+    detail_file = metrics_detail_file_template.format(snapshotter=snapshotter)
+    with open(detail_file, "a") as f:
+        f.write(json.dumps({
+            "container": container,
+            "iteration": i + 1,
+            "rtt": RTT,
+            "bandwidth": Bandwidth,
+            "cache_state": cache_state,
+            "families": metrics["families"],
+        }) + "\n")
+    print(f"Recorded metrics sum for iteration {i+1}: {metrics['sum']}")
+
+def record_batch(batch_id, batch, i, results, summary, metrics_sum, snapshotter, burst,
+                 RTT=rtt, Bandwidth=Bandwidth, cache_state="cold"):
+    """
+    Record the per-container times and the aggregate throughput of a concurrent batch.
+
+    Args:
+        batch_id (int): The index of the batch within the cell.
+        batch (list): The container images launched together.
+        i (int): The iteration number.
+        results (list): The per-container results of run_container.
+        summary (dict): The batch summary returned by run_batch.
+        metrics_sum (int): The sum of the metrics captured for the whole batch.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        burst (bool): Whether the batch is the same image launched several times.
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+        cache_state (str): The cache state the batch started from.
+    """
+    mode = "burst" if burst else "mix"
+    parallel_file = parallel_file_template.format(snapshotter=snapshotter)
+    with open(parallel_file, "a", newline="") as f:
+        writer = csv.writer(f)
+        for slot, (container, result) in enumerate(zip(batch, results)):
+            writer.writerow(
+                [batch_id + 1, slot + 1, container, i + 1, result["time"],
+                 str(RTT) + "ms", str(Bandwidth) + "Mbps", len(batch), mode]
+                + format_phases(result["phases"]) + [result["status"], result["signal"] or "", cache_state]
+            )
+
+    def fmt(value):
+        return "" if value is None else f"{value:.3f}"
+
+    summary_file = parallel_summary_file_template.format(snapshotter=snapshotter)
+    with open(summary_file, "a", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [batch_id + 1, i + 1, len(batch), mode, summary["ready"], fmt(summary["wall_time"]),
+             fmt(summary["throughput"]), fmt(summary["p50"]), fmt(summary["p95"]), fmt(summary["p99"]),
+             fmt(summary["max"]), "" if metrics_sum is None else metrics_sum,
+             str(RTT) + "ms", str(Bandwidth) + "Mbps", fmt(summary.get("reset_time")), cache_state]
         )
-    print(f"Recorded metrics sum for iteration {i+1}: {metrics_sum}")
+    print(f"Recorded batch {batch_id + 1} for iteration {i+1}: {summary['throughput']:.3f} containers/s")
 
 def set_network_conditions(bandwidth, latency, server_ip="158.132.255.111"):
     """
@@ -274,64 +1066,612 @@ def set_network_conditions(bandwidth, latency, server_ip="158.132.255.111"):
     Returns:
         tuple: The stdout and stderr from the command.
     """
-    password = "gh"
-    command = f'sshpass -p {password} ssh root@{server_ip} "bash /home/gh/code/lab/nw.sh {bandwidth}mbit {latency}ms"'
+    command = f'sshpass -e ssh root@{server_ip} "bash /home/gh/code/lab/nw.sh {bandwidth}mbit {latency}ms"'
     print(command)
     completed_process = subprocess.run(
-        command, shell=True, capture_output=True, text=True
+        command, shell=True, capture_output=True, text=True,
+        env=dict(os.environ, SSHPASS=ssh_password),
     )
     print(f"Successfully set network conditions on server {server_ip}.")
     print(f"Output: {completed_process.stdout}")
     print(f"Errors: {completed_process.stderr}")
     return completed_process.stdout, completed_process.stderr
 
-def main(containers=containers_extend, iterations=iterations, snapshotter="overlayfs"):
+def pull_registry():
+    """
+    Get the registry address the images are pulled from.
+
+    Returns:
+        str: The shaping proxy in proxy mode, the registry otherwise.
+    """
+    return proxy.address if proxy else registry
+
+def apply_network_conditions(bandwidth, latency):
+    """
+    Apply the network conditions of a cell with the configured shaping.
+
+    Args:
+        bandwidth (int): The bandwidth in Mbps.
+        latency (int): The RTT in milliseconds.
+
+    Returns:
+        str: An error message, empty if the conditions were applied.
+    """
+    if shaping == "ssh":
+        _, error = set_network_conditions(bandwidth, latency, server_ip=registry.rsplit(":", 1)[0])
+        return error
+    if shaping == "proxy":
+        proxy.set_conditions(latency, bandwidth)
+        print(f"Shaping proxy {proxy.address} set to {latency}ms RTT and {bandwidth}Mbps.")
+    return ""
+
+def probe_cell(snapshotter, container, bandwidth, latency):
+    """
+    Measure the RTT and throughput achieved towards the registry and record them.
+
+    Args:
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        container (str): A container of the cell, whose image is used to measure the throughput.
+        bandwidth (int): The configured bandwidth in Mbps.
+        latency (int): The configured RTT in milliseconds.
+    """
+    global link
+    link = probe_link(pull_registry(), f"{container}:{snapshotter[:3]}", bandwidth=bandwidth)
+    measured_rtt = "" if link["rtt"] is None else f"{link['rtt']:.1f}"
+    measured_bandwidth = "" if link["bandwidth"] is None else f"{link['bandwidth']:.1f}"
+    print(f"Measured network: {measured_rtt or '-'}ms RTT and {measured_bandwidth or '-'}Mbps "
+          f"(configured {latency}ms and {bandwidth}Mbps)")
+    network_file = network_file_template.format(snapshotter=snapshotter)
+    ensure_header(network_file, network_header)
+    with open(network_file, "a", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([f"{latency}ms", f"{bandwidth}Mbps", shaping, measured_rtt, measured_bandwidth])
+
+def record_trace(container, i, snapshotter, result, cache_state="cold", RTT=rtt, Bandwidth=Bandwidth):
+    """
+    Write the registry trace of a run and its access profile.
+
+    Args:
+        container (str): The container image that was run.
+        i (int): The iteration number.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        result (dict): The result of run_container.
+        cache_state (str): The cache state the run started from.
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+
+    Returns:
+        dict: The access profile of the run.
+    """
+    records = tracer.end()
+    layers = tracer.image_layers(container)
+    traces_dir = traces_dir_template.format(snapshotter=snapshotter)
+    os.makedirs(traces_dir, exist_ok=True)
+    state = "" if cache_state == "cold" else f"_{cache_state}"
+    name = f"{container}_{Bandwidth}Mbps_{RTT}ms_{i + 1}{state}.json"
+    run = {
+        "container": container,
+        "snapshotter": snapshotter,
+        "iteration": i + 1,
+        "rtt_ms": RTT,
+        "bandwidth_mbps": Bandwidth,
+        "cache_state": cache_state,
+        "measured_rtt_ms": link["rtt"],
+        "measured_mbps": link["bandwidth"],
+        "status": result["status"],
+        "seconds": result["seconds"],
+        "phases": result["phases"],
+    }
+    write_trace(os.path.join(traces_dir, name), run, records, layers)
+
+    profile = access_profile(records, layers)
+    profile_file = access_profile_file_template.format(snapshotter=snapshotter)
+    ensure_header(profile_file, access_profile_header)
+    fraction = "" if profile["fetched_fraction"] is None else f"{profile['fetched_fraction']:.4f}"
+    with open(profile_file, "a", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [container, i + 1, str(RTT) + "ms", str(Bandwidth) + "Mbps", name, profile["requests"],
+             profile["manifests"], profile["blobs"], profile["ranges"], profile["bytes"], profile["unique_bytes"],
+             profile["image_bytes"] or "", fraction, profile["size_p50"] or "", profile["size_p95"] or "",
+             profile["max_in_flight"], f"{profile['duration']:.3f}", cache_state]
+        )
+    print(f"Traced {profile['requests']} registry requests ({profile['ranges']} ranges), "
+          f"{profile['bytes']} bytes fetched" + (f", {fraction} of the image" if fraction else ""))
+    return profile
+
+def store_run(container, i, snapshotter, result, run_id=None, metrics=None, reset_time=None,
+              parallel=1, batch=None, profile=None, cache_state="cold", bases=(), iteration_id=None,
+              RTT=rtt, Bandwidth=Bandwidth):
+    """
+    Write a run to the results store, if one is open.
+
+    The resources of the services are taken from the result when it has them.
+
+    Args:
+        container (str): The container image that was run.
+        i (int): The iteration number.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        result (dict): The result of run_container.
+        run_id (str): The ID of the run, generated if omitted.
+        metrics (dict): The metrics captured by capture_metrics, optional.
+        reset_time (float): The time taken by the reset before the run in seconds.
+        parallel (int): Number of containers launched at once.
+        batch (str): The label of the concurrent batch the run belongs to.
+        profile (dict): The registry access profile of the run, optional.
+        cache_state (str): The cache state the run started from.
+        bases (list): The shared base images pulled before the run.
+        iteration_id (str): The ID shared by the attempts of the iteration, optional.
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+    """
+    if store is None:
+        return
+    row = {
+        "run_id": run_id or new_run_id(),
+        "snapshotter": snapshotter,
+        "container": container,
+        "image": f"{registry}/{container}:{snapshotter[:3]}",
+        "bandwidth_mbps": Bandwidth,
+        "rtt_ms": RTT,
+        "iteration": i + 1,
+        "iteration_id": iteration_id,
+        "parallel": parallel,
+        "batch": batch,
+        "status": result["status"],
+        "seconds": result["seconds"],
+        "reset_seconds": reset_time,
+        "ready_signal": result["signal"],
+        "cache_state": cache_state,
+        "base_images": ",".join(bases) or None,
+        "shaping": shaping,
+        "measured_rtt_ms": link["rtt"],
+        "measured_mbps": link["bandwidth"],
+    }
+    if profile is not None:
+        row["registry_requests"] = profile["requests"]
+        row["registry_bytes"] = profile["bytes"]
+    for phase, column in phase_columns.items():
+        row[column] = result["phases"].get(phase)
+    if result.get("resources"):
+        row.update({field: result["resources"][field] for field in resource_fields})
+        row["resources"] = result["resources"]["services"]
+    if metrics is not None:
+        row.update({
+            "metrics_sum": metrics["sum"],
+            "fetch_p50_ms": metrics["p50"],
+            "fetch_p95_ms": metrics["p95"],
+            "fetch_p99_ms": metrics["p99"],
+            "metrics": metrics["families"],
+        })
+    store.insert(row)
+
+def run_iteration(container, i, snapshotter, reset=True, journal_file=None, cache_state="cold", previous=None,
+                  RTT=rtt, Bandwidth=Bandwidth):
+    """
+    Reset the snapshotter to a cache state, run one iteration of a container
+    and record its results, then mark the iteration in the journal.
+
+    A retry of an iteration that failed, timed out or errored keeps the
+    iteration ID of the earlier attempts, so the loaders only count the last one.
+
+    Args:
+        container (str): The container image to run.
+        i (int): The iteration number.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        reset (bool): Reset the snapshotter before the run.
+        journal_file (str): The run journal, None to not journal the iteration.
+        cache_state (str): The cache state the run starts from, one of cache_states.
+        previous (dict): The journal entry of an earlier attempt of the iteration, which this run supersedes.
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+
+    Returns:
+        dict: The result of run_container, with status error if the reset failed.
+    """
+    key = cell_key(snapshotter, container, Bandwidth, RTT, i + 1, cache_state)
+    run_id = new_run_id()
+    # Journals written before iteration IDs only have the run ID of the earlier attempt
+    iteration_id = (previous or {}).get("iteration_id") or (previous or {}).get("run_id") or run_id
+    bases = []
+    try:
+        reset_time = None
+        if reset:
+            reset_time, bases = prepare_cache([container], snapshotter, cache_state)
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"Reset failed: {e}. Skipping iteration {i+1} for container: {container}")
+        if journal_file:
+            append_entry(journal_file, key, "error", error=str(e), iteration_id=iteration_id)
+        return {"status": "error", "time": "", "seconds": None, "phases": {}, "signal": None, "sampler": None,
+                "resources": None}
+
+    metrics_before = snapshot_metrics(snapshotter)
+    sampler = create_sampler(snapshotter)
+    if tracer:
+        tracer.begin()
+    result = run_container(container, snapshotter, sampler=sampler, monitor=create_monitor(snapshotter))
+    profile = record_trace(container, i, snapshotter, result, cache_state=cache_state,
+                           RTT=RTT, Bandwidth=Bandwidth) if tracer else None
+    if sampler:
+        record_samples(container, i, sampler, result["sampler"], snapshotter, RTT=RTT, Bandwidth=Bandwidth)
+    record_results(container, i, result["time"], snapshotter, RTT=RTT, Bandwidth=Bandwidth,
+                   phases=result["phases"], reset_time=reset_time, status=result["status"],
+                   signal=result["signal"], cache_state=cache_state, iteration_id=iteration_id)
+    if result["resources"]:
+        record_resources(container, i, result["resources"], snapshotter, cache_state=cache_state,
+                         RTT=RTT, Bandwidth=Bandwidth)
+    metrics = capture_metrics(snapshotter, metrics_before)
+    if metrics is not None:
+        record_metrics(
+            container, i, metrics, snapshotter, cache_state=cache_state, RTT=RTT, Bandwidth=Bandwidth
+        )
+    store_run(container, i, snapshotter, result, run_id=run_id, metrics=metrics, reset_time=reset_time,
+              profile=profile, cache_state=cache_state, bases=bases, iteration_id=iteration_id,
+              RTT=RTT, Bandwidth=Bandwidth)
+    if journal_file:
+        append_entry(journal_file, key, result["status"], seconds=result["seconds"],
+                     reset_time=reset_time, run_id=run_id, iteration_id=iteration_id)
+    return result
+
+def run_parallel_iteration(batch_id, batch, i, snapshotter, burst, reset=True, journal_file=None,
+                           cache_state="cold", RTT=rtt, Bandwidth=Bandwidth):
+    """
+    Reset the snapshotter to a cache state, launch one iteration of a concurrent
+    batch and record its results, then mark the iteration in the journal.
+
+    Args:
+        batch_id (int): The index of the batch within the cell.
+        batch (list): The container images launched together.
+        i (int): The iteration number.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        burst (bool): Whether the batch is the same image launched several times.
+        reset (bool): Reset the snapshotter before the batch.
+        journal_file (str): The run journal, None to not journal the batch.
+        cache_state (str): The cache state the batch starts from, one of cache_states.
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+    """
+    label = batch_label(batch)
+    key = cell_key(snapshotter, label, Bandwidth, RTT, i + 1, cache_state)
+    print(
+        f"Starting iteration {i+1} for batch {batch_id+1} ({' '.join(batch)}, {cache_state}) under {Bandwidth}bandwidth and {RTT}latency\n"
+    )
+    bases = []
+    try:
+        reset_time = None
+        if reset:
+            reset_time, bases = prepare_cache(batch, snapshotter, cache_state)
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"Reset failed: {e}. Skipping iteration {i+1} for batch {label}")
+        if journal_file:
+            append_entry(journal_file, key, "error", error=str(e))
+        return
+
+    metrics_before = snapshot_metrics(snapshotter)
+    results, summary = run_batch(batch, snapshotter)
+    summary["reset_time"] = reset_time
+    metrics = capture_metrics(snapshotter, metrics_before)
+    metrics_sum = None if metrics is None else metrics["sum"]
+    record_batch(batch_id, batch, i, results, summary, metrics_sum, snapshotter, burst,
+                 RTT=RTT, Bandwidth=Bandwidth, cache_state=cache_state)
+    for container, result in zip(batch, results):
+        store_run(container, i, snapshotter, result, reset_time=reset_time, parallel=len(batch),
+                  batch=label, cache_state=cache_state, bases=bases, RTT=RTT, Bandwidth=Bandwidth)
+    if journal_file:
+        failed = [result["status"] for result in results if result["status"] != "ok"]
+        append_entry(journal_file, key, failed[0] if failed else "ok",
+                     seconds=summary["wall_time"], reset_time=reset_time)
+
+def record_convergence(container, iterations_run, samples, snapshotter, cache_state="cold",
+                       RTT=rtt, Bandwidth=Bandwidth):
+    """
+    Record the confidence interval achieved for a cell in adaptive mode.
+
+    Args:
+        container (str): The container image that was run.
+        iterations_run (int): The number of iterations run for the cell, including failed ones.
+        samples (list): The provisioning times in seconds of the completed iterations.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        cache_state (str): The cache state the iterations started from.
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+    """
+    if len(samples) >= 2:
+        mean, low, high = confidence_interval(samples)
+        columns = [f"{mean:.3f}", f"{low:.3f}", f"{high:.3f}", f"{relative_width(samples):.4f}"]
+    else:
+        columns = ["", "", "", ""]
+    is_converged = converged(samples, target_width, min_iterations)
+    convergence_file = convergence_file_template.format(snapshotter=snapshotter)
+    ensure_header(convergence_file, convergence_header)
+    with open(convergence_file, "a", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [container, str(RTT) + "ms", str(Bandwidth) + "Mbps", iterations_run, len(samples)]
+            + columns + [is_converged, cache_state]
+        )
+    print(f"Recorded confidence interval for {container}: {len(samples)} samples, converged: {is_converged}")
+
+def run_adaptive_cell(container, snapshotter, reset=True, journal_file=None, entries=None,
+                      cache_state="cold", RTT=rtt, Bandwidth=Bandwidth):
+    """
+    Run iterations of a container until the confidence interval of its
+    provisioning time is narrower than target_width, bounded by
+    min_iterations and max_iterations.
+
+    Args:
+        container (str): The container image to run.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        reset (bool): Reset the snapshotter before every run.
+        journal_file (str): The run journal, None to not journal the iterations.
+        entries (dict): Journal entries of a previous run to resume from.
+        cache_state (str): The cache state every run starts from, one of cache_states.
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+    """
+    entries = entries or {}
+    samples = []
+    i = 0
+    while i < max_iterations and not converged(samples, target_width, min_iterations):
+        entry = entries.get(cell_key(snapshotter, container, Bandwidth, RTT, i + 1, cache_state))
+        if entry and entry["status"] == "ok":
+            print(f"Skipping completed iteration {i+1} for container: {container}")
+            samples.append(entry["seconds"])
+        else:
+            print(
+                f"Starting iteration {i+1} for container: {container} under {Bandwidth}bandwidth and {RTT}latency\n"
+            )
+            result = run_iteration(container, i, snapshotter, reset=reset, journal_file=journal_file,
+                                   cache_state=cache_state, previous=entry, RTT=RTT, Bandwidth=Bandwidth)
+            if result["status"] == "ok":
+                samples.append(result["seconds"])
+        i += 1
+        print(f"Relative CI half-width after {len(samples)} samples: {relative_width(samples):.4f}")
+    record_convergence(container, i, samples, snapshotter, cache_state=cache_state, RTT=RTT, Bandwidth=Bandwidth)
+
+def adaptive_cell_done(entries, container, snapshotter, cache_state="cold", RTT=rtt, Bandwidth=Bandwidth):
+    """
+    Check whether the journal records an adaptive cell as finished.
+
+    Args:
+        entries (dict): Journal entries of a previous run.
+        container (str): The container image.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        cache_state (str): The cache state of the cell.
+        RTT (str): The round-trip time in milliseconds.
+        Bandwidth (str): The bandwidth in Mbps.
+
+    Returns:
+        bool: True if the cell converged or already ran max_iterations iterations.
+    """
+    samples = []
+    for i in range(max_iterations):
+        entry = entries.get(cell_key(snapshotter, container, Bandwidth, RTT, i + 1, cache_state))
+        if entry is None or entry["status"] != "ok":
+            return False
+        samples.append(entry["seconds"])
+        if converged(samples, target_width, min_iterations):
+            return True
+    return True
+
+def main(containers=containers_extend, iterations=iterations, snapshotter="overlayfs",
+         parallel=1, burst=False, reset=True, resume=False, adaptive=False, db=results_db, dry_run=False):
     """
     Main function to run container performance tests with specified snapshotter.
     
+    The runs are laid out and ordered by the planner: every network condition
+    is applied once, as configured by shaping, and the containers are
+    interleaved within it, each of them run from every cache state of
+    cache_state_set. The estimated sweep time, from the runs in the results
+    database, is printed before the sweep and updated after every step.
+    Every iteration is recorded in an append-only journal. With resume, the
+    iterations that already completed are skipped, so an interrupted sweep
+    only runs the missing, failed or timed out ones.
+
     Args:
         containers (list): List of container images to be tested.
         iterations (int): Number of iterations to run for each container.
         snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        parallel (int): Number of containers launched at once, 1 runs them one at a time.
+        burst (bool): In concurrent mode, launch the same image `parallel` times instead of a mix of images.
+        reset (bool): Reset the snapshotter before every run.
+        resume (bool): Skip the iterations the journal records as completed.
+        adaptive (bool): Ignore iterations and sample each cell until its confidence
+            interval is narrower than target_width.
+        db (str): The results database every run is also written to, None to disable it.
+        dry_run (bool): Only print the plan and its estimated duration.
     """
+    global store, proxy, tracer
+    journal_file = journal_file_template.format(snapshotter=snapshotter)
+    entries = load_journal(journal_file) if resume else {}
+    done = {key for key, entry in entries.items() if entry["status"] == "ok"}
+    if resume:
+        print(f"Resuming from {journal_file}: {len(done)} iterations already completed.")
+
+    def finished(step):
+        if adaptive:
+            return adaptive_cell_done(entries, step["label"], snapshotter, cache_state=step["cache_state"],
+                                      RTT=step["latency"], Bandwidth=step["bandwidth"])
+        return cell_key(snapshotter, step["label"], step["bandwidth"], step["latency"], step["iteration"] + 1,
+                        step["cache_state"]) in done
+
+    batches = make_batches(containers, parallel, burst) if parallel > 1 else [[c] for c in containers]
+    units = [
+        (batch_id, batch, batch_label(batch) if parallel > 1 else batch[0], state)
+        for batch_id, batch in enumerate(batches) for state in batch_cache_states(batch)
+    ]
+    steps = plan_sweep(bandwidth_set, latency_set, units, None if adaptive else iterations, finished)
+    estimates, unknown = estimate_plan(
+        steps, DurationModel(*load_history(db, snapshotter)), reset=reset, shaping=shaping,
+        probe=probe_network, iterations=min_iterations,
+    )
+    print_plan(steps, estimates, unknown)
+    if dry_run:
+        return
+
+    store = ResultsStore(db) if db else None
+    tracer = RegistryTracer() if trace_registry else None
+    if shaping == "proxy" or tracer:
+        proxy = ShapingProxy(registry, proxy_listen, tracer=tracer).start()
+        print(f"Pulling from {registry} through the {'shaping ' if shaping == 'proxy' else ''}proxy {proxy.address}")
     create_results_files(snapshotter)
+    if parallel > 1:
+        create_parallel_files(snapshotter)
 
-    for bw in bandwidth_set:
-        for latency in latency_set:
-            _, error = set_network_conditions(bw, latency)
-            if error:  
+    clock = SweepClock(estimates)
+    condition = None
+    for step in steps:
+        bw, latency = step["bandwidth"], step["latency"]
+        if (bw, latency) != condition:
+            condition = (bw, latency)
+            error = apply_network_conditions(bw, latency)
+            if error:
                 print(
                     f"Error setting network conditions: {error}. Skipping experiments for {bw}bandwidth and {latency}latency."
                 )
-                continue  
+            elif probe_network and shaping != "none":
+                probe_cell(snapshotter, step["batch"][0], bw, latency)
+        if error:
+            clock.step_skipped()
+            continue
 
-            for container in containers:
-                print(
-                    f"Starting tests for container: {container} under {bw}bandwidth and {latency}latency\n"
-                )
-                for i in range(iterations):
-                    print(
-                        f"Starting iteration {i+1} for container: {container} under {bw}bandwidth and {latency}latency\n"
-                    )
-
-                    reset_snapshotter(snapshotter)
-
-                    time_taken = run_container(container, snapshotter)
-                    record_results(container, i, time_taken, snapshotter, RTT=latency, Bandwidth=bw)
-                    metrics_sum = capture_metrics(snapshotter)
-                    if metrics_sum is not None:
-                        record_metrics(
-                            container, i, metrics_sum, snapshotter, RTT=latency, Bandwidth=bw
-                        )
-                print(
-                    f"All tests for container {container} under {bw}bandwidth and {latency}latency completed.\n"
-                )
+        container, state, i = step["label"], step["cache_state"], step["iteration"]
+        if parallel > 1:
+            run_parallel_iteration(step["batch_id"], step["batch"], i, snapshotter, burst, reset=reset,
+                                   journal_file=journal_file, cache_state=state, RTT=latency, Bandwidth=bw)
+        elif adaptive:
+            print(
+                f"Starting tests for container: {container} ({state}) under {bw}bandwidth and {latency}latency\n"
+            )
+            run_adaptive_cell(container, snapshotter, reset=reset, journal_file=journal_file,
+                              entries=entries, cache_state=state, RTT=latency, Bandwidth=bw)
+        else:
+            print(
+                f"Starting iteration {i+1} for container: {container} ({state}) under {bw}bandwidth and {latency}latency\n"
+            )
+            previous = entries.get(cell_key(snapshotter, container, bw, latency, i + 1, state))
+            run_iteration(container, i, snapshotter, reset=reset, journal_file=journal_file,
+                          cache_state=state, previous=previous, RTT=latency, Bandwidth=bw)
+        clock.step_done()
 
+    if proxy:
+        proxy.stop()
     print("All experiments completed.\n")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run container performance tests with specified snapshotter.")
     parser.add_argument('snapshotter', type=str, choices=['overlayfs', 'stargz', 'fleet'],
                         help="The snapshotter to use: overlayfs, stargz, or fleet.")
+    parser.add_argument('--containers', nargs='+', default=containers_extend,
+                        help="Container images to test (default: all of containers_extend).")
+    parser.add_argument('--iterations', type=int, default=iterations,
+                        help="Number of iterations to run for each container.")
+    parser.add_argument('--latencies', nargs='+', type=int, default=latency_set,
+                        help="Latency values to test in milliseconds.")
+    parser.add_argument('--bandwidths', nargs='+', type=int, default=bandwidth_set,
+                        help="Bandwidth values to test in Mbps.")
+    parser.add_argument('--parallel', type=int, default=1,
+                        help="Launch this many containers at once and measure contention.")
+    parser.add_argument('--burst', action='store_true',
+                        help="In concurrent mode, launch the same image N times instead of a mix of images.")
+    parser.add_argument('--nerdctl', type=str, default=nerdctl_bin,
+                        help="nerdctl binary to use, e.g. ./fake_nerdctl.py to test without containerd.")
+    parser.add_argument('--registry', type=str, default=registry,
+                        help="Registry the images are pulled from.")
+    parser.add_argument('--no-reset', action='store_true',
+                        help="Do not reset the snapshotter before every run.")
+    parser.add_argument('--cache-states', nargs='+', choices=cache_states, default=cache_state_set,
+                        help="Cache states every container is run from: cold, base (cold with a related "
+                             "image pulled first), images, pagecache or warm.")
+    parser.add_argument('--shared-base', action='append', default=[], metavar='CONTAINER=BASE',
+                        help="Set the related image pulled before a container in the base cache state, repeatable.")
+    parser.add_argument('--shaping', type=str, choices=['ssh', 'proxy', 'none'], default=shaping,
+                        help="Apply the network conditions on the registry server over ssh, "
+                             "through a local shaping proxy, or not at all.")
+    parser.add_argument('--proxy-listen', type=str, default=proxy_listen,
+                        help="Address of the shaping proxy in proxy mode, host:port.")
+    parser.add_argument('--no-network', action='store_true',
+                        help="Do not set the network conditions, same as --shaping none.")
+    parser.add_argument('--no-probe', action='store_true',
+                        help="Do not measure the RTT and throughput achieved in every cell.")
+    parser.add_argument('--ready-pattern', action='append', default=[], metavar='CONTAINER=REGEX',
+                        help="Add a regular expression of a ready log line of a container, repeatable.")
+    parser.add_argument('--ready-probe', action='append', default=[], metavar='CONTAINER=PROBE',
+                        help="Add an active readiness probe of a container, tcp:PORT or http:PORT/PATH, repeatable.")
+    parser.add_argument('--trace', action='store_true',
+                        help="Trace the manifest, blob and Range requests of every run through the proxy.")
+    parser.add_argument('--sample-interval', type=int, default=0,
+                        help=f"Poll the metrics endpoint every N milliseconds ({sample_interval_range[0]}-"
+                             f"{sample_interval_range[1]}) while each container runs.")
+    parser.add_argument('--sample-proc', action='store_true',
+                        help="Also sample /proc network and CPU counters while each container runs.")
+    parser.add_argument('--no-resources', action='store_true',
+                        help="Do not account the CPU, memory, disk and network used by the services in every run.")
+    parser.add_argument('--resource-services', nargs='+',
+                        help="Services accounted in every run, systemd units or process names "
+                             "(default: containerd and the snapshotter's service).")
+    parser.add_argument('--db', type=str, default=results_db,
+                        help="Results database every run is also written to.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Only run the iterations the journal does not record as completed.")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Print the planned order of the runs and the estimated sweep time, then exit.")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Sample each cell until the confidence interval of its provisioning time converges.")
+    parser.add_argument('--target-width', type=float, default=target_width,
+                        help="Target relative half-width of the 95%% confidence interval in adaptive mode.")
+    parser.add_argument('--min-iterations', type=int, default=min_iterations,
+                        help="Minimum number of iterations per cell in adaptive mode.")
+    parser.add_argument('--max-iterations', type=int, default=max_iterations,
+                        help="Maximum number of iterations per cell in adaptive mode.")
     args = parser.parse_args()
-    main(snapshotter=args.snapshotter)
+    if args.parallel < 1:
+        parser.error("--parallel must be at least 1")
+    if args.sample_proc and args.sample_interval <= 0:
+        parser.error("--sample-proc requires --sample-interval")
+    if args.sample_interval and not sample_interval_range[0] <= args.sample_interval <= sample_interval_range[1]:
+        parser.error(f"--sample-interval must be between {sample_interval_range[0]} and "
+                     f"{sample_interval_range[1]} milliseconds")
+    if args.adaptive and args.parallel > 1:
+        parser.error("--adaptive cannot be combined with --parallel")
+    if args.trace and args.parallel > 1:
+        parser.error("--trace cannot be combined with --parallel, the requests of concurrent runs are not told apart")
+    if args.no_reset and args.cache_states != ["cold"]:
+        parser.error("--cache-states other than cold need the resets, they cannot be combined with --no-reset")
+    if args.adaptive and not 3 <= args.min_iterations <= args.max_iterations:
+        parser.error("--min-iterations must be at least 3 and at most --max-iterations")
+    latency_set = args.latencies
+    bandwidth_set = args.bandwidths
+    nerdctl_bin = args.nerdctl
+    registry = args.registry
+    shaping = "none" if args.no_network else args.shaping
+    proxy_listen = args.proxy_listen
+    probe_network = not args.no_probe
+    trace_registry = args.trace
+    for option, signals in (("--ready-pattern", ready_patterns), ("--ready-probe", ready_probes)):
+        for value in getattr(args, option[2:].replace("-", "_")):
+            container, sep, signal = value.partition("=")
+            if not sep or not signal:
+                parser.error(f"{option} expects CONTAINER=VALUE, got {value!r}")
+            try:
+                re.compile(signal) if option == "--ready-pattern" else parse_probe(signal)
+            except (re.error, ValueError) as e:
+                parser.error(f"{option} {value!r}: {e}")
+            signals[container] = signals.get(container, []) + [signal]
+    for value in args.shared_base:
+        container, sep, base = value.partition("=")
+        if not sep or not base:
+            parser.error(f"--shared-base expects CONTAINER=BASE, got {value!r}")
+        shared_bases[container] = base
+    cache_state_set = list(dict.fromkeys(args.cache_states))
+    target_width = args.target_width
+    sample_interval = args.sample_interval / 1000
+    sample_proc = args.sample_proc
+    account_resources = not args.no_resources
+    if args.resource_services:
+        resource_services[args.snapshotter] = args.resource_services
+    min_iterations = args.min_iterations
+    max_iterations = args.max_iterations
+    main(containers=args.containers, iterations=args.iterations, snapshotter=args.snapshotter,
+         parallel=args.parallel, burst=args.burst, reset=not args.no_reset,
+         resume=args.resume, adaptive=args.adaptive, db=args.db, dry_run=args.dry_run)
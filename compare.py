@@ -0,0 +1,298 @@
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from analysis import cell_columns, cache_dir, load_runs, select_runs
+from report import (n_boot, alpha, sample_matrix, bootstrap_means, interval, permutation_p_values, adjust_p_values,
+                    write_table)
+
+# Regression detection between two sweeps, e.g. before and after a
+# snapshotter upgrade. The cells of a baseline and a candidate sweep are
+# aligned on (snapshotter, bandwidth, container, RTT), and the change of the
+# mean provisioning time and on-demand fetch count of every cell is tested
+# with the permutation test of report.py. A change counts when it is
+# significant and larger than its threshold, and any regression makes the
+# exit code non-zero. Runs that timed out or failed are regressions too: a
+# cell whose candidate runs all failed, or whose failure rate went up by more
+# than failure_threshold.
+
+thresholds = {"seconds": 0.05, "metrics_sum": 0.10}
+# Smallest relative change of the mean that counts, for the provisioning time and the on-demand fetch count
+
+failure_threshold = 0.2
+# Smallest rise of the share of runs that timed out or failed that counts as a regression
+
+metric_names = {"seconds": "time", "metrics_sum": "fetches"}
+# Name of every compared column in the table
+
+min_runs = 3
+# Fewest completed runs of a cell in each sweep for it to be compared
+
+status_order = ["regression", "improvement", "unchanged"]
+# Order of the statuses in the ranked table
+
+def compare_metric(baseline, candidate, column, n_boot=n_boot, seed=0):
+    """
+    Compare the mean of a column in every cell measured in both sweeps.
+
+    The p-value comes from a permutation test of the runs of both sweeps. The
+    interval of the relative change is bootstrapped, each sweep with its own
+    random stream.
+
+    Args:
+        baseline (pandas.DataFrame): The selected runs of the baseline sweep.
+        candidate (pandas.DataFrame): The selected runs of the candidate sweep.
+        column (str): The compared column, e.g. seconds or metrics_sum.
+        n_boot (int): Number of bootstrap resamples.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        pandas.DataFrame: Indexed by cell_columns, with the number of runs and mean of
+            each sweep, the relative "change" of the candidate mean, its confidence
+            interval and the two-sided permutation p-value.
+    """
+    baseline = baseline.dropna(subset=[column])
+    candidate = candidate.dropna(subset=[column])
+    if baseline.empty or candidate.empty:
+        return pd.DataFrame()
+    base_index, base_counts, base_matrix = sample_matrix(baseline, column)
+    cand_index, cand_counts, cand_matrix = sample_matrix(candidate, column)
+    base_position = pd.Series(np.arange(len(base_index)), index=base_index)
+    cand_position = pd.Series(np.arange(len(cand_index)), index=cand_index)
+    common = base_position.index.intersection(cand_position.index)
+    base_rows = base_position[common].to_numpy()
+    cand_rows = cand_position[common].to_numpy()
+    enough = (base_counts[base_rows] >= min_runs) & (cand_counts[cand_rows] >= min_runs)
+    common, base_rows, cand_rows = common[enough], base_rows[enough], cand_rows[enough]
+    if len(common) == 0:
+        return pd.DataFrame()
+
+    boot_base = bootstrap_means(base_matrix[base_rows], base_counts[base_rows], n_boot, seed)
+    boot_cand = bootstrap_means(cand_matrix[cand_rows], cand_counts[cand_rows], n_boot, seed + 1)
+    base_mean = np.nanmean(base_matrix[base_rows], axis=1)
+    cand_mean = np.nanmean(cand_matrix[cand_rows], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # A mean of zero on both sides, e.g. no on-demand fetch at all, is no change
+        change = np.where(cand_mean == base_mean, 0.0, cand_mean / base_mean - 1)
+        ratio = np.where(boot_cand == boot_base, 0.0, boot_cand / boot_base - 1)
+    low, high = interval(ratio)
+    return pd.DataFrame({
+        "baseline_n": base_counts[base_rows],
+        "candidate_n": cand_counts[cand_rows],
+        "baseline_mean": base_mean,
+        "candidate_mean": cand_mean,
+        "change": change,
+        "change_ci_low": low,
+        "change_ci_high": high,
+        "p_value": permutation_p_values(base_matrix[base_rows], base_counts[base_rows],
+                                        cand_matrix[cand_rows], cand_counts[cand_rows], n_boot, seed + 2),
+    }, index=common)
+
+def latest_runs(runs):
+    """
+    Drop the runs that timed out or failed and were retried later.
+
+    The loaders already drop the attempts superseded by a retry with the same
+    iteration ID. Files written before iteration IDs only tell a retry apart
+    by its order, so a run that did not complete is dropped if a later run of
+    the same cell, iteration and cache state follows it in its source. Runs
+    that completed are never dropped, so sweeps appended to one file all count.
+
+    Args:
+        runs (pandas.DataFrame): Runs in the order they ran, as returned by load_runs.
+
+    Returns:
+        pandas.DataFrame: The runs without the retried ones.
+    """
+    retried = runs.duplicated(cell_columns + ["iteration", "cache_state", "source"], keep="last")
+    return runs[~(retried & (runs["status"] != "ok"))]
+
+def compare_failures(baseline, candidate, threshold=failure_threshold):
+    """
+    Compare the share of runs that timed out or failed in every cell run in both sweeps.
+
+    A cell regresses if none of its candidate runs completed while some of its
+    baseline runs did, or if its failure rate went up by more than the
+    threshold, and improves if the rate went down by more than the threshold.
+
+    Args:
+        baseline (pandas.DataFrame): The selected runs of the baseline sweep, of every status.
+        candidate (pandas.DataFrame): The selected runs of the candidate sweep, of every status.
+        threshold (float): Smallest change of the failure rate that counts, e.g. 0.2.
+
+    Returns:
+        pandas.DataFrame: One row per cell with a failed run in either sweep, with the
+            number of runs and failure rate of each sweep, the "change" of the rate,
+            i.e. the difference of the rates, and the "status" of the cell. There is
+            no interval or p-value.
+    """
+    def failures(runs):
+        failed = (runs["status"] != "ok").groupby([runs[column] for column in cell_columns])
+        return pd.DataFrame({"n": failed.size(), "rate": failed.mean()})
+
+    cells = failures(baseline).join(failures(candidate), how="inner", lsuffix="_base", rsuffix="_cand")
+    cells = cells[(cells["rate_base"] > 0) | (cells["rate_cand"] > 0)]
+    change = cells["rate_cand"] - cells["rate_base"]
+    table = pd.DataFrame({
+        "metric": "failures",
+        "baseline_n": cells["n_base"],
+        "candidate_n": cells["n_cand"],
+        "baseline_mean": cells["rate_base"],
+        "candidate_mean": cells["rate_cand"],
+        "change": change,
+        "change_ci_low": np.nan,
+        "change_ci_high": np.nan,
+        "p_value": np.nan,
+        "q_value": np.nan,
+        "threshold": threshold,
+        "status": np.select(
+            [((cells["rate_cand"] == 1) & (cells["rate_base"] < 1)) | (change > threshold), change < -threshold],
+            ["regression", "improvement"], default="unchanged",
+        ),
+    }, index=cells.index)
+    return table.reset_index()
+
+def compare(baseline, candidate, thresholds=thresholds, n_boot=n_boot, seed=0, alpha=alpha,
+            failure_threshold=failure_threshold):
+    """
+    Flag the significant regressions and improvements of a candidate sweep.
+
+    A higher provisioning time or fetch count is a regression. The p-values
+    of all cells and metrics are adjusted together with Benjamini-Hochberg,
+    and a change is flagged if its q-value is below alpha and it is larger
+    than the threshold of its metric. The means only cover the completed runs,
+    the runs that timed out or failed are compared by compare_failures. Both
+    only count the last attempt of a retried iteration.
+
+    Args:
+        baseline (pandas.DataFrame): The selected runs of the baseline sweep, of every status.
+        candidate (pandas.DataFrame): The selected runs of the candidate sweep, of every status.
+        thresholds (dict): Compared column to the smallest relative change that counts.
+        n_boot (int): Number of bootstrap resamples.
+        seed (int): Seed of the random generator.
+        alpha (float): Significance level of the adjusted p-values.
+        failure_threshold (float): Smallest change of the failure rate that counts.
+
+    Returns:
+        pandas.DataFrame: One row per (cell, metric), ranked: regressions first, then
+            improvements, then unchanged cells, the largest changes first, with the
+            q-value and "status" of every row.
+    """
+    baseline, candidate = latest_runs(baseline), latest_runs(candidate)
+    completed = [runs[runs["status"] == "ok"] for runs in (baseline, candidate)]
+    tables = []
+    for k, (column, threshold) in enumerate(thresholds.items()):
+        table = compare_metric(*completed, column, n_boot, seed + 3 * k)
+        if table.empty:
+            continue
+        table = table.reset_index()
+        table.insert(len(cell_columns), "metric", metric_names.get(column, column))
+        table["threshold"] = threshold
+        tables.append(table)
+    if tables:
+        table = pd.concat(tables, ignore_index=True)
+        table["q_value"] = adjust_p_values(table["p_value"].to_numpy())
+        significant = table["q_value"] < alpha
+        table["status"] = np.select(
+            [significant & (table["change"] > table["threshold"]),
+             significant & (table["change"] < -table["threshold"])],
+            ["regression", "improvement"], default="unchanged",
+        )
+        tables = [table]
+    failures = compare_failures(baseline, candidate, failure_threshold)
+    if not failures.empty:
+        tables.append(failures)
+    if not tables:
+        return pd.DataFrame()
+
+    table = pd.concat(tables, ignore_index=True)
+    table["rank"] = table["status"].map(status_order.index)
+    table = table.sort_values(["rank", "change"], key=lambda values: values if values.name == "rank" else -values.abs())
+    return table.drop(columns="rank").reset_index(drop=True)
+
+def missing_cells(baseline, candidate):
+    """
+    Count the cells measured in only one of the sweeps.
+
+    Returns:
+        tuple: The number of cells only in the baseline and only in the candidate.
+    """
+    base_cells = pd.MultiIndex.from_frame(baseline[cell_columns]).unique()
+    cand_cells = pd.MultiIndex.from_frame(candidate[cell_columns]).unique()
+    return len(base_cells.difference(cand_cells)), len(cand_cells.difference(base_cells))
+
+def format_table(table):
+    """
+    Format the ranked table for the terminal.
+
+    Args:
+        table (pandas.DataFrame): The table returned by compare.
+
+    Returns:
+        str: One line per (cell, metric), with the changes and intervals in percent.
+    """
+    def percent(value):
+        if np.isnan(value):
+            return ""
+        return f"{value:+.1%}" if np.isfinite(value) else "new"
+
+    lines = table.assign(
+        change=table["change"].map(percent),
+        interval=[f"[{percent(low)}, {percent(high)}]" if np.isfinite(low) else ""
+                  for low, high in zip(table["change_ci_low"], table["change_ci_high"])],
+        baseline_mean=table["baseline_mean"].map("{:.3f}".format),
+        candidate_mean=table["candidate_mean"].map("{:.3f}".format),
+        q_value=table["q_value"].map(lambda value: f"{value:.4f}" if np.isfinite(value) else ""),
+    )
+    columns = cell_columns + ["metric", "baseline_mean", "candidate_mean", "change", "interval", "q_value", "status"]
+    return lines[columns].to_string(index=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare a candidate sweep with a baseline sweep per cell and exit with status 1 on regression.")
+    parser.add_argument('--baseline', nargs='+', required=True,
+                        help="Result files, results databases or glob patterns of the baseline sweep.")
+    parser.add_argument('--candidate', nargs='+', required=True,
+                        help="Result files, results databases or glob patterns of the candidate sweep.")
+    parser.add_argument('--snapshotters', nargs='+', help="Snapshotters to compare (default: all).")
+    parser.add_argument('--bandwidths', nargs='+', type=float, help="Bandwidths in Mbps to keep (default: all).")
+    parser.add_argument('--containers', nargs='+', help="Containers to keep (default: all).")
+    parser.add_argument('--cache-state', type=str, default="cold",
+                        help="Cache state of the runs to compare: cold, base, images, pagecache or warm.")
+    parser.add_argument('--time-threshold', type=float, default=thresholds["seconds"],
+                        help="Smallest relative change of the mean provisioning time that counts, e.g. 0.05 for 5%%.")
+    parser.add_argument('--fetch-threshold', type=float, default=thresholds["metrics_sum"],
+                        help="Smallest relative change of the mean on-demand fetch count that counts.")
+    parser.add_argument('--failure-threshold', type=float, default=failure_threshold,
+                        help="Smallest rise of the share of runs that timed out or failed that counts, e.g. 0.2.")
+    parser.add_argument('--alpha', type=float, default=alpha, help="Significance level of the adjusted p-values.")
+    parser.add_argument('--boot', type=int, default=n_boot, help="Number of bootstrap resamples.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the bootstrap.")
+    parser.add_argument('--out', type=str, help="Also write the ranked table (.csv or .json).")
+    parser.add_argument('--no-cache', action='store_true', help=f"Reparse every source instead of using {cache_dir}.")
+    args = parser.parse_args()
+
+    selected = []
+    for sources in (args.baseline, args.candidate):
+        selected.append(select_runs(load_runs(sources, use_cache=not args.no_cache), args.snapshotters,
+                                    args.bandwidths, args.containers, args.cache_state, completed=False))
+    baseline, candidate = selected
+    table = compare(baseline, candidate, {"seconds": args.time_threshold, "metrics_sum": args.fetch_threshold},
+                    args.boot, args.seed, args.alpha, args.failure_threshold)
+    only_baseline, only_candidate = missing_cells(baseline, candidate)
+    if only_baseline or only_candidate:
+        print(f"Not compared: {only_baseline} cells only in the baseline, {only_candidate} only in the candidate")
+    if table.empty:
+        print(f"No cell has at least {min_runs} completed runs in both sweeps, nothing to compare")
+        sys.exit(2)
+
+    print(format_table(table))
+    if args.out:
+        write_table(table, args.out)
+    counts = table["status"].value_counts()
+    regressions = counts.get("regression", 0)
+    print(f"{regressions} regressions, {counts.get('improvement', 0)} improvements, "
+          f"{counts.get('unchanged', 0)} unchanged of {len(table)} comparisons at q < {args.alpha}")
+    sys.exit(1 if regressions else 0)
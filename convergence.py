@@ -0,0 +1,79 @@
+import math
+import statistics
+
+def t_critical(df, confidence=0.95):
+    """
+    Two-sided critical value of Student's t distribution.
+
+    Exact for 1 and 2 degrees of freedom, where the quantile has a closed
+    form. From 3 on, uses the Cornish-Fisher expansion around the normal
+    quantile, which is within 1% of the exact value.
+
+    Args:
+        df (int): Degrees of freedom, at least 1.
+        confidence (float): Confidence level of the interval.
+
+    Returns:
+        float: The critical value t such that P(|T| <= t) = confidence.
+    """
+    if df == 1:
+        # Cauchy distribution
+        return math.tan(math.pi * confidence / 2)
+    if df == 2:
+        return confidence * math.sqrt(2 / (1 - confidence**2))
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    return (
+        z
+        + (z**3 + z) / (4 * df)
+        + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+        + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+        + (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / (92160 * df**4)
+    )
+
+def confidence_interval(samples, confidence=0.95):
+    """
+    Confidence interval of the mean of the samples.
+
+    Args:
+        samples (list): The measured values, at least two.
+        confidence (float): Confidence level of the interval.
+
+    Returns:
+        tuple: The mean, the lower bound and the upper bound of the interval.
+    """
+    mean = statistics.fmean(samples)
+    half_width = t_critical(len(samples) - 1, confidence) * statistics.stdev(samples) / math.sqrt(len(samples))
+    return mean, mean - half_width, mean + half_width
+
+def relative_width(samples, confidence=0.95):
+    """
+    Half-width of the confidence interval relative to the mean.
+
+    Args:
+        samples (list): The measured values.
+        confidence (float): Confidence level of the interval.
+
+    Returns:
+        float: The relative half-width, infinite with fewer than two samples.
+    """
+    if len(samples) < 2:
+        return math.inf
+    mean, low, high = confidence_interval(samples, confidence)
+    if mean == 0:
+        return 0.0 if high == low else math.inf
+    return (high - mean) / abs(mean)
+
+def converged(samples, target, min_samples, confidence=0.95):
+    """
+    Check whether a cell has enough samples to stop iterating.
+
+    Args:
+        samples (list): The measured values.
+        target (float): Target relative half-width of the confidence interval.
+        min_samples (int): Minimum number of samples before stopping.
+        confidence (float): Confidence level of the interval.
+
+    Returns:
+        bool: True once there are min_samples and the interval is narrow enough.
+    """
+    return len(samples) >= min_samples and relative_width(samples, confidence) <= target
@@ -0,0 +1,475 @@
+import argparse
+import collections
+import json
+import os
+import socketserver
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import xmlrpc.client
+from xmlrpc.server import SimpleXMLRPCServer
+
+from bench import containers_extend, iterations, latency_set, bandwidth_set, cache_state_set, shared_bases, shaping
+from planner import plan_sweep, load_history, DurationModel, estimate_plan, format_duration
+from results_store import ResultsStore, results_db
+
+# Distributed sweeps: a coordinator splits the sweep into items, one per
+# (snapshotter, bandwidth, RTT) condition, and hands them out to workers on
+# several client nodes over XML-RPC. A worker runs bench.py for the item it
+# leased, renewing the lease while it runs, and sends the runs back to be
+# written to the coordinator's results store. Items whose lease expires,
+# because their worker died or lost the network, are handed out again.
+#
+# Every worker applies the conditions of its item on its own path to the
+# registry, so the workers must shape the network locally (--shaping proxy)
+# or not at all; nw.sh shapes the registry server for all clients at once.
+
+lease_seconds = 60
+# Time a worker holds an item without renewing its lease
+
+max_attempts = 3
+# Number of times an item is handed out after its bench.py failed
+
+poll_interval = 1
+# Delay in seconds between two requests of an idle worker
+
+worker_db = "worker_fleetbench.sqlite"
+# Local results database of a worker, in the directory of the sweep in its working directory
+
+worker_log = "worker_fleetbench.log"
+# Output of the bench.py runs of a worker, in its working directory
+
+bench_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench.py")
+# bench.py run by the workers
+
+fake_nerdctl_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_nerdctl.py")
+# nerdctl stand-in of the local workers
+
+class ThreadingXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+def build_items(snapshotters, containers, iterations, cache_states, bandwidths, latencies, extra_args=(), db=None):
+    """
+    Split a sweep into one item per (snapshotter, bandwidth, RTT) condition.
+
+    The items are sorted longest first by the estimate of the planner, so the
+    long items do not end up last on a single node.
+
+    Args:
+        snapshotters (list): Snapshotter types.
+        containers (list): Container images.
+        iterations (int): Number of iterations of every container.
+        cache_states (list): Cache states every container is run from.
+        bandwidths (list): Bandwidths in Mbps.
+        latencies (list): RTTs in milliseconds.
+        extra_args (list): bench.py options added to every item, e.g. --shaping proxy.
+        db (str): The results database the durations are estimated from, optional.
+
+    Returns:
+        list: One dict per item with its "id", "snapshotter", "bandwidth", "latency",
+            bench.py "args" and "estimate" in seconds.
+    """
+    units = [
+        (0, [container], container, state)
+        for container in containers for state in cache_states
+        if state != "base" or container in shared_bases
+    ]
+    items = []
+    for snapshotter in snapshotters:
+        model = DurationModel(*load_history(db, snapshotter))
+        for bw in bandwidths:
+            for latency in latencies:
+                steps = plan_sweep([bw], [latency], units, iterations)
+                estimates, _ = estimate_plan(steps, model, shaping="proxy")
+                items.append({
+                    "id": f"{snapshotter}/{bw}Mbps/{latency}ms",
+                    "snapshotter": snapshotter,
+                    "bandwidth": bw,
+                    "latency": latency,
+                    "args": [
+                        snapshotter, "--bandwidths", str(bw), "--latencies", str(latency),
+                        "--iterations", str(iterations), "--containers", *containers,
+                        "--cache-states", *cache_states, *extra_args,
+                    ],
+                    "estimate": sum(estimates),
+                })
+    return sorted(items, key=lambda item: -item["estimate"])
+
+class Coordinator:
+    """
+    Work queue of a distributed sweep, served over XML-RPC.
+
+    Workers call lease to get an item, heartbeat to keep it, and complete or
+    fail once bench.py finished. A lease that is not renewed within
+    lease_seconds expires and its item goes back to the front of the queue.
+
+    Args:
+        items (list): The items returned by build_items.
+        store (ResultsStore): The store the runs of all workers are written to.
+        lease_seconds (float): Time a worker holds an item without renewing its lease.
+        max_attempts (int): Number of times an item is handed out after a failure.
+    """
+
+    def __init__(self, items, store, lease_seconds=lease_seconds, max_attempts=max_attempts):
+        self.items = {item["id"]: item for item in items}
+        self.pending = collections.deque(item["id"] for item in items)
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.leases = {}
+        # Lease token to (item, worker, expiry time)
+        self.finished = {}
+        self.failed = {}
+        self.attempts = collections.Counter()
+        self.reassigned = 0
+        self.workers = collections.defaultdict(lambda: {"items": 0, "runs": 0})
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.server = None
+        self.start_time = None
+        self.sweep = time.strftime("sweep-%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        # Workers keep the journal and runs of every sweep in a directory of this name
+
+    def reap(self):
+        # Called with the lock held
+        now = time.monotonic()
+        for token, (item_id, worker, expiry) in list(self.leases.items()):
+            if expiry < now:
+                print(f"Lease of {item_id} on {worker} expired, reassigning it")
+                del self.leases[token]
+                self.pending.appendleft(item_id)
+                self.reassigned += 1
+        if not self.pending and not self.leases:
+            self.done.set()
+
+    def lease(self, worker):
+        """
+        Hand out the next item.
+
+        Args:
+            worker (str): The ID of the worker.
+
+        Returns:
+            dict: The item with its lease "token" and the ID of the "sweep", {"done": True}
+                once the sweep is finished, or an empty dict if every remaining item is leased.
+        """
+        with self.lock:
+            self.reap()
+            # Every worker that asked for work appears in the summary
+            self.workers[worker]
+            if self.done.is_set():
+                return {"done": True}
+            if not self.pending:
+                return {}
+            item_id = self.pending.popleft()
+            token = uuid.uuid4().hex
+            self.leases[token] = (item_id, worker, time.monotonic() + self.lease_seconds)
+            print(f"Leased {item_id} to {worker} ({len(self.pending)} items left)")
+            return dict(self.items[item_id], token=token, lease_seconds=self.lease_seconds, sweep=self.sweep)
+
+    def heartbeat(self, worker, token):
+        """
+        Renew a lease.
+
+        Returns:
+            bool: False if the lease expired and the item was handed out again.
+        """
+        with self.lock:
+            if token not in self.leases:
+                return False
+            item_id, _, _ = self.leases[token]
+            self.leases[token] = (item_id, worker, time.monotonic() + self.lease_seconds)
+            return True
+
+    def complete(self, worker, token, runs):
+        """
+        Write the runs of a finished item to the store.
+
+        Args:
+            worker (str): The ID of the worker.
+            token (str): The lease of the item.
+            runs (str): The runs of the item, a JSON list of results store rows.
+
+        Returns:
+            bool: False if the lease expired, the runs are then dropped.
+        """
+        with self.lock:
+            if token not in self.leases:
+                return False
+            item_id, _, _ = self.leases.pop(token)
+            rows = json.loads(runs)
+            for row in rows:
+                row["worker"] = worker
+                self.store.insert(row)
+            self.finished[item_id] = worker
+            self.workers[worker]["items"] += 1
+            self.workers[worker]["runs"] += len(rows)
+            print(f"{worker} completed {item_id} with {len(rows)} runs "
+                  f"({len(self.finished)}/{len(self.items)} items)")
+            self.reap()
+            return True
+
+    def fail(self, worker, token, error):
+        """
+        Give an item back after its bench.py failed.
+
+        Returns:
+            bool: False if the lease had already expired.
+        """
+        with self.lock:
+            if token not in self.leases:
+                return False
+            item_id, _, _ = self.leases.pop(token)
+            self.attempts[item_id] += 1
+            if self.attempts[item_id] < self.max_attempts:
+                print(f"{worker} failed {item_id}: {error}. Requeuing it")
+                self.pending.append(item_id)
+            else:
+                print(f"{worker} failed {item_id}: {error}. Giving up after {self.attempts[item_id]} attempts")
+                self.failed[item_id] = error
+            self.reap()
+            return True
+
+    def start(self, listen):
+        """
+        Serve the work queue in a background thread.
+
+        Args:
+            listen (str): The "host:port" to listen on, port 0 for any free port.
+
+        Returns:
+            str: The "host:port" the coordinator listens on.
+        """
+        host, port = listen.rsplit(":", 1)
+        self.server = ThreadingXMLRPCServer((host, int(port)), allow_none=True, logRequests=False)
+        for method in (self.lease, self.heartbeat, self.complete, self.fail):
+            self.server.register_function(method)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.start_time = time.perf_counter()
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def wait(self):
+        """Wait until every item finished or failed, then stop serving and print a summary."""
+        while not self.done.wait(self.lease_seconds / 4):
+            with self.lock:
+                self.reap()
+        # Let the idle workers learn that the sweep is done
+        time.sleep(poll_interval * 2)
+        self.server.shutdown()
+        wall_time = time.perf_counter() - self.start_time
+        print(f"Sweep finished in {format_duration(wall_time)}: {len(self.finished)} items completed, "
+              f"{len(self.failed)} failed, {self.reassigned} reassigned")
+        for worker, stats in sorted(self.workers.items()):
+            print(f"  {worker}: {stats['items']} items, {stats['runs']} runs")
+        for item_id, error in self.failed.items():
+            print(f"  failed {item_id}: {error}")
+
+def shaping_of(args, default=shaping):
+    """
+    Find the network shaping of a bench.py command line.
+
+    Args:
+        args (list): bench.py options, the last of a repeated option wins.
+        default (str): The shaping when no option sets it, bench.py's by default.
+
+    Returns:
+        str: ssh, proxy or none, default if no option sets it.
+    """
+    if "--no-network" in args:
+        return "none"
+    for k, arg in enumerate(args):
+        if arg == "--shaping" and k + 1 < len(args):
+            default = args[k + 1]
+        elif arg.startswith("--shaping="):
+            default = arg.split("=", 1)[1]
+    return default
+
+def local_runs(db, item):
+    """
+    Read the runs of an item from a worker's results database.
+
+    Args:
+        db (str): The worker's results database of the sweep of the item, which only
+            holds the runs of the leases of this sweep.
+        item (dict): The item.
+
+    Returns:
+        list: The runs as dicts of the store columns.
+    """
+    connection = sqlite3.connect(db)
+    connection.row_factory = sqlite3.Row
+    try:
+        rows = connection.execute(
+            "SELECT * FROM runs WHERE snapshotter = ? AND bandwidth_mbps = ? AND rtt_ms = ?",
+            (item["snapshotter"], item["bandwidth"], item["latency"]),
+        ).fetchall()
+    finally:
+        connection.close()
+    return [{key: row[key] for key in row.keys() if row[key] is not None} for row in rows]
+
+def run_worker(coordinator, worker, workdir=".", local_args=(), retries=10):
+    """
+    Lease items from a coordinator and run them with bench.py until the sweep is done.
+
+    bench.py runs with --resume and a local journal and results database in
+    a directory of the sweep, so an item handed back to the same worker only
+    runs its missing iterations, and the runs of earlier sweeps are neither
+    skipped nor sent again.
+
+    Args:
+        coordinator (str): The "host:port" of the coordinator.
+        worker (str): The ID of the worker, e.g. the host name.
+        workdir (str): Directory of the result files of the worker.
+        local_args (list): bench.py options of this node, e.g. --nerdctl or --proxy-listen.
+        retries (int): Number of failed requests in a row before giving up on the coordinator.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    server = xmlrpc.client.ServerProxy(f"http://{coordinator}", allow_none=True)
+    failures = 0
+    while True:
+        try:
+            item = server.lease(worker)
+            failures = 0
+        except OSError as e:
+            failures += 1
+            if failures >= retries:
+                print(f"{worker}: coordinator {coordinator} unreachable ({e}), exiting")
+                return
+            time.sleep(poll_interval)
+            continue
+        if item.get("done"):
+            print(f"{worker}: sweep done")
+            return
+        if not item:
+            time.sleep(poll_interval)
+            continue
+
+        if shaping_of(item["args"] + list(local_args)) == "ssh":
+            # nw.sh would shape the registry server under the runs of the other workers
+            print(f"{worker}: refusing {item['id']}, it shapes the network with ssh")
+            try:
+                server.fail(worker, item["token"], "ssh shaping is not supported on workers, use --shaping proxy")
+            except OSError:
+                pass
+            continue
+
+        print(f"{worker}: running {item['id']}")
+        sweep_dir = os.path.join(workdir, item["sweep"])
+        os.makedirs(sweep_dir, exist_ok=True)
+        command = [sys.executable, bench_path] + item["args"] + ["--resume", "--db", worker_db] + list(local_args)
+        with open(os.path.join(workdir, worker_log), "a") as log:
+            process = subprocess.Popen(command, cwd=sweep_dir, stdout=log, stderr=subprocess.STDOUT)
+            lost = False
+            while True:
+                try:
+                    process.wait(timeout=item["lease_seconds"] / 3)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                try:
+                    lost = not server.heartbeat(worker, item["token"])
+                except OSError:
+                    # Keep running, the lease may still be renewed later
+                    continue
+                if lost:
+                    print(f"{worker}: lost the lease of {item['id']}, stopping it")
+                    process.kill()
+                    process.wait()
+                    break
+        if lost:
+            continue
+        try:
+            if process.returncode != 0:
+                server.fail(worker, item["token"], f"bench.py exited with status {process.returncode}")
+            elif not server.complete(worker, item["token"], json.dumps(local_runs(os.path.join(sweep_dir, worker_db), item))):
+                print(f"{worker}: {item['id']} was reassigned before it completed, its runs are dropped")
+        except OSError as e:
+            print(f"{worker}: cannot report {item['id']} to the coordinator: {e}")
+
+def start_local_workers(coordinator, count, directory, local_args=()):
+    """
+    Start worker processes on this machine, each with its own fake nerdctl.
+
+    Args:
+        coordinator (str): The "host:port" of the coordinator.
+        count (int): Number of workers.
+        directory (str): Parent directory of the working directories of the workers.
+        local_args (list): Extra bench.py options of every worker.
+
+    Returns:
+        list: The worker processes.
+    """
+    processes = []
+    for k in range(count):
+        workdir = os.path.join(directory, f"worker{k + 1}")
+        os.makedirs(workdir, exist_ok=True)
+        # Separate state, so the fake runs of different workers do not slow each other down
+        env = dict(os.environ, FAKE_NERDCTL_STATE=os.path.abspath(os.path.join(workdir, "fake-nerdctl")))
+        command = [
+            sys.executable, os.path.abspath(__file__), "worker", "--coordinator", coordinator,
+            "--id", f"local{k + 1}", "--workdir", workdir,
+            "--nerdctl", fake_nerdctl_path, "--no-reset", "--proxy-listen", "127.0.0.1:0", *local_args,
+        ]
+        processes.append(subprocess.Popen(command, env=env))
+    return processes
+
+def add_sweep_arguments(parser):
+    parser.add_argument('snapshotters', nargs='+', choices=['overlayfs', 'stargz', 'fleet'],
+                        help="Snapshotters of the sweep.")
+    parser.add_argument('--containers', nargs='+', default=containers_extend, help="Container images to test.")
+    parser.add_argument('--iterations', type=int, default=iterations, help="Number of iterations of every container.")
+    parser.add_argument('--latencies', nargs='+', type=int, default=latency_set, help="RTTs in milliseconds.")
+    parser.add_argument('--bandwidths', nargs='+', type=int, default=bandwidth_set, help="Bandwidths in Mbps.")
+    parser.add_argument('--cache-states', nargs='+', default=cache_state_set, help="Cache states of every container.")
+    parser.add_argument('--db', type=str, default=results_db, help="Results database the runs are collected in.")
+    parser.add_argument('--lease', type=float, default=lease_seconds,
+                        help="Seconds a worker holds an item without renewing its lease.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a sweep across several client nodes. Unknown options are passed to bench.py.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinator_parser = commands.add_parser("coordinator", help="Hand out the items of a sweep to workers.")
+    add_sweep_arguments(coordinator_parser)
+    coordinator_parser.add_argument('--listen', type=str, default="0.0.0.0:8700", help="Address to listen on, host:port.")
+
+    worker_parser = commands.add_parser("worker", help="Run the items handed out by a coordinator.")
+    worker_parser.add_argument('--coordinator', type=str, required=True, help="The coordinator, host:port.")
+    worker_parser.add_argument('--id', type=str, default=os.uname().nodename, help="ID of the worker.")
+    worker_parser.add_argument('--workdir', type=str, default=".", help="Directory of the result files of the worker.")
+
+    local_parser = commands.add_parser("local", help="Run a coordinator and local workers with a fake nerdctl.")
+    add_sweep_arguments(local_parser)
+    local_parser.add_argument('--workers', type=int, default=2, help="Number of local workers.")
+    local_parser.add_argument('--dir', type=str, default="workers", help="Parent directory of the workers' files.")
+    args, bench_args = parser.parse_known_args()
+
+    # nw.sh would shape the registry server for all workers at once
+    if shaping_of(bench_args, None) == "ssh":
+        parser.error("--shaping ssh shapes the registry server for every worker, use --shaping proxy or none")
+    if args.command == "worker":
+        run_worker(args.coordinator, args.id, args.workdir, bench_args)
+        sys.exit(0)
+
+    if shaping_of(bench_args, None) is None:
+        bench_args.extend(["--no-network"] if args.command == "local" else ["--shaping", "proxy"])
+    items = build_items(args.snapshotters, args.containers, args.iterations, args.cache_states,
+                        args.bandwidths, args.latencies, bench_args, db=args.db)
+    print(f"{len(items)} items, estimated {format_duration(sum(item['estimate'] for item in items))} on one node")
+    coordinator = Coordinator(items, ResultsStore(args.db), lease_seconds=args.lease)
+    address = coordinator.start(args.listen if args.command == "coordinator" else "127.0.0.1:0")
+    print(f"Coordinator listening on {address}")
+    workers = []
+    if args.command == "local":
+        workers = start_local_workers(address, args.workers, args.dir)
+    try:
+        coordinator.wait()
+    except KeyboardInterrupt:
+        pass
+    for process in workers:
+        process.wait()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from patterns import ready_patterns
+
+# Scripted stand-in for nerdctl so bench.py can be exercised without containerd:
+#   python3 bench.py overlayfs --nerdctl ./fake_nerdctl.py --no-reset --no-network
+# The timings are controlled with environment variables.
+
+pull_time = float(os.environ.get("FAKE_NERDCTL_PULL", "0.5"))
+# Seconds spent resolving and fetching the image
+
+start_time = float(os.environ.get("FAKE_NERDCTL_START", "0.2"))
+# Seconds between the end of the pull and the first output of the container
+
+contention = float(os.environ.get("FAKE_NERDCTL_CONTENTION", "0.5"))
+# Extra fraction of the pull time added for every other concurrent run
+
+failing = os.environ.get("FAKE_NERDCTL_FAIL", "").split(",")
+# Containers whose run exits with an error
+
+hanging = os.environ.get("FAKE_NERDCTL_HANG", "").split(",")
+# Containers that never print their ready message nor exit
+
+state_dir = os.environ.get("FAKE_NERDCTL_STATE", os.path.join(tempfile.gettempdir(), "fake-nerdctl"))
+# Directory used to count the runs that are active at the same time
+
+fetching = os.environ.get("FAKE_NERDCTL_FETCH", "") == "1"
+# Download the image from the registry of the reference (e.g. fake_registry.py
+# behind the shaping proxy) instead of sleeping for the pull time
+
+lazy_fraction = float(os.environ.get("FAKE_NERDCTL_LAZY_FRACTION", "0.3"))
+# With FAKE_NERDCTL_FETCH, fraction of every layer read on demand by lazy-pulling snapshotters
+
+lazy_chunks = {"stargz": 256 << 10, "fleet": 1 << 20}
+# Size in bytes of the Range requests of the lazy-pulling snapshotters
+
+compute_gap = float(os.environ.get("FAKE_NERDCTL_GAP", "0.01"))
+# Seconds the container computes between two on-demand reads
+
+listen_delay = float(os.environ.get("FAKE_NERDCTL_LISTEN", "0.1"))
+# Seconds after the container starts until its published ports answer
+
+ready_lines = {
+    "httpd": "[mpm_event:notice] [pid 1:tid 1] AH00489: Apache/2.4.62 (Unix) configured -- resuming normal operations",
+    "tensorflow": "Skipped non-installed server(s): jupyter",
+    "nginx": "2024/01/01 00:00:00 [notice] 1#1: start worker process 29",
+    "tomcat": "INFO [main] org.apache.catalina.startup.Catalina.start Server startup in [512] milliseconds",
+    "redis": "1:M 01 Jan 2024 00:00:00.000 * Ready to accept connections tcp",
+    "rabbitmq": "Server startup complete; 4 plugins started.",
+    "wordpress": "Complete! WordPress has been successfully copied to /var/www/html",
+}
+# Ready line printed by the long-running containers, matching patterns.ready_patterns
+
+class HealthHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+def publish(ports):
+    """
+    Answer HTTP on the published host ports after listen_delay, like a starting server.
+
+    Args:
+        ports (list): The host ports of the -p options.
+    """
+    def serve():
+        time.sleep(listen_delay)
+        for port in ports:
+            server = ThreadingHTTPServer(("127.0.0.1", port), HealthHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+
+def fetch(reference, snapshotter="overlayfs"):
+    """
+    Download an image from its registry.
+
+    overlayfs downloads every layer before the container starts. Lazy-pulling
+    snapshotters only download the manifest and config; fetch_lazily then
+    reads part of the layers with Range requests while the container runs.
+
+    Args:
+        reference (str): The image reference, "registry/name:tag".
+        snapshotter (str): The snapshotter of the run.
+
+    Returns:
+        tuple: The number of bytes downloaded, and the layers left to read
+            lazily as (URL, size) pairs.
+    """
+    # Only imported when fetching, every fake container would otherwise pay for it at startup
+    import requests
+    from netproxy import manifest_types
+
+    registry, image = reference.split("/", 1)
+    name, tag = image.rsplit(":", 1)
+    session = requests.Session()
+    print(f"{reference}: resolving      |--------------------------------------|", flush=True)
+    response = session.get(f"http://{registry}/v2/{name}/manifests/{tag}", headers={"Accept": manifest_types})
+    response.raise_for_status()
+    print(f"{reference}: resolved       |++++++++++++++++++++++++++++++++++++++|", flush=True)
+    manifest = response.json()
+    total = len(response.content)
+    print(f"manifest-sha256:{response.headers.get('Docker-Content-Digest', '')[7:19]}: done           "
+          "|++++++++++++++++++++++++++++++++++++++|", flush=True)
+    lazy = snapshotter in lazy_chunks
+    for blob in [manifest["config"]] + ([] if lazy else manifest["layers"]):
+        response = session.get(f"http://{registry}/v2/{name}/blobs/{blob['digest']}")
+        response.raise_for_status()
+        total += len(response.content)
+        kind = "config" if blob is manifest["config"] else "layer"
+        print(f"{kind}-sha256:{blob['digest'][7:19]}:    done           "
+              "|++++++++++++++++++++++++++++++++++++++|", flush=True)
+    layers = [(f"http://{registry}/v2/{name}/blobs/{layer['digest']}", layer["size"]) for layer in manifest["layers"]]
+    return total, layers if lazy else []
+
+def fetch_lazily(layers, chunk):
+    """
+    Read lazy_fraction of every layer with Range requests, computing between reads.
+
+    Args:
+        layers (list): (URL, size) of the layers.
+        chunk (int): Size in bytes of each Range request.
+    """
+    import requests
+
+    session = requests.Session()
+    for url, size in layers:
+        for offset in range(0, int(size * lazy_fraction), chunk):
+            last = min(offset + chunk, size) - 1
+            session.get(url, headers={"Range": f"bytes={offset}-{last}"}).raise_for_status()
+            time.sleep(compute_gap)
+
+def active_runs():
+    """
+    Count the fake runs that are currently active.
+
+    Returns:
+        int: The number of active runs, including the calling one.
+    """
+    return len(os.listdir(state_dir))
+
+def run(args):
+    """
+    Emulate `nerdctl run`: print pull progress, then the container output.
+
+    Args:
+        args (list): The arguments after `run`, the last one being the image reference.
+    """
+    reference = args[-1]
+    snapshotter = next((arg.split("=", 1)[1] for arg in args if arg.startswith("--snapshotter=")), "overlayfs")
+    # -p [ip:]hostport:containerport
+    ports = [int(args[k + 1].split(":")[-2]) for k, arg in enumerate(args[:-1]) if arg == "-p"]
+    lazy_layers = []
+    container = reference.rsplit("/", 1)[-1].split(":")[0]
+    os.makedirs(state_dir, exist_ok=True)
+    marker = os.path.join(state_dir, str(os.getpid()))
+    open(marker, "w").close()
+    try:
+        if fetching:
+            fetch_start = time.perf_counter()
+            total, lazy_layers = fetch(reference, snapshotter)
+            elapsed = time.perf_counter() - fetch_start
+            print(f"elapsed: {elapsed:.1f} s                                    "
+                  f"total:  {total / 1e6:.1f} MB ({total / 1e6 / elapsed:.1f} MB/s)", flush=True)
+        else:
+            # Concurrent pulls share the registry link, so each one gets slower
+            pull = pull_time * (1 + contention * (active_runs() - 1))
+            print(f"{reference}: resolving      |--------------------------------------|", flush=True)
+            time.sleep(pull * 0.1)
+            print(f"{reference}: resolved       |++++++++++++++++++++++++++++++++++++++|", flush=True)
+            print(f"manifest-sha256:0000: done           |++++++++++++++++++++++++++++++++++++++|", flush=True)
+            time.sleep(pull * 0.9)
+            print(f"layer-sha256:0001:    done           |++++++++++++++++++++++++++++++++++++++|", flush=True)
+            print(f"elapsed: {pull:.1f} s                                    total:  0.0 B (0.0 B/s)", flush=True)
+    finally:
+        os.remove(marker)
+
+    time.sleep(start_time)
+    print(f"{container} starting", flush=True)
+    if ports:
+        publish(ports)
+    if lazy_layers:
+        fetch_lazily(lazy_layers, lazy_chunks[snapshotter])
+    if container in failing:
+        print(f"{container} failed", flush=True)
+        sys.exit(1)
+    if container in hanging:
+        while True:
+            time.sleep(60)
+    if container in ready_patterns:
+        print(ready_lines.get(container, f"{container} ready"), flush=True)
+        # Long-term containers keep running until the benchmark kills them
+        while True:
+            time.sleep(60)
+    if ports:
+        # A server without a ready line: only the probes tell when it is up
+        while True:
+            time.sleep(60)
+    print(f"{container} done", flush=True)
+
+def main(argv):
+    if not argv:
+        print("usage: fake_nerdctl.py COMMAND [ARGS...]", file=sys.stderr)
+        return 1
+    if argv[0] == "run":
+        run(argv[1:])
+    # stop, rm, ps, pull and image prune have nothing to clean up
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
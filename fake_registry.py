@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal stand-in for the image registry so the network shaping and the
+# pulls can be exercised on one box:
+#   python3 fake_registry.py --port 5000
+# Every repository and tag exists; its layers are deterministic random bytes
+# whose sizes are controlled with environment variables.
+
+layer_count = int(os.environ.get("FAKE_REGISTRY_LAYERS", "3"))
+# Number of layers of every image
+
+layer_size = int(os.environ.get("FAKE_REGISTRY_LAYER_SIZE", str(1 << 20)))
+# Size in bytes of the largest layer, the others are halved one after the other
+
+manifest_type = "application/vnd.oci.image.manifest.v1+json"
+layer_type = "application/vnd.oci.image.layer.v1.tar+gzip"
+
+blobs = {}
+# Digest to content of every blob served so far
+
+blobs_lock = threading.Lock()
+
+def make_image(name, reference):
+    """
+    Build the manifest of an image and register its blobs.
+
+    Args:
+        name (str): The repository, e.g. "ghost".
+        reference (str): The tag, e.g. "fle".
+
+    Returns:
+        bytes: The serialized manifest.
+    """
+    def add_blob(content, media_type):
+        digest = "sha256:" + hashlib.sha256(content).hexdigest()
+        with blobs_lock:
+            blobs[digest] = content
+        return {"mediaType": media_type, "digest": digest, "size": len(content)}
+
+    seed = random.Random(f"{name}:{reference}")
+    config = add_blob(json.dumps({"architecture": "amd64", "os": "linux"}).encode(),
+                      "application/vnd.oci.image.config.v1+json")
+    layers = [
+        add_blob(seed.randbytes(max(layer_size >> index, 1)), layer_type)
+        for index in range(layer_count)
+    ]
+    manifest = {"schemaVersion": 2, "mediaType": manifest_type, "config": config, "layers": layers}
+    return json.dumps(manifest).encode()
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def send_body(self, status, body, content_type, headers=None, head=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def handle_request(self, head=False):
+        path = self.path.split("?", 1)[0]
+        if path in ("/v2", "/v2/"):
+            self.send_body(200, b"{}", "application/json", head=head)
+            return
+        match = re.fullmatch(r"/v2/(.+)/manifests/([^/]+)", path)
+        if match:
+            manifest = make_image(*match.groups())
+            digest = "sha256:" + hashlib.sha256(manifest).hexdigest()
+            self.send_body(200, manifest, manifest_type, {"Docker-Content-Digest": digest}, head=head)
+            return
+        match = re.fullmatch(r"/v2/(.+)/blobs/(sha256:[0-9a-f]{64})", path)
+        with blobs_lock:
+            content = blobs.get(match.group(2)) if match else None
+        if content is None:
+            self.send_body(404, b'{"errors":[{"code":"BLOB_UNKNOWN"}]}', "application/json", head=head)
+            return
+        # Lazy-pulling snapshotters fetch byte ranges of the layers
+        requested = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if requested:
+            first = int(requested.group(1))
+            last = min(int(requested.group(2) or len(content) - 1), len(content) - 1)
+            self.send_body(206, content[first:last + 1], "application/octet-stream",
+                           {"Content-Range": f"bytes {first}-{last}/{len(content)}"}, head=head)
+            return
+        self.send_body(200, content, "application/octet-stream", {"Docker-Content-Digest": match.group(2)}, head=head)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host="127.0.0.1", port=5000):
+    """
+    Start the registry in a background thread.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The port to listen on, 0 for any free port.
+
+    Returns:
+        ThreadingHTTPServer: The running server; its server_address holds the actual port.
+    """
+    server = ThreadingHTTPServer((host, port), RegistryHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic images like a registry.")
+    parser.add_argument('--host', type=str, default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument('--port', type=int, default=5000, help="Port to listen on.")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), RegistryHandler)
+    server.daemon_threads = True
+    print(f"Serving synthetic images on {args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
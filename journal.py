@@ -0,0 +1,83 @@
+import json
+import os
+import socket
+import time
+
+# Append-only run journal. Every finished iteration appends one JSON line
+# that is flushed and fsynced before the next iteration starts, so a crash
+# loses at most the iteration that was running. A torn last line is ignored
+# when the journal is loaded.
+
+journal_file_template = "journal_{snapshotter}_fleetbench.jsonl"
+# Template for the journal file name
+
+def cell_key(snapshotter, container, bandwidth, rtt, iteration, cache_state="cold"):
+    """
+    Build the key identifying one iteration of a sweep.
+
+    Args:
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+        container (str): The container image.
+        bandwidth (int): The bandwidth in Mbps.
+        rtt (int): The round-trip time in milliseconds.
+        iteration (int): The iteration number, starting at 1.
+        cache_state (str): The cache state the run starts from (cold, base, images, pagecache, warm).
+
+    Returns:
+        tuple: The journal key.
+    """
+    return (snapshotter, container, int(bandwidth), int(rtt), int(iteration), cache_state)
+
+def append_entry(path, key, status, **fields):
+    """
+    Durably append the outcome of an iteration to the journal.
+
+    Args:
+        path (str): The journal file.
+        key (tuple): The key returned by cell_key.
+        status (str): ok, timeout, failed or error.
+        **fields: Extra values to store, e.g. seconds or the error message.
+    """
+    snapshotter, container, bandwidth, rtt, iteration, cache_state = key
+    entry = {
+        "snapshotter": snapshotter,
+        "container": container,
+        "bandwidth": bandwidth,
+        "rtt": rtt,
+        "iteration": iteration,
+        "cache_state": cache_state,
+        "status": status,
+        "host": socket.gethostname(),
+        "timestamp": time.time(),
+    }
+    entry.update(fields)
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def load_journal(path):
+    """
+    Load the latest journal entry of every iteration.
+
+    Args:
+        path (str): The journal file.
+
+    Returns:
+        dict: Journal key to the last entry recorded for it.
+    """
+    entries = {}
+    if not os.path.isfile(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn write from a crash, the iteration will be run again
+                continue
+            # Journals written before cache states only hold cold runs
+            key = cell_key(entry["snapshotter"], entry["container"], entry["bandwidth"],
+                           entry["rtt"], entry["iteration"], entry.get("cache_state", "cold"))
+            entries[key] = entry
+    return entries
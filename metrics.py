@@ -0,0 +1,236 @@
+import math
+import re
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Collector for the Prometheus text exposition served by the stargz and
+# fleet snapshotters. The body is parsed line by line as it is streamed, and
+# two scrapes taken around a run are turned into per-run deltas.
+
+label_pattern = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+# One name="value" pair inside the braces of a sample line
+
+def unescape(value):
+    """
+    Unescape a label value of the text exposition.
+
+    Args:
+        value (str): The raw label value.
+
+    Returns:
+        str: The value with \\\\, \\" and \\n resolved.
+    """
+    return value.replace("\\n", "\n").replace('\\"', '"').replace("\\\\", "\\")
+
+def parse_line(line):
+    """
+    Parse one sample line of the text exposition.
+
+    Args:
+        line (str): A line such as `name{a="b"} 1.5 [timestamp]`.
+
+    Returns:
+        tuple: The sample name, a sorted tuple of (label, value) pairs and the value.
+    """
+    brace = line.find("{")
+    if brace == -1:
+        name, rest = line.split(None, 1)
+        labels = ()
+    else:
+        name = line[:brace]
+        end = line.rindex("}")
+        labels = tuple(sorted(
+            (key, unescape(value)) for key, value in label_pattern.findall(line[brace + 1:end])
+        ))
+        rest = line[end + 1:]
+    # float() also accepts the +Inf, -Inf and NaN values of the format
+    return name, labels, float(rest.split()[0])
+
+def parse_exposition(lines, families=None):
+    """
+    Parse the text exposition format as a stream of lines.
+
+    Args:
+        lines (iterable): The lines of the exposition, e.g. response.iter_lines().
+        families (set): Only keep the samples of these metric families, optional.
+
+    Returns:
+        dict: "types" maps each family to its type (counter, gauge, histogram,
+            summary, untyped) and "samples" maps (sample name, labels) to the value.
+    """
+    types = {}
+    samples = {}
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if not line:
+            continue
+        if line.startswith("#"):
+            parts = line.split(None, 3)
+            if len(parts) == 4 and parts[1] == "TYPE":
+                types[parts[2]] = parts[3].strip()
+            continue
+        if families is not None and not line.startswith(tuple(families)):
+            continue
+        name, labels, value = parse_line(line)
+        samples[(name, labels)] = value
+    return {"types": types, "samples": samples}
+
+def family_of(name, types):
+    """
+    Find the metric family a sample belongs to.
+
+    Args:
+        name (str): The sample name, e.g. x_bucket for the histogram x.
+        types (dict): The family types of the scrape.
+
+    Returns:
+        tuple: The family name and the sample suffix (bucket, sum, count or empty).
+    """
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix):
+            family = name[: -len(suffix)]
+            if types.get(family) in ("histogram", "summary"):
+                return family, suffix[1:]
+    return name, ""
+
+def delta(before, after):
+    """
+    Compute the per-run change of every metric family between two scrapes.
+
+    Counters and histograms are cumulative, so their values are subtracted;
+    a series whose value went down was reset by a restart and keeps its new
+    value. Gauges keep the value of the second scrape.
+
+    Args:
+        before (dict): The scrape taken before the run, None if there was none.
+        after (dict): The scrape taken after the run.
+
+    Returns:
+        dict: Family name to {"type": ..., "series": [...]}. A counter or gauge
+            series is {"labels": {...}, "value": v}; a histogram series is
+            {"labels": {...}, "buckets": {le: count}, "sum": s, "count": c}.
+    """
+    previous = before["samples"] if before else {}
+    types = after["types"]
+    families = {}
+    histograms = {}
+    for (name, labels), value in after["samples"].items():
+        family, suffix = family_of(name, types)
+        kind = types.get(family, "untyped")
+        # Summary quantiles are point estimates, only their _sum and _count accumulate
+        if kind in ("counter", "histogram") or (kind == "summary" and suffix):
+            old = previous.get((name, labels), 0.0)
+            change = value - old if value >= old else value
+        else:
+            change = value
+        entry = families.setdefault(family, {"type": kind, "series": []})
+        if kind == "histogram":
+            series_labels = tuple(label for label in labels if label[0] != "le")
+            series = histograms.setdefault(
+                (family, series_labels),
+                {"labels": dict(series_labels), "buckets": {}, "sum": 0.0, "count": 0.0},
+            )
+            if suffix == "bucket":
+                series["buckets"][dict(labels)["le"]] = change
+            elif suffix:
+                series[suffix] = change
+        else:
+            entry["series"].append({"labels": dict(labels), "value": change})
+    for (family, _), series in histograms.items():
+        families[family]["series"].append(series)
+    return families
+
+def histogram_quantile(q, buckets):
+    """
+    Estimate a quantile from cumulative histogram buckets, like PromQL's histogram_quantile.
+
+    Args:
+        q (float): The quantile, between 0 and 1.
+        buckets (dict): Upper bound (as exposed in the le label) to cumulative count.
+
+    Returns:
+        float: The estimated quantile, None if the histogram is empty.
+    """
+    bounds = sorted((float(le), count) for le, count in buckets.items())
+    if not bounds or bounds[-1][1] <= 0:
+        return None
+    rank = q * bounds[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, count in bounds:
+        if count >= rank:
+            if math.isinf(upper_bound):
+                # Quantile falls in the open-ended bucket, return the largest finite bound
+                return lower_bound
+            if count == lower_count:
+                return upper_bound
+            return lower_bound + (upper_bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = upper_bound, count
+    return bounds[-1][0]
+
+def merge_buckets(series_list):
+    """
+    Add up the buckets of several histogram series, e.g. the same operation on every layer.
+
+    Args:
+        series_list (list): Histogram series as returned by delta.
+
+    Returns:
+        dict: Upper bound to the summed cumulative count.
+    """
+    merged = {}
+    for series in series_list:
+        for le, count in series["buckets"].items():
+            merged[le] = merged.get(le, 0.0) + count
+    return merged
+
+def select(families, family, **labels):
+    """
+    Select the series of a family whose labels match.
+
+    Args:
+        families (dict): Per-family deltas as returned by delta.
+        family (str): The metric family.
+        **labels: Label values the series must have.
+
+    Returns:
+        list: The matching series.
+    """
+    series_list = families.get(family, {}).get("series", [])
+    return [
+        series for series in series_list
+        if all(series["labels"].get(key) == value for key, value in labels.items())
+    ]
+
+class MetricsCollector:
+    """
+    Scrape a metrics endpoint over a pooled HTTP session.
+
+    Args:
+        url (str): The metrics endpoint.
+        timeout (float): Timeout of a scrape in seconds.
+    """
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+    def scrape(self, families=None):
+        """
+        Scrape the endpoint, parsing the body while it is streamed.
+
+        Args:
+            families (set): Only keep the samples of these metric families, optional.
+
+        Returns:
+            dict: The parsed scrape, see parse_exposition.
+        """
+        with self.session.get(self.url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            return parse_exposition(response.iter_lines(decode_unicode=True), families)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,386 @@
+import argparse
+import asyncio
+import threading
+import time
+
+import requests
+
+# Traffic-shaping TCP proxy placed in front of the registry. Instead of
+# reconfiguring the registry host for every cell, the images are pulled
+# through a local proxy that delays and rate-limits the traffic, so several
+# proxies with different conditions can run side by side on one client.
+
+chunk_size = 64 * 1024
+# Largest read from a socket, in bytes
+
+burst_time = 0.005
+# Depth of the token buckets in seconds of traffic at the configured bandwidth
+
+min_burst = 16 * 1024
+# Smallest depth of the token buckets in bytes
+
+probe_count = 5
+# Number of request/response round trips used to measure the RTT
+
+probe_bytes = 4 << 20
+# Number of bytes of a layer downloaded to measure the throughput
+
+min_probe_depths = 4
+# Fewest bucket depths of bytes a throughput probe must time after skipping the first depth
+
+manifest_types = ", ".join([
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+])
+# Manifest media types accepted when probing
+
+def bucket_depth(bandwidth):
+    """
+    Get the depth of a token bucket, the bytes it lets through at once after being idle.
+
+    Args:
+        bandwidth (float): The rate in Mbps, None or 0 for no limit.
+
+    Returns:
+        int: The depth in bytes.
+    """
+    if not bandwidth:
+        return chunk_size
+    return max(min_burst, int(bandwidth * 1e6 / 8 * burst_time))
+
+class TokenBucket:
+    """
+    Token bucket limiting the rate at which bytes are forwarded.
+
+    Args:
+        bandwidth (float): The rate in Mbps, None or 0 for no limit.
+    """
+
+    def __init__(self, bandwidth=None):
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.set_rate(bandwidth)
+
+    def set_rate(self, bandwidth):
+        self.rate = bandwidth * 1e6 / 8 if bandwidth else None
+        self.burst = bucket_depth(bandwidth)
+        self.tokens = min(self.tokens, self.burst)
+
+    async def consume(self, size):
+        """
+        Wait until size bytes may be sent.
+
+        The bytes are taken in slices of at most the bucket depth, which is read
+        again after every wait, so a chunk read before the rate was lowered
+        still gets through.
+
+        Args:
+            size (int): Number of bytes to send.
+        """
+        async with self.lock:
+            while size > 0 and self.rate:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                part = min(size, self.burst)
+                if self.tokens >= part:
+                    self.tokens -= part
+                    size -= part
+                    continue
+                await asyncio.sleep((part - self.tokens) / self.rate)
+
+class ShapingProxy:
+    """
+    TCP proxy adding latency and limiting bandwidth towards an upstream server.
+
+    Every forwarded chunk is delayed by half the RTT in each direction, and
+    establishing a connection costs one RTT, like a netem qdisc on the link.
+    The bandwidth is shared by all connections of the proxy in each direction,
+    like the link it emulates; run one proxy per condition to give concurrent
+    runs different conditions. The proxy runs its event loop in a background
+    thread and the conditions can be changed while it runs.
+
+    With a tracer, the bytes of every connection are also fed to it: requests
+    as they leave the client and responses as they reach it, so the traced
+    latencies include the emulated network.
+
+    Args:
+        upstream (str): The "host:port" connections are forwarded to.
+        listen (str): The "host:port" to listen on, port 0 for any free port.
+        rtt (float): The added round-trip time in milliseconds.
+        bandwidth (float): The bandwidth in Mbps, None or 0 for no limit.
+        tracer (RegistryTracer): Tracer of the registry requests, optional.
+    """
+
+    def __init__(self, upstream, listen="127.0.0.1:0", rtt=0, bandwidth=None, tracer=None):
+        host, port = upstream.rsplit(":", 1)
+        self.upstream = (host, int(port))
+        host, port = listen.rsplit(":", 1)
+        self.listen = (host, int(port))
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.tracer = tracer
+        self.connections = 0
+        self.writers = set()
+        self.handlers = set()
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    @property
+    def address(self):
+        """The "host:port" the proxy listens on."""
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"{host}:{port}"
+
+    def set_conditions(self, rtt, bandwidth):
+        """
+        Change the network conditions, for new and open connections.
+
+        Args:
+            rtt (float): The added round-trip time in milliseconds.
+            bandwidth (float): The bandwidth in Mbps, None or 0 for no limit.
+        """
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.apply_rate)
+
+    def apply_rate(self):
+        self.upload.set_rate(self.bandwidth)
+        self.download.set_rate(self.bandwidth)
+
+    async def deliver(self, queue, writer, delivered=None):
+        # Delay line: chunks are written once their propagation delay has passed
+        while True:
+            due, data = await queue.get()
+            if due is None:
+                break
+            await asyncio.sleep(max(due - self.loop.time(), 0))
+            writer.write(data)
+            await writer.drain()
+            if delivered:
+                delivered(data)
+        if writer.can_write_eof():
+            writer.write_eof()
+
+    async def relay(self, reader, writer, bucket, received=None, delivered=None):
+        queue = asyncio.Queue()
+        sender = asyncio.create_task(self.deliver(queue, writer, delivered))
+        try:
+            while True:
+                data = await reader.read(min(chunk_size, bucket.burst))
+                if not data:
+                    break
+                if received:
+                    received(data)
+                await bucket.consume(len(data))
+                queue.put_nowait((self.loop.time() + self.rtt / 2000, data))
+        finally:
+            queue.put_nowait((None, b""))
+            await sender
+
+    async def handle(self, client_reader, client_writer):
+        self.connections += 1
+        self.handlers.add(asyncio.current_task())
+        try:
+            # Connection establishment: one round trip before the first byte
+            await asyncio.sleep(self.rtt / 1000)
+            upstream_reader, upstream_writer = await asyncio.open_connection(*self.upstream)
+        except OSError as e:
+            print(f"Proxy cannot connect to {self.upstream[0]}:{self.upstream[1]}: {e}")
+            client_writer.close()
+            self.handlers.discard(asyncio.current_task())
+            return
+        self.writers.update((client_writer, upstream_writer))
+        trace = self.tracer.connection() if self.tracer else None
+        relays = [
+            asyncio.create_task(self.relay(client_reader, upstream_writer, self.upload,
+                                           received=trace and trace.client_data)),
+            asyncio.create_task(self.relay(upstream_reader, client_writer, self.download,
+                                           delivered=trace and trace.upstream_data)),
+        ]
+        try:
+            await asyncio.wait(relays, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in relays:
+                task.cancel()
+            for writer in (client_writer, upstream_writer):
+                self.writers.discard(writer)
+                writer.close()
+            if trace:
+                trace.close()
+            self.handlers.discard(asyncio.current_task())
+
+    async def open(self):
+        self.upload = TokenBucket(self.bandwidth)
+        self.download = TokenBucket(self.bandwidth)
+        self.server = await asyncio.start_server(self.handle, *self.listen)
+
+    def start(self):
+        """
+        Start the proxy in a background thread.
+
+        Returns:
+            ShapingProxy: The proxy itself, listening once start returns.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.open(), self.loop).result()
+        return self
+
+    def stop(self):
+        """Stop listening, close the open connections and stop the background thread."""
+        async def close():
+            self.server.close()
+            for writer in list(self.writers):
+                writer.close()
+            # Closing the streams ends their relays
+            await asyncio.gather(*self.handlers, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+def probe_rtt(registry, count=probe_count, session=None, timeout=10):
+    """
+    Measure the round-trip time to a registry at the HTTP level.
+
+    The first request opens the connection; the following ones reuse it, so
+    the measurement is one request/response exchange.
+
+    Args:
+        registry (str): The "host:port" of the registry, or of a proxy in front of it.
+        count (int): Number of measured requests.
+        session (requests.Session): Session to reuse, optional.
+        timeout (float): Timeout of every request in seconds.
+
+    Returns:
+        float: The smallest measured round-trip time in milliseconds.
+    """
+    session = session or requests.Session()
+    url = f"http://{registry}/v2/"
+    session.get(url, timeout=timeout)
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        session.get(url, timeout=timeout).content
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def probe_throughput(registry, image, size=probe_bytes, session=None, timeout=60, bandwidth=None):
+    """
+    Measure the throughput of a layer download from a registry.
+
+    The largest layer of the image is requested with a Range header. A
+    shaping proxy that was idle sends one bucket depth of bytes at once, and
+    the socket buffers hand out what they queued before the client read it,
+    so the clock starts once a bucket depth or a quarter of the bytes, the
+    larger, were received. This also leaves out the request round trip. The
+    clock stops at the last byte.
+
+    Args:
+        registry (str): The "host:port" of the registry, or of a proxy in front of it.
+        image (str): The image "name:tag" whose layer is downloaded.
+        size (int): Maximum number of bytes to download, raised to enough bucket depths at bandwidth.
+        session (requests.Session): Session to reuse, optional.
+        timeout (float): Timeout of every request in seconds.
+        bandwidth (float): The bandwidth the link is shaped to in Mbps, which sets the
+            bucket depth. None to take the depth at the rate of the whole download,
+            which is at least the depth at the shaped rate.
+
+    Returns:
+        float: The throughput in Mbps.
+
+    Raises:
+        ValueError: If the bytes timed are fewer than min_probe_depths bucket depths.
+    """
+    session = session or requests.Session()
+    name, tag = image.rsplit(":", 1)
+    headers = {"Accept": manifest_types}
+    manifest = session.get(f"http://{registry}/v2/{name}/manifests/{tag}", headers=headers, timeout=timeout)
+    manifest.raise_for_status()
+    manifest = manifest.json()
+    if "manifests" in manifest:
+        # Image index: probe the first platform
+        digest = manifest["manifests"][0]["digest"]
+        manifest = session.get(f"http://{registry}/v2/{name}/manifests/{digest}",
+                               headers=headers, timeout=timeout).json()
+    layer = max(manifest["layers"], key=lambda layer: layer["size"])
+    if bandwidth:
+        size = max(size, 2 * min_probe_depths * bucket_depth(bandwidth))
+    response = session.get(
+        f"http://{registry}/v2/{name}/blobs/{layer['digest']}",
+        headers={"Range": f"bytes=0-{min(size, layer['size']) - 1}"},
+        stream=True,
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    received = 0
+    arrivals = []
+    # Time at which every chunk arrived, with the bytes received so far
+    for chunk in response.iter_content(chunk_size):
+        received += len(chunk)
+        arrivals.append((time.perf_counter(), received))
+    if len(arrivals) < 2 or arrivals[-1][0] <= arrivals[0][0]:
+        return None
+    if not bandwidth:
+        (start, first), (end, _) = arrivals[0], arrivals[-1]
+        bandwidth = (received - first) * 8 / (end - start) / 1e6
+    depth = bucket_depth(bandwidth)
+    # Bytes queued in the socket buffers while the client started reading arrive at once too
+    start, skipped = next(arrival for arrival in arrivals if arrival[1] >= min(max(depth, received // 4), received))
+    end = arrivals[-1][0]
+    if received - skipped < min_probe_depths * depth or end <= start:
+        raise ValueError(f"throughput probe of {received} bytes is too short for a bucket depth of {depth} bytes")
+    return (received - skipped) * 8 / (end - start) / 1e6
+
+def probe_link(registry, image=None, session=None, bandwidth=None):
+    """
+    Measure the RTT and throughput actually achieved towards a registry.
+
+    Args:
+        registry (str): The "host:port" of the registry, or of a proxy in front of it.
+        image (str): The image "name:tag" used for the throughput, None to skip it.
+        session (requests.Session): Session to reuse, optional.
+        bandwidth (float): The bandwidth the link is shaped to in Mbps, optional.
+
+    Returns:
+        dict: The measured "rtt" in milliseconds and "bandwidth" in Mbps,
+            None where the probe failed.
+    """
+    session = session or requests.Session()
+    link = {"rtt": None, "bandwidth": None}
+    try:
+        link["rtt"] = probe_rtt(registry, session=session)
+        if image:
+            link["bandwidth"] = probe_throughput(registry, image, session=session, bandwidth=bandwidth)
+    except (requests.RequestException, KeyError, ValueError) as e:
+        print(f"Failed to probe {registry}: {e}")
+    return link
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forward a registry through a traffic-shaping proxy.")
+    parser.add_argument('upstream', type=str, help="The registry to forward to, host:port.")
+    parser.add_argument('--listen', type=str, default="127.0.0.1:5001", help="Address to listen on, host:port.")
+    parser.add_argument('--rtt', type=float, default=0, help="Added round-trip time in milliseconds.")
+    parser.add_argument('--bandwidth', type=float, default=0, help="Bandwidth in Mbps, 0 for no limit.")
+    parser.add_argument('--probe', type=str, help="Image name:tag to probe the shaped link with, then exit.")
+    args = parser.parse_args()
+    proxy = ShapingProxy(args.upstream, args.listen, args.rtt, args.bandwidth).start()
+    print(f"Forwarding {proxy.address} to {args.upstream} with {args.rtt}ms RTT and {args.bandwidth or 'unlimited'} Mbps")
+    try:
+        if args.probe:
+            link = probe_link(proxy.address, args.probe, bandwidth=args.bandwidth)
+            print(f"Measured RTT: {link['rtt']} ms, throughput: {link['bandwidth']} Mbps")
+        else:
+            while True:
+                time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    proxy.stop()
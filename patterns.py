@@ -0,0 +1,14 @@
+# Ready log lines of the long-running containers. They live apart from
+# bench.py so that fake_nerdctl.py, which is started for every fake
+# container, can print a matching line without importing the harness.
+
+ready_patterns = {
+    "httpd": [r"Apache/[\d.]+ \(Unix\) configured -- resuming normal operations"],
+    "tensorflow": [r"Skipped non-installed server\(s\)"],
+    "nginx": [r"start worker process"],
+    "tomcat": [r"org\.apache\.catalina\.startup\.Catalina\.start Server startup"],
+    "redis": [r"Ready to accept connections"],
+    "rabbitmq": [r"Server startup complete; \d+ plugins started\."],
+    "wordpress": [r"Complete! WordPress has been successfully copied to /var/www/html"],
+}
+# Dictionary mapping long-running container names to the regular expressions of their ready log lines
@@ -0,0 +1,75 @@
+import re
+
+# Phases of a `nerdctl run`, in order. Each one ends at a marker found in the
+# timestamped output of nerdctl:
+#   Resolve  - start until the image reference is resolved
+#   Fetch    - until the last pull progress line (manifest, config and layers)
+#   Prepare  - until the snapshot is unpacked, if nerdctl reports it
+#   Start    - until the first line printed by the container itself
+#   Ready    - until the ready message or the process exit
+phase_names = ["Resolve", "Fetch", "Prepare", "Start", "Ready"]
+
+resolved_pattern = re.compile(r": resolved\s")
+# Line printed once the image reference is resolved to a manifest
+
+progress_pattern = re.compile(
+    r"(: resolving\s|: resolved\s|^(index|manifest|config|layer)-sha256:|^elapsed: )"
+)
+# Pull progress lines printed by nerdctl
+
+unpack_pattern = re.compile(r"^unpacking ")
+# Snapshot preparation lines printed by nerdctl/containerd
+
+def split_phases(events, ready_time):
+    """
+    Split a run into phases from the timestamped lines of its output.
+
+    Args:
+        events (list): (seconds since start, line) tuples in the order they were read.
+        ready_time (float): Seconds from the start until the container was ready,
+            None if it never became ready.
+
+    Returns:
+        dict: The duration in seconds of every phase in phase_names. A phase whose
+            end marker was not seen is None, except Resolve/Fetch/Prepare which are
+            0 when the image was already present and nothing was pulled.
+    """
+    resolved_at = None
+    fetched_at = None
+    prepared_at = None
+    first_output_at = None
+    for timestamp, line in events:
+        if ready_time is not None and timestamp > ready_time:
+            break
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if first_output_at is None and progress_pattern.search(stripped):
+            if resolved_at is None and resolved_pattern.search(stripped):
+                resolved_at = timestamp
+            fetched_at = timestamp
+        elif first_output_at is None and unpack_pattern.search(stripped):
+            prepared_at = timestamp
+        elif first_output_at is None:
+            first_output_at = timestamp
+
+    # Nothing pulled: the image was present, so these phases took no time
+    if fetched_at is None:
+        resolved_at = fetched_at = 0.0
+    if resolved_at is None:
+        resolved_at = fetched_at
+    if prepared_at is None or prepared_at < fetched_at:
+        prepared_at = fetched_at
+
+    def duration(begin, end):
+        if begin is None or end is None:
+            return None
+        return max(end - begin, 0.0)
+
+    return {
+        "Resolve": duration(0.0, resolved_at),
+        "Fetch": duration(resolved_at, fetched_at),
+        "Prepare": duration(fetched_at, prepared_at),
+        "Start": duration(prepared_at, first_output_at),
+        "Ready": duration(first_output_at, ready_time),
+    }
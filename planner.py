@@ -0,0 +1,324 @@
+import bisect
+import collections
+import datetime
+import os
+import sqlite3
+import time
+
+# Sweep planner: lays out every run of a sweep before it starts, orders the
+# runs so each network condition is applied once and the caches of the warm
+# states are primed once per container, and estimates how long the sweep
+# takes from the runs recorded in the results store. The estimate is
+# corrected with the actual durations as the sweep progresses.
+
+primed_states = ["images", "pagecache", "warm"]
+# Cache states whose caches are filled by an unrecorded run when the container changes
+
+default_run_seconds = 60
+# Estimated provisioning time of a container without any history, in seconds
+
+default_reset_seconds = {"cold": 20, "base": 20, "images": 10, "pagecache": 2, "warm": 1}
+# Estimated reset time of every cache state without any history, in seconds
+
+network_switch_seconds = {"ssh": 5, "proxy": 0.1, "none": 0}
+# Estimated time to apply the conditions of a new cell with every shaping mode, in seconds
+
+probe_seconds = 3
+# Estimated time to probe the network of a cell, in seconds
+
+def format_duration(seconds):
+    """
+    Format a duration for the plan and progress messages.
+
+    Args:
+        seconds (float): The duration in seconds.
+
+    Returns:
+        str: The duration formatted as "<hours>h<minutes>m<seconds>s".
+    """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s"
+
+def plan_sweep(bandwidths, latencies, units, iterations, finished=lambda step: False):
+    """
+    Order the runs of a sweep.
+
+    All runs of a network condition are grouped, so every condition is applied
+    once. Within a condition, the runs of the cold and base states are made
+    in rounds, one iteration of every unit per round, and the units of each
+    round are rotated by one so every unit takes every position equally often
+    and no image always runs first after a condition change. The runs of the
+    primed states are grouped per unit, each group priming the caches once,
+    and the groups are rotated the same way from one condition to the next.
+
+    Args:
+        bandwidths (list): Bandwidths in Mbps.
+        latencies (list): RTTs in milliseconds.
+        units (list): (batch_id, batch, label, cache_state) of every unit run in every
+            condition, a batch being the list of containers launched together.
+        iterations (int): Number of iterations of every unit, None for one step per unit
+            that runs all its iterations (adaptive mode).
+        finished (callable): Called with a step, True if it already completed.
+
+    Returns:
+        list: The steps in execution order, dicts with "bandwidth", "latency",
+            "batch_id", "batch", "label", "cache_state" and "iteration" (0-based, None
+            in adaptive mode).
+    """
+    def rotate(items, shift):
+        shift = shift % len(items) if items else 0
+        return items[shift:] + items[:shift]
+
+    cold = [unit for unit in units if unit[3] not in primed_states]
+    # Units of the primed states, grouped by the batch whose caches they share
+    groups = collections.OrderedDict()
+    for unit in units:
+        if unit[3] in primed_states:
+            groups.setdefault(unit[2], []).append(unit)
+    rounds = range(iterations) if iterations is not None else [None]
+
+    steps = []
+    conditions = [(bw, latency) for bw in bandwidths for latency in latencies]
+    for position, (bw, latency) in enumerate(conditions):
+        def step(unit, i):
+            batch_id, batch, label, cache_state = unit
+            return {"bandwidth": bw, "latency": latency, "batch_id": batch_id, "batch": batch,
+                    "label": label, "cache_state": cache_state, "iteration": i}
+
+        for r, i in enumerate(rounds):
+            for unit in rotate(cold, position + r):
+                steps.append(step(unit, i))
+        for label in rotate(list(groups), position):
+            for i in rounds:
+                for unit in groups[label]:
+                    steps.append(step(unit, i))
+    return [step for step in steps if not finished(step)]
+
+def load_history(db, snapshotter):
+    """
+    Load the mean durations of the completed runs of a snapshotter, counting
+    only the last attempt of an iteration retried with --resume.
+
+    Args:
+        db (str): The results database, None or missing for no history.
+        snapshotter (str): The snapshotter type (overlayfs, stargz, fleet).
+
+    Returns:
+        tuple: (container, bandwidth, rtt, cache_state) to the mean provisioning time
+            in seconds, and cache_state to the mean reset time in seconds.
+    """
+    if not db or not os.path.isfile(db):
+        return {}, {}
+    connection = sqlite3.connect(db)
+    try:
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(runs)")}
+        # Databases written before cache states only hold cold runs
+        state = "COALESCE(cache_state, 'cold')" if "cache_state" in columns else "'cold'"
+        # Only the last attempt of an iteration retried with --resume counts
+        latest = (
+            " AND (iteration_id IS NULL OR rowid = (SELECT attempt.rowid FROM runs AS attempt "
+            "WHERE attempt.iteration_id = runs.iteration_id ORDER BY attempt.timestamp DESC, attempt.rowid DESC "
+            "LIMIT 1))"
+        ) if "iteration_id" in columns else ""
+        rows = connection.execute(
+            f"SELECT container, bandwidth_mbps, rtt_ms, {state}, AVG(seconds) FROM runs "
+            "WHERE snapshotter = ? AND status = 'ok' AND (parallel IS NULL OR parallel = 1)" + latest +
+            " GROUP BY 1, 2, 3, 4",
+            (snapshotter,),
+        ).fetchall()
+        resets = connection.execute(
+            f"SELECT {state}, AVG(reset_seconds) FROM runs "
+            "WHERE snapshotter = ? AND reset_seconds IS NOT NULL" + latest + " GROUP BY 1",
+            (snapshotter,),
+        ).fetchall()
+    finally:
+        connection.close()
+    runs = {(container, bw, rtt, cache_state): seconds for container, bw, rtt, cache_state, seconds in rows}
+    return runs, dict(resets)
+
+def interpolate(points, x):
+    """
+    Interpolate linearly between the two measured points around x.
+
+    Args:
+        points (list): Sorted (x, y) pairs.
+        x (float): Where to interpolate; outside the points, the nearest y is used.
+
+    Returns:
+        float: The interpolated value.
+    """
+    xs = [px for px, _ in points]
+    k = bisect.bisect_left(xs, x)
+    if k == 0:
+        return points[0][1]
+    if k == len(points):
+        return points[-1][1]
+    (x0, y0), (x1, y1) = points[k - 1], points[k]
+    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+class DurationModel:
+    """
+    Estimate the duration of the runs of a sweep from the recorded ones.
+
+    The provisioning time of a run is interpolated over the RTT between the
+    runs recorded for the same container, cache state and bandwidth. Without
+    such runs, the runs of the container at any bandwidth, then in any cache
+    state, then of all containers are used, and finally default_run_seconds.
+
+    Args:
+        runs (dict): Mean provisioning times returned by load_history.
+        resets (dict): Mean reset times returned by load_history.
+    """
+
+    def __init__(self, runs=None, resets=None):
+        self.resets = resets or {}
+        levels = collections.defaultdict(lambda: collections.defaultdict(list))
+        for (container, bw, rtt, cache_state), seconds in (runs or {}).items():
+            for level, key in enumerate([(container, cache_state, bw), (container, cache_state), (container,), ()]):
+                levels[level][key].append((rtt, seconds))
+        self.curves = {}
+        for level, groups in levels.items():
+            for key, points in groups.items():
+                by_rtt = collections.defaultdict(list)
+                for rtt, seconds in points:
+                    by_rtt[rtt].append(seconds)
+                self.curves[(level, key)] = sorted((rtt, sum(values) / len(values)) for rtt, values in by_rtt.items())
+
+    def run(self, container, bandwidth, rtt, cache_state="cold"):
+        """
+        Estimate the provisioning time of a container.
+
+        Returns:
+            tuple: The estimate in seconds and whether it comes from runs of the same
+                container, cache state and bandwidth.
+        """
+        for level, key in enumerate([(container, cache_state, bandwidth), (container, cache_state), (container,), ()]):
+            points = self.curves.get((level, key))
+            if points:
+                return interpolate(points, rtt), level == 0
+        return default_run_seconds, False
+
+    def reset(self, cache_state="cold"):
+        """Estimate the reset time of a cache state in seconds."""
+        if self.resets.get(cache_state) is not None:
+            return self.resets[cache_state]
+        return default_reset_seconds.get(cache_state, default_reset_seconds["cold"])
+
+def estimate_plan(steps, model, reset=True, shaping="ssh", probe=True, iterations=1):
+    """
+    Estimate the duration of every step, including the transitions before it.
+
+    A step pays for applying and probing the network when its condition
+    differs from the previous step's, and for a cold reset plus one run of
+    every container of its batch when it needs primed caches for another
+    batch than the last primed one.
+
+    Args:
+        steps (list): The steps returned by plan_sweep.
+        model (DurationModel): The duration model.
+        reset (bool): Whether every run is preceded by a reset.
+        shaping (str): The shaping mode, a key of network_switch_seconds.
+        probe (bool): Whether every condition is probed.
+        iterations (int): Number of runs of a step in adaptive mode.
+
+    Returns:
+        tuple: The estimated seconds of every step and the number of steps estimated
+            without runs of the same container, cache state and bandwidth.
+    """
+    estimates = []
+    unknown = 0
+    condition = None
+    primed = None
+    for step in steps:
+        seconds = 0.0
+        if (step["bandwidth"], step["latency"]) != condition:
+            condition = (step["bandwidth"], step["latency"])
+            seconds += network_switch_seconds.get(shaping, 0) + (probe_seconds if probe and shaping != "none" else 0)
+        runs = [model.run(container, step["bandwidth"], step["latency"], step["cache_state"])
+                for container in step["batch"]]
+        # Containers of a batch run together, the batch takes as long as the slowest
+        run_seconds = max(estimate for estimate, _ in runs)
+        unknown += not all(exact for _, exact in runs)
+        if reset:
+            if step["cache_state"] in primed_states:
+                if primed != step["label"]:
+                    seconds += model.reset("cold") + sum(
+                        model.run(container, step["bandwidth"], step["latency"])[0]
+                        for container in dict.fromkeys(step["batch"])
+                    )
+                    primed = step["label"]
+            else:
+                primed = None
+            run_seconds += model.reset(step["cache_state"])
+        seconds += run_seconds * (iterations if step["iteration"] is None else 1)
+        estimates.append(seconds)
+    return estimates, unknown
+
+def print_plan(steps, estimates, unknown):
+    """
+    Print the plan of a sweep: the steps of every network condition and the total estimate.
+
+    Args:
+        steps (list): The steps returned by plan_sweep.
+        estimates (list): The estimates returned by estimate_plan.
+        unknown (int): The number of steps estimated without runs of the same container,
+            cache state and bandwidth.
+    """
+    conditions = collections.OrderedDict()
+    for step, seconds in zip(steps, estimates):
+        conditions.setdefault((step["bandwidth"], step["latency"]), []).append((step, seconds))
+    print(f"Plan: {len(steps)} steps in {len(conditions)} network conditions, "
+          f"{unknown} estimated without runs of the same image, cache state and bandwidth")
+    for (bw, latency), group in conditions.items():
+        order = " ".join(
+            f"{step['label']}" + ("" if step["cache_state"] == "cold" else f"/{step['cache_state']}")
+            + ("" if step["iteration"] is None else f"#{step['iteration'] + 1}")
+            for step, _ in group
+        )
+        print(f"  {bw}Mbps {latency}ms: {len(group)} steps, {format_duration(sum(s for _, s in group))}: {order}")
+    total = sum(estimates)
+    finish = datetime.datetime.now() + datetime.timedelta(seconds=total)
+    print(f"Estimated sweep time: {format_duration(total)}, finishing around {finish:%Y-%m-%d %H:%M}")
+
+class SweepClock:
+    """
+    Track the progress of a sweep and keep its ETA up to date.
+
+    The estimates of the remaining steps are scaled by the ratio between the
+    time the finished steps actually took and their estimates.
+
+    Args:
+        estimates (list): The estimates returned by estimate_plan.
+    """
+
+    def __init__(self, estimates):
+        self.estimates = list(estimates)
+        self.start_time = time.perf_counter()
+        self.done = 0
+
+    def eta(self):
+        """
+        Estimate the remaining time of the sweep.
+
+        Returns:
+            float: The remaining time in seconds.
+        """
+        elapsed = time.perf_counter() - self.start_time
+        planned = sum(self.estimates[:self.done])
+        scale = elapsed / planned if self.done and planned > 0 else 1.0
+        return sum(self.estimates[self.done:]) * scale
+
+    def step_skipped(self):
+        """Mark the next step as skipped, it no longer counts in the estimates."""
+        self.estimates[self.done] = 0.0
+        self.done += 1
+
+    def step_done(self):
+        """Mark the next step as finished and print the progress and ETA."""
+        self.done += 1
+        elapsed = time.perf_counter() - self.start_time
+        remaining = self.eta()
+        finish = datetime.datetime.now() + datetime.timedelta(seconds=remaining)
+        print(f"Progress: {self.done}/{len(self.estimates)} steps in {format_duration(elapsed)}, "
+              f"ETA {format_duration(remaining)} (around {finish:%H:%M})")
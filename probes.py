@@ -0,0 +1,116 @@
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+sudo_connect_script = (
+    "import socket, sys; s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM); s.settimeout(1); s.connect(sys.argv[1])"
+)
+# Connection to a unix socket made through sudo when the benchmark is not allowed to connect itself
+
+def wait_until(check, timeout, interval=0.05):
+    """
+    Poll a readiness check until it passes or the timeout expires.
+
+    Args:
+        check (callable): Function returning True once the resource is ready.
+        timeout (float): Maximum time to wait in seconds.
+        interval (float): Delay in seconds between two checks.
+
+    Returns:
+        bool: True if the check passed before the timeout.
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        if check():
+            return True
+        if time.perf_counter() >= deadline:
+            return False
+        time.sleep(interval)
+
+def unit_state(unit):
+    """
+    Get the state of a systemd unit.
+
+    Args:
+        unit (str): The systemd unit, e.g. containerd or stargz-snapshotter.
+
+    Returns:
+        str: The unit state as reported by `systemctl is-active` (active, inactive, activating, ...).
+    """
+    completed_process = subprocess.run(
+        ["systemctl", "is-active", unit], capture_output=True, text=True
+    )
+    return completed_process.stdout.strip()
+
+def unix_socket_ready(path, sudo=True):
+    """
+    Check whether a unix socket, such as a containerd gRPC socket, accepts connections.
+
+    The sockets of containerd and the snapshotters only let root connect.
+    Without the permission, the connection is made through sudo, so the
+    stale socket of a stopped service is not taken for a ready one. The
+    check fails if sudo needs a password.
+
+    Args:
+        path (str): The socket path.
+        sudo (bool): Connect through sudo when not allowed to connect directly.
+
+    Returns:
+        bool: True if a connection could be established.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(1)
+    try:
+        sock.connect(path)
+        return True
+    except PermissionError:
+        if not sudo:
+            return False
+    except OSError:
+        return False
+    finally:
+        sock.close()
+    try:
+        completed_process = subprocess.run(
+            ["sudo", "-n", sys.executable, "-c", sudo_connect_script, path], capture_output=True, timeout=5
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return completed_process.returncode == 0
+
+def tcp_port_open(host, port):
+    """
+    Check whether a TCP port accepts connections.
+
+    Args:
+        host (str): The host to connect to.
+        port (int): The TCP port.
+
+    Returns:
+        bool: True if a connection could be established.
+    """
+    try:
+        with socket.create_connection((host, port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+def http_ready(url, session=None):
+    """
+    Check whether an HTTP endpoint answers with a successful status.
+
+    Args:
+        url (str): The URL to request.
+        session (requests.Session): Session to reuse connections with, optional.
+
+    Returns:
+        bool: True if the endpoint answered with a 2xx status.
+    """
+    try:
+        response = (session or requests).get(url, timeout=1)
+    except requests.RequestException:
+        return False
+    return response.ok
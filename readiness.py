@@ -0,0 +1,180 @@
+import os
+import re
+import selectors
+import socket
+import threading
+import time
+
+from probes import wait_until, tcp_port_open, http_ready
+
+# Readiness engine: decides when a container is ready from its output and
+# from active probes, whichever fires first. The output of the process is
+# read without blocking and teed to a log file instead of the terminal, so
+# the ready time reflects the container rather than the harness.
+
+read_size = 65536
+# Largest read from the output pipe, in bytes
+
+probe_interval = 0.05
+# Delay in seconds between two attempts of an active probe
+
+log_lock = threading.Lock()
+# Serializes the lines of concurrent runs teed to the same log file
+
+def free_port():
+    """
+    Find a free TCP port on the host to publish a container port on.
+
+    Returns:
+        int: The port number.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def parse_probe(spec):
+    """
+    Parse an active probe specification.
+
+    Args:
+        spec (str): "tcp:PORT" or "http:PORT/PATH", the port being the container port.
+
+    Returns:
+        tuple: ("tcp", port, None) or ("http", port, path).
+
+    Raises:
+        ValueError: If the specification is not understood.
+    """
+    match = re.fullmatch(r"(tcp|http):(\d+)(/.*)?", spec)
+    if not match or (match.group(1) == "tcp" and match.group(3)):
+        raise ValueError(f"Invalid readiness probe {spec!r}, expected tcp:PORT or http:PORT/PATH")
+    kind, port, path = match.groups()
+    return kind, int(port), (path or "/") if kind == "http" else None
+
+def probe_name(probe):
+    """
+    Name of a probe as recorded in the results.
+
+    Args:
+        probe (tuple): A probe returned by parse_probe.
+
+    Returns:
+        str: "tcp:PORT" or "http:PORT/PATH".
+    """
+    kind, port, path = probe
+    return f"{kind}:{port}{path or ''}"
+
+class ReadinessEngine:
+    """
+    Watch a container process until one of its readiness signals fires.
+
+    The signals are the log patterns, matched together in a single regular
+    expression pass over every line, and the active probes, each polled in
+    its own thread against the host port the container port is published on.
+    Without any signal, the container is ready when it exits successfully.
+
+    Args:
+        patterns (list): Regular expressions of ready log lines.
+        probes (list): Probes returned by parse_probe.
+        ports (dict): Container port to the published host port of every probe.
+        log (file): Text file the output is teed to with timestamps, optional.
+        label (str): Prefix of the lines in the log file, e.g. the container name.
+    """
+
+    def __init__(self, patterns=(), probes=(), ports=None, log=None, label=""):
+        self.patterns = list(patterns)
+        self.regex = re.compile(
+            "|".join(f"(?P<log{k}>{pattern})" for k, pattern in enumerate(self.patterns))
+        ) if self.patterns else None
+        self.probes = list(probes)
+        self.ports = ports or {}
+        self.log = log
+        self.label = label
+        self.lock = threading.Lock()
+        self.fired = None
+        self.stop_event = threading.Event()
+
+    @property
+    def long_running(self):
+        """Whether the container keeps running once ready, so readiness comes from a signal."""
+        return bool(self.patterns or self.probes)
+
+    def fire(self, signal, timestamp):
+        with self.lock:
+            if self.fired is None:
+                self.fired = (signal, timestamp)
+
+    def start_probes(self, start_time):
+        for probe in self.probes:
+            kind, port, path = probe
+            host_port = self.ports.get(port, port)
+            if kind == "tcp":
+                check = lambda host_port=host_port: tcp_port_open("127.0.0.1", host_port)
+            else:
+                check = lambda host_port=host_port, path=path: http_ready(f"http://127.0.0.1:{host_port}{path}")
+
+            def poll(probe=probe, check=check):
+                if wait_until(lambda: self.stop_event.is_set() or check(), float("inf"), probe_interval):
+                    if not self.stop_event.is_set():
+                        self.fire(probe_name(probe), time.perf_counter() - start_time)
+
+            threading.Thread(target=poll, daemon=True).start()
+
+    def tee(self, timestamp, line):
+        if self.log:
+            with log_lock:
+                self.log.write(f"{timestamp:10.3f} {self.label}: {line}\n")
+
+    def watch(self, process, start_time):
+        """
+        Read the output of a process until it is ready or its output ends.
+
+        Args:
+            process (subprocess.Popen): The container process, with stdout as a binary pipe.
+            start_time (float): time.perf_counter() when the process was started.
+
+        Returns:
+            tuple: The signal that fired first ("log:K" for the K-th pattern, the
+                probe name, "exit" for a successful exit, None if the container
+                never became ready), the ready time in seconds since start_time,
+                and the (seconds since start, line) events of the output.
+        """
+        events = []
+        pending = b""
+        self.start_probes(start_time)
+        selector = selectors.DefaultSelector()
+        selector.register(process.stdout, selectors.EVENT_READ)
+        try:
+            while self.fired is None:
+                if not selector.select(timeout=probe_interval):
+                    continue
+                data = os.read(process.stdout.fileno(), read_size)
+                timestamp = time.perf_counter() - start_time
+                if not data:
+                    break
+                pending += data
+                *lines, pending = pending.replace(b"\r\n", b"\n").replace(b"\r", b"\n").split(b"\n")
+                for raw in lines:
+                    line = raw.decode(errors="replace")
+                    events.append((timestamp, line))
+                    self.tee(timestamp, line)
+                    match = self.regex.search(line) if self.regex else None
+                    if match:
+                        # Index of the pattern that matched, patterns may have groups of their own
+                        index = next(k for k in range(len(self.patterns)) if match.group(f"log{k}") is not None)
+                        self.fire(f"log:{index}", timestamp)
+                        break
+        finally:
+            selector.close()
+            self.stop_event.set()
+
+        if pending and self.fired is None:
+            line = pending.decode(errors="replace")
+            events.append((time.perf_counter() - start_time, line))
+            self.tee(events[-1][0], line)
+        if self.fired is not None:
+            signal, ready_time = self.fired
+            return signal, ready_time, events
+        if not self.long_running and process.wait() == 0:
+            return "exit", time.perf_counter() - start_time, events
+        return None, None, events
@@ -0,0 +1,527 @@
+import argparse
+import collections
+import json
+import re
+import threading
+import time
+
+# Registry access tracer: the shaping proxy feeds it the bytes of every
+# connection, and it parses the HTTP/1.1 exchanges to log each manifest,
+# blob and Range request made while a container runs. Only plain HTTP
+# registries (--insecure-registry) can be traced, and requests redirected
+# to another host are not seen.
+
+request_pattern = re.compile(r"^(?P<method>[A-Z]+) (?P<target>\S+) HTTP/1\.[01]$")
+# Request line
+
+status_pattern = re.compile(r"^HTTP/1\.[01] (?P<status>\d{3})")
+# Status line
+
+manifest_pattern = re.compile(r"^/v2/(?P<repository>.+)/manifests/(?P<reference>[^/]+)$")
+blob_pattern = re.compile(r"^/v2/(?P<repository>.+)/blobs/(?P<digest>[^/]+)$")
+# Registry API paths of manifests and blobs
+
+range_pattern = re.compile(r"bytes=(\d+)-(\d*)")
+content_range_pattern = re.compile(r"bytes (\d+)-(\d+)/")
+# Range request header and the Content-Range of its response
+
+max_manifest = 4 << 20
+# Largest manifest body kept to learn the layers of the image
+
+size_buckets = [4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20]
+# Upper bounds in bytes of the request size histogram, larger requests go in a last bucket
+
+def format_size(size):
+    """
+    Format a size in bytes with a binary unit.
+
+    Args:
+        size (int): The size in bytes.
+
+    Returns:
+        str: The size, e.g. "64KiB".
+    """
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024 or unit == "MiB":
+            return f"{size:g}{unit}" if size == int(size) else f"{size:.1f}{unit}"
+        size /= 1024
+
+def parse_head(head):
+    """
+    Split the head of an HTTP message into its start line and headers.
+
+    Args:
+        head (bytes): The message up to the empty line.
+
+    Returns:
+        tuple: The start line and a dict of the headers with lowercase names.
+    """
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+class ConnectionTrace:
+    """
+    HTTP/1.1 parser of one proxied connection.
+
+    Requests are matched to responses in order, so pipelined and kept-alive
+    connections are traced as well. A connection that does not speak HTTP
+    is ignored from the first unparsable message on.
+
+    Args:
+        tracer (RegistryTracer): The tracer the completed exchanges are reported to.
+        connection (int): The connection number.
+    """
+
+    def __init__(self, tracer, connection):
+        self.tracer = tracer
+        self.connection = connection
+        self.request_buffer = b""
+        self.request_body = 0
+        self.response_buffer = b""
+        self.pending = collections.deque()
+        self.response = None
+        self.broken = False
+
+    def client_data(self, data):
+        """Feed bytes sent by the client, as they leave the client."""
+        try:
+            self.parse_requests(data, time.perf_counter())
+        except (ValueError, IndexError):
+            # Tracing must never break the proxied connection
+            self.broken = True
+
+    def upstream_data(self, data):
+        """Feed bytes sent by the registry, as they reach the client."""
+        try:
+            self.parse_responses(data, time.perf_counter())
+        except (ValueError, IndexError):
+            self.broken = True
+
+    def parse_requests(self, data, now):
+        self.request_buffer += data
+        while not self.broken:
+            if self.request_body:
+                skipped = min(self.request_body, len(self.request_buffer))
+                self.request_buffer = self.request_buffer[skipped:]
+                self.request_body -= skipped
+                if self.request_body:
+                    return
+            end = self.request_buffer.find(b"\r\n\r\n")
+            if end < 0:
+                return
+            line, headers = parse_head(self.request_buffer[:end])
+            self.request_buffer = self.request_buffer[end + 4:]
+            match = request_pattern.match(line)
+            if not match:
+                self.broken = True
+                return
+            request = {
+                "start": now,
+                "method": match.group("method"),
+                "path": match.group("target").split("?", 1)[0],
+                "range": headers.get("range"),
+            }
+            self.pending.append(request)
+            self.request_body = int(headers.get("content-length", 0) or 0)
+
+    def parse_responses(self, data, now):
+        self.response_buffer += data
+        while self.response_buffer and not self.broken:
+            if self.response is None and not self.read_head(now):
+                return
+            if not self.read_body():
+                return
+            self.finish(now)
+
+    def read_head(self, now):
+        while True:
+            end = self.response_buffer.find(b"\r\n\r\n")
+            if end < 0:
+                return False
+            line, headers = parse_head(self.response_buffer[:end])
+            self.response_buffer = self.response_buffer[end + 4:]
+            match = status_pattern.match(line)
+            if not match or not self.pending:
+                self.broken = True
+                return False
+            status = int(match.group("status"))
+            # Skip interim responses, the final one follows
+            if not 100 <= status < 200:
+                break
+        request = self.pending[0]
+        self.response = {
+            "status": status,
+            "first": now,
+            "headers": headers,
+            "length": 0,
+            "body": b"",
+            "keep": "/manifests/" in request["path"],
+            "chunk": None,
+        }
+        if request["method"] == "HEAD" or status in (204, 304):
+            self.response["remaining"] = 0
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            self.response["remaining"] = None
+            self.response["chunk"] = "size"
+        elif "content-length" in headers:
+            self.response["remaining"] = int(headers["content-length"])
+        else:
+            # Body delimited by the end of the connection
+            self.response["remaining"] = -1
+        return True
+
+    def take(self, size):
+        data = self.response_buffer[:size]
+        self.response_buffer = self.response_buffer[size:]
+        self.response["length"] += len(data)
+        if self.response["keep"] and len(self.response["body"]) < max_manifest:
+            self.response["body"] += data
+        return len(data)
+
+    def read_body(self):
+        response = self.response
+        if response["chunk"] is None:
+            if response["remaining"] < 0:
+                self.take(len(self.response_buffer))
+                return False
+            response["remaining"] -= self.take(response["remaining"])
+            return response["remaining"] == 0
+        # Chunked transfer encoding
+        while True:
+            if response["chunk"] == "data":
+                response["remaining"] -= self.take(response["remaining"])
+                if response["remaining"]:
+                    return False
+                response["chunk"] = "end"
+            end = self.response_buffer.find(b"\r\n")
+            if end < 0:
+                return False
+            line = self.response_buffer[:end]
+            self.response_buffer = self.response_buffer[end + 2:]
+            if response["chunk"] == "end":
+                response["chunk"] = "size"
+            elif response["chunk"] == "size":
+                size = int(line.split(b";")[0], 16)
+                response["chunk"] = "data" if size else "trailer"
+                response["remaining"] = size
+            elif not line:
+                # Empty line ending the trailer
+                return True
+
+    def finish(self, now):
+        request = self.pending.popleft()
+        response = self.response
+        self.response = None
+        self.tracer.add(request, response, now, self.connection)
+
+    def close(self):
+        """End of the connection, completing a response delimited by it."""
+        if self.response is not None and self.response["remaining"] == -1 and not self.broken:
+            self.finish(time.perf_counter())
+
+class RegistryTracer:
+    """
+    Collect the registry requests seen by a ShapingProxy.
+
+    Requests are only recorded between begin and end, so each run gets its
+    own trace. The layers of every image are learnt from the manifests that
+    go through the proxy, to compare the bytes fetched with the image size.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.origin = None
+        self.records = None
+        self.layers = {}
+
+    def connection(self):
+        """
+        Start tracing a new connection.
+
+        Returns:
+            ConnectionTrace: The parser the proxy feeds the connection bytes to.
+        """
+        with self.lock:
+            self.connections += 1
+            return ConnectionTrace(self, self.connections)
+
+    def begin(self):
+        """Start recording the requests of a run."""
+        with self.lock:
+            self.origin = time.perf_counter()
+            self.records = []
+
+    def end(self):
+        """
+        Stop recording.
+
+        Returns:
+            list: The requests completed since begin, in completion order.
+        """
+        with self.lock:
+            records, self.records = self.records or [], None
+        return records
+
+    def add(self, request, response, now, connection):
+        kind, repository, target = "other", None, request["path"]
+        match = manifest_pattern.match(request["path"])
+        if match:
+            kind, repository, target = "manifest", match.group("repository"), match.group("reference")
+        match = blob_pattern.match(request["path"])
+        if match:
+            kind, repository, target = "blob", match.group("repository"), match.group("digest")
+
+        offset = 0
+        content_range = content_range_pattern.match(response["headers"].get("content-range", ""))
+        requested = range_pattern.match(request["range"] or "")
+        if content_range:
+            offset = int(content_range.group(1))
+        elif requested and response["status"] == 206:
+            offset = int(requested.group(1))
+
+        if kind == "manifest" and response["status"] == 200 and request["method"] == "GET":
+            self.learn_layers(repository, response["body"])
+
+        with self.lock:
+            if self.records is None:
+                return
+            self.records.append({
+                "t": round(request["start"] - self.origin, 6),
+                "ttfb": round(response["first"] - request["start"], 6),
+                "latency": round(now - request["start"], 6),
+                "connection": connection,
+                "method": request["method"],
+                "kind": kind,
+                "repository": repository,
+                "target": target,
+                "status": response["status"],
+                "range": request["range"] is not None,
+                "offset": offset,
+                "length": response["length"],
+            })
+
+    def learn_layers(self, repository, body):
+        try:
+            manifest = json.loads(body)
+        except ValueError:
+            return
+        if isinstance(manifest, dict) and "layers" in manifest:
+            with self.lock:
+                self.layers[repository] = {
+                    layer["digest"]: layer["size"] for layer in manifest["layers"]
+                }
+
+    def image_layers(self, repository):
+        """
+        Get the layers learnt for an image.
+
+        Args:
+            repository (str): The repository of the image, e.g. "ghost".
+
+        Returns:
+            dict: Layer digest to size in bytes, empty if no manifest was seen.
+        """
+        with self.lock:
+            return dict(self.layers.get(repository, {}))
+
+def covered_bytes(records):
+    """
+    Count the distinct bytes of the blobs fetched, counting overlapping ranges once.
+
+    Args:
+        records (list): The traced requests.
+
+    Returns:
+        int: The number of distinct blob bytes.
+    """
+    intervals = collections.defaultdict(list)
+    for record in records:
+        if record["kind"] == "blob" and record["length"]:
+            intervals[record["target"]].append((record["offset"], record["offset"] + record["length"]))
+    total = 0
+    for spans in intervals.values():
+        end = 0
+        for first, last in sorted(spans):
+            if last > end:
+                total += last - max(first, end)
+                end = last
+    return total
+
+def size_histogram(sizes):
+    """
+    Count the request sizes in size_buckets.
+
+    Args:
+        sizes (list): The request sizes in bytes.
+
+    Returns:
+        dict: Bucket label ("<=64KiB", ..., ">16MiB") to number of requests.
+    """
+    labels = [f"<={format_size(bound)}" for bound in size_buckets] + [f">{format_size(size_buckets[-1])}"]
+    counts = dict.fromkeys(labels, 0)
+    for size in sizes:
+        index = next((k for k, bound in enumerate(size_buckets) if size <= bound), len(size_buckets))
+        counts[labels[index]] += 1
+    return counts
+
+def max_in_flight(records):
+    """
+    Largest number of requests outstanding at the same time.
+
+    Args:
+        records (list): The traced requests.
+
+    Returns:
+        int: The peak number of concurrent requests.
+    """
+    events = sorted(
+        [(record["t"], 1) for record in records] + [(record["t"] + record["latency"], -1) for record in records]
+    )
+    peak = current = 0
+    for _, change in events:
+        current += change
+        peak = max(peak, current)
+    return peak
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+def access_profile(records, layers):
+    """
+    Summarize the registry accesses of a run.
+
+    Args:
+        records (list): The traced requests.
+        layers (dict): Layer digest to size of the image.
+
+    Returns:
+        dict: Number of requests by kind, bytes fetched, distinct blob bytes,
+            image size, fraction of the layer bytes fetched, blob request size
+            percentiles and histogram, peak concurrency and the time from the
+            first request to the last response.
+    """
+    blobs = [record for record in records if record["kind"] == "blob" and record["status"] in (200, 206)]
+    sizes = [record["length"] for record in blobs]
+    image_bytes = sum(layers.values()) or None
+    unique = covered_bytes(blobs)
+    layer_bytes = covered_bytes([record for record in blobs if record["target"] in layers])
+    return {
+        "requests": len(records),
+        "manifests": sum(record["kind"] == "manifest" for record in records),
+        "blobs": len(blobs),
+        "ranges": sum(record["range"] for record in blobs),
+        "bytes": sum(record["length"] for record in records),
+        "unique_bytes": unique,
+        "image_bytes": image_bytes,
+        "fetched_fraction": layer_bytes / image_bytes if image_bytes else None,
+        "size_p50": percentile(sizes, 50),
+        "size_p95": percentile(sizes, 95),
+        "size_max": max(sizes, default=None),
+        "size_histogram": size_histogram(sizes),
+        "max_in_flight": max_in_flight(records),
+        "duration": max((record["t"] + record["latency"] for record in records), default=0)
+                    - min((record["t"] for record in records), default=0),
+    }
+
+def timeline(records, layers):
+    """
+    Compact ordering of the blob requests over time.
+
+    Args:
+        records (list): The traced requests.
+        layers (dict): Layer digest to size of the image, in manifest order.
+
+    Returns:
+        list: [start time in ms, layer index (-1 if unknown), offset, length] per blob request.
+    """
+    index = {digest: k for k, digest in enumerate(layers)}
+    return [
+        [round(record["t"] * 1000, 1), index.get(record["target"], -1), record["offset"], record["length"]]
+        for record in sorted(records, key=lambda record: record["t"])
+        if record["kind"] == "blob"
+    ]
+
+def write_trace(path, run, records, layers):
+    """
+    Write the trace of a run as JSON.
+
+    Args:
+        path (str): The output file.
+        run (dict): Description of the run (container, snapshotter, iteration, RTT, ...).
+        records (list): The traced requests.
+        layers (dict): Layer digest to size of the image.
+    """
+    with open(path, "w") as f:
+        json.dump(dict(run, layers=layers, requests=records), f, separators=(",", ":"))
+
+def load_trace(path):
+    """
+    Load a trace written by write_trace.
+
+    Args:
+        path (str): The trace file.
+
+    Returns:
+        dict: The run description, with its "layers" and "requests".
+    """
+    with open(path) as f:
+        return json.load(f)
+
+def profile_traces(paths):
+    """
+    Build one access profile per (image, snapshotter, cache state) from run traces.
+
+    Numbers are averaged over the runs, the size histograms are summed, and
+    the request timeline is the one of the first run.
+
+    Args:
+        paths (list): Trace files.
+
+    Returns:
+        list: One profile dict per (container, snapshotter, cache_state), with the number of runs.
+    """
+    grouped = collections.defaultdict(list)
+    for path in paths:
+        trace = load_trace(path)
+        grouped[(trace["container"], trace["snapshotter"], trace.get("cache_state", "cold"))].append(trace)
+    profiles = []
+    for (container, snapshotter, cache_state), traces in sorted(grouped.items()):
+        runs = [access_profile(trace["requests"], trace["layers"]) for trace in traces]
+        profile = {"container": container, "snapshotter": snapshotter, "cache_state": cache_state,
+                   "runs": len(runs)}
+        for key, value in runs[0].items():
+            if key == "size_histogram":
+                profile[key] = {label: sum(run[key][label] for run in runs) for label in value}
+            else:
+                values = [run[key] for run in runs if run[key] is not None]
+                profile[key] = sum(values) / len(values) if values else None
+        profile["timeline"] = timeline(traces[0]["requests"], traces[0]["layers"])
+        profiles.append(profile)
+    return profiles
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build per-image access profiles from registry traces.")
+    parser.add_argument('traces', nargs='+', help="Trace files written by bench.py --trace.")
+    parser.add_argument('--out', type=str, default="access_profiles.json", help="Output JSON file.")
+    args = parser.parse_args()
+    profiles = profile_traces(args.traces)
+    with open(args.out, "w") as f:
+        json.dump(profiles, f, indent=1)
+    print(f"{'Container':<12} {'Snapshotter':<11} {'Cache':<9} {'Runs':>4} {'Requests':>8} {'Ranges':>7} "
+          f"{'Fetched':>10} {'Image':>10} {'Fraction':>8} {'P50 Size':>9}")
+    for profile in profiles:
+        fraction = "" if profile["fetched_fraction"] is None else f"{profile['fetched_fraction']:.1%}"
+        image = "" if profile["image_bytes"] is None else format_size(round(profile["image_bytes"]))
+        p50 = "" if profile["size_p50"] is None else format_size(round(profile["size_p50"]))
+        print(f"{profile['container']:<12} {profile['snapshotter']:<11} {profile['cache_state']:<9} {profile['runs']:>4} "
+              f"{profile['requests']:>8.1f} {profile['ranges']:>7.1f} {format_size(round(profile['bytes'])):>10} "
+              f"{image:>10} {fraction:>8} {p50:>9}")
+    print(f"Saved {args.out}")
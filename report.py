@@ -0,0 +1,284 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from analysis import cell_columns, build_parser, load_runs, select_runs, aggregate, plot_cells
+
+# Statistical report: percentiles and bootstrap confidence intervals of the
+# provisioning time of every cell, of the acceleration rate against the
+# baseline, and a significance test between snapshotters. All cells are
+# bootstrapped together as one padded NumPy array instead of cell by cell.
+
+n_boot = 2000
+# Number of bootstrap resamples
+
+confidence = 0.95
+# Confidence level of the intervals
+
+alpha = 0.05
+# Significance level of the tests, applied to the Benjamini-Hochberg adjusted p-values
+
+max_elements = 20_000_000
+# Largest number of resampled values drawn at once, cells are processed in chunks below it
+
+def sample_matrix(runs, column="seconds"):
+    """
+    Arrange the samples of every cell in one NaN-padded matrix.
+
+    Args:
+        runs (pandas.DataFrame): The selected runs.
+        column (str): The measured column.
+
+    Returns:
+        tuple: The cell MultiIndex, the number of samples of each cell and
+            the (cells, max samples) matrix of samples.
+    """
+    runs = runs.dropna(subset=[column])
+    grouped = runs.groupby(cell_columns, sort=True)
+    counts = grouped.size()
+    matrix = np.full((len(counts), counts.max()), np.nan)
+    matrix[grouped.ngroup().to_numpy(), grouped.cumcount().to_numpy()] = runs[column].to_numpy()
+    return counts.index, counts.to_numpy(), matrix
+
+def bootstrap_means(matrix, counts, n_boot=n_boot, seed=0):
+    """
+    Bootstrap the mean of every cell at once.
+
+    Each cell is resampled with replacement from its own samples only; the
+    padding of cells with fewer samples is masked out.
+
+    Args:
+        matrix (numpy.ndarray): The (cells, max samples) matrix of sample_matrix.
+        counts (numpy.ndarray): The number of samples of each cell.
+        n_boot (int): Number of bootstrap resamples.
+        seed (int): Seed of the random generator, for reproducible reports.
+
+    Returns:
+        numpy.ndarray: The (cells, n_boot) bootstrap means.
+    """
+    rng = np.random.default_rng(seed)
+    cells, width = matrix.shape
+    means = np.empty((cells, n_boot))
+    chunk = max(1, max_elements // (n_boot * width))
+    for start in range(0, cells, chunk):
+        values = matrix[start:start + chunk]
+        n = counts[start:start + chunk]
+        picks = (rng.random((len(values), n_boot, width)) * n[:, None, None]).astype(np.intp)
+        draws = np.take_along_axis(values[:, None, :], picks, axis=2)
+        mask = np.arange(width) < n[:, None, None]
+        means[start:start + chunk] = np.where(mask, draws, 0.0).sum(axis=2) / n[:, None]
+    return means
+
+def interval(boot, confidence=confidence):
+    """
+    Percentile interval of bootstrap replicates.
+
+    Args:
+        boot (numpy.ndarray): The (cells, n_boot) replicates.
+        confidence (float): Confidence level of the interval.
+
+    Returns:
+        tuple: The lower and upper bound of every cell.
+    """
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.nanpercentile(boot, [tail, 100 - tail], axis=1)
+    return low, high
+
+def permutation_p_values(matrix_a, counts_a, matrix_b, counts_b, n_perm=n_boot, seed=0):
+    """
+    Two-sided permutation p-values of the difference of the means of pairs of cells.
+
+    Under the null hypothesis both cells of a pair come from the same
+    distribution, so their runs are pooled and split again at random into
+    groups of the original sizes. The p-value is the fraction of splits whose
+    difference of means is at least as large as the observed one. Unlike the
+    percentile bootstrap, the test keeps its level with a handful of runs.
+
+    Args:
+        matrix_a (numpy.ndarray): The (cells, max samples) NaN-padded samples of the first set.
+        counts_a (numpy.ndarray): The number of samples of each cell of the first set.
+        matrix_b (numpy.ndarray): The samples of the matching cells of the second set.
+        counts_b (numpy.ndarray): The number of samples of each cell of the second set.
+        n_perm (int): Number of random splits.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        numpy.ndarray: The p-value of every pair, at least 1 / (n_perm + 1).
+    """
+    rng = np.random.default_rng(seed)
+    # Pool the runs of every pair, the padding of both sets is moved to the end
+    pooled = np.concatenate([matrix_a, matrix_b], axis=1)
+    valid = np.concatenate([np.arange(matrix_a.shape[1]) < counts_a[:, None],
+                            np.arange(matrix_b.shape[1]) < counts_b[:, None]], axis=1)
+    order = np.argsort(~valid, axis=1, kind="stable")
+    pooled = np.where(np.take_along_axis(valid, order, axis=1), np.take_along_axis(pooled, order, axis=1), 0.0)
+    cells, width = pooled.shape
+    n_a, n_b = counts_a[:, None], counts_b[:, None]
+    total = pooled.sum(axis=1, keepdims=True)
+    observed = np.abs(np.nansum(matrix_a, axis=1, keepdims=True) / n_a
+                      - np.nansum(matrix_b, axis=1, keepdims=True) / n_b)
+    # Differences within rounding of the observed one count as at least as large
+    tolerance = 1e-9 * np.maximum(np.abs(total) / (n_a + n_b), 1e-12)
+
+    extreme = np.empty(cells)
+    chunk = max(1, max_elements // (n_perm * width))
+    positions = np.arange(width)
+    for start in range(0, cells, chunk):
+        end = min(start + chunk, cells)
+        size = (n_a + n_b)[start:end, :, None]
+        keys = rng.random((end - start, n_perm, width))
+        keys[np.broadcast_to(positions >= size, keys.shape)] = np.inf
+        # The first n_a positions of the random order form the first group
+        ranks = np.argsort(np.argsort(keys, axis=2), axis=2)
+        in_a = ranks < n_a[start:end, :, None]
+        sum_a = (pooled[start:end, None, :] * in_a).sum(axis=2)
+        diff = np.abs(sum_a / n_a[start:end] - (total[start:end] - sum_a) / n_b[start:end])
+        extreme[start:end] = (diff >= observed[start:end] - tolerance[start:end]).sum(axis=1)
+    return (extreme + 1) / (n_perm + 1)
+
+def adjust_p_values(p_values):
+    """
+    Benjamini-Hochberg adjustment for testing many cells at once.
+
+    Args:
+        p_values (numpy.ndarray): The raw p-values.
+
+    Returns:
+        numpy.ndarray: The adjusted p-values (q-values), in the same order.
+    """
+    m = len(p_values)
+    if m == 0:
+        return p_values
+    order = np.argsort(p_values)
+    ranked = p_values[order] * m / np.arange(1, m + 1)
+    adjusted = np.minimum.accumulate(ranked[::-1])[::-1]
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+def summarize(runs, baseline="overlayfs", n_boot=n_boot, seed=0):
+    """
+    Compute the per-cell statistics and the pairwise comparisons of the snapshotters.
+
+    Args:
+        runs (pandas.DataFrame): The selected runs.
+        baseline (str): The snapshotter the acceleration rate is relative to.
+        n_boot (int): Number of bootstrap resamples.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        tuple: The summary frame indexed by cell_columns (n, mean, CI, p50/p95/p99,
+            mean fetch count, acceleration and its CI) and the comparisons frame with
+            one row per (bandwidth, container, RTT, snapshotter pair).
+    """
+    index, counts, matrix = sample_matrix(runs)
+    boot = bootstrap_means(matrix, counts, n_boot, seed)
+    low, high = interval(boot)
+
+    summary = pd.DataFrame({"n": counts, "mean": np.nanmean(matrix, axis=1),
+                            "ci_low": low, "ci_high": high}, index=index)
+    quantiles = runs.groupby(cell_columns)["seconds"].quantile([0.5, 0.95, 0.99]).unstack()
+    quantiles.columns = ["p50", "p95", "p99"]
+    summary = summary.join(quantiles)
+    summary["metrics_sum"] = runs.groupby(cell_columns)["metrics_sum"].mean()
+
+    # Position of every cell's bootstrap means, to pair cells of two snapshotters
+    position = pd.Series(np.arange(len(index)), index=index)
+    by_snapshotter = position.unstack("snapshotter")
+    snapshotters = list(by_snapshotter.columns)
+
+    summary["acceleration"] = np.nan
+    summary["acceleration_ci_low"] = np.nan
+    summary["acceleration_ci_high"] = np.nan
+    comparisons = []
+    for a, b in itertools.permutations(snapshotters, 2):
+        # Each pair once, with the baseline always on the reference side
+        if b == baseline or (a != baseline and a > b):
+            continue
+        pairs = by_snapshotter[[a, b]].dropna().astype(int)
+        if pairs.empty:
+            continue
+        boot_a = boot[pairs[a].to_numpy()]
+        boot_b = boot[pairs[b].to_numpy()]
+        ratio = boot_a / boot_b
+        ratio_low, ratio_high = interval(ratio)
+        mean_a = summary["mean"].to_numpy()[pairs[a].to_numpy()]
+        mean_b = summary["mean"].to_numpy()[pairs[b].to_numpy()]
+        comparison = pairs.index.to_frame(index=False)
+        comparison["reference"] = a
+        comparison["snapshotter"] = b
+        comparison["reference_mean"] = mean_a
+        comparison["mean"] = mean_b
+        comparison["speedup"] = mean_a / mean_b
+        comparison["speedup_ci_low"] = ratio_low
+        comparison["speedup_ci_high"] = ratio_high
+        comparison["p_value"] = permutation_p_values(
+            matrix[pairs[a].to_numpy()], counts[pairs[a].to_numpy()],
+            matrix[pairs[b].to_numpy()], counts[pairs[b].to_numpy()], n_boot, seed,
+        )
+        comparisons.append(comparison)
+
+        if a == baseline:
+            cells = pd.MultiIndex.from_frame(
+                pairs.index.to_frame(index=False).assign(snapshotter=b)[cell_columns]
+            )
+            summary.loc[cells, "acceleration"] = mean_a / mean_b
+            summary.loc[cells, "acceleration_ci_low"] = ratio_low
+            summary.loc[cells, "acceleration_ci_high"] = ratio_high
+
+    if comparisons:
+        comparisons = pd.concat(comparisons, ignore_index=True)
+        comparisons["q_value"] = adjust_p_values(comparisons["p_value"].to_numpy())
+        comparisons["significant"] = comparisons["q_value"] < alpha
+    else:
+        comparisons = pd.DataFrame()
+    baseline_cells = summary.index.get_level_values("snapshotter") == baseline
+    summary.loc[baseline_cells, ["acceleration", "acceleration_ci_low", "acceleration_ci_high"]] = 1.0
+    return summary, comparisons
+
+def write_table(frame, path):
+    """
+    Write a table as CSV or JSON, depending on the extension.
+
+    Args:
+        frame (pandas.DataFrame): The table.
+        path (str): The output file, .json for JSON records, CSV otherwise.
+    """
+    frame = frame.reset_index() if frame.index.name or frame.index.nlevels > 1 else frame
+    if os.path.splitext(path)[1] == ".json":
+        frame.to_json(path, orient="records", indent=1)
+    else:
+        frame.to_csv(path, index=False, float_format="%.6g")
+    print(f"Saved {path}")
+
+if __name__ == "__main__":
+    parser = build_parser("Report percentiles, bootstrap confidence intervals and significance per cell.")
+    parser.add_argument('--boot', type=int, default=n_boot, help="Number of bootstrap resamples.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the bootstrap.")
+    parser.add_argument('--alpha', type=float, default=alpha, help="Significance level of the adjusted p-values.")
+    parser.add_argument('--summary', type=str, default="report_summary.csv",
+                        help="Per-cell summary table (.csv or .json).")
+    parser.add_argument('--comparisons', type=str, default="report_comparisons.csv",
+                        help="Per-cell comparison table between snapshotters (.csv or .json).")
+    parser.add_argument('--out', type=str, default="Report.png", help="Output figure with error bars.")
+    parser.add_argument('--no-show', action='store_true', help="Only save the figures.")
+    args = parser.parse_args()
+    alpha = args.alpha
+
+    runs = select_runs(load_runs(args.sources, use_cache=not args.no_cache),
+                       args.snapshotters, args.bandwidths, args.containers, args.cache_state)
+    summary, comparisons = summarize(runs, args.baseline, args.boot, args.seed)
+    write_table(summary, args.summary)
+    if not comparisons.empty:
+        write_table(comparisons, args.comparisons)
+        print(f"{int(comparisons['significant'].sum())} of {len(comparisons)} cell comparisons are significant "
+              f"at q < {alpha}")
+
+    cells = aggregate(runs, args.baseline)
+    errors = {
+        "seconds": (summary["ci_low"], summary["ci_high"]),
+        "acceleration": (summary["acceleration_ci_low"], summary["acceleration_ci_high"]),
+    }
+    plot_cells(cells, runs, args.out, baseline=args.baseline, errors=errors, show=not args.no_show)
@@ -0,0 +1,357 @@
+import os
+import subprocess
+import threading
+import time
+
+# Resource accounting: what a run costs the services that provision the
+# container (containerd and the remote snapshotter) in CPU time, memory,
+# disk I/O, network traffic and context switches. The counters are read from
+# the cgroups of the systemd units when the cgroup v2 hierarchy is mounted,
+# and from /proc/<pid> otherwise. Resident memory has no per-run counter, so
+# it is sampled in the background for its peak. Like the metrics sampler,
+# the monitor measures its own polling time and CPU time.
+
+cgroup_root = "/sys/fs/cgroup"
+# Mount point of the cgroup v2 hierarchy
+
+sample_interval = 0.05
+# Delay in seconds between two samples of the resident memory
+
+resource_fields = ["cpu_seconds", "peak_rss_bytes", "disk_read_bytes", "disk_write_bytes", "net_bytes",
+                   "context_switches"]
+# Totals returned for every run, summed over the services
+
+clock_ticks = os.sysconf("SC_CLK_TCK")
+# Clock ticks per second of the CPU times of /proc/<pid>/stat
+
+def service_cgroup(service):
+    """
+    Find the cgroup v2 directory of a systemd unit.
+
+    Args:
+        service (str): The systemd unit, e.g. containerd or stargz-snapshotter.
+
+    Returns:
+        str: The cgroup directory, None if the unit or the cgroup v2 hierarchy is missing.
+    """
+    try:
+        completed_process = subprocess.run(
+            ["systemctl", "show", "-p", "ControlGroup", "--value", service], capture_output=True, text=True
+        )
+    except FileNotFoundError:
+        return None
+    control_group = completed_process.stdout.strip()
+    path = os.path.join(cgroup_root, control_group.lstrip("/"))
+    if not control_group or not os.path.isfile(os.path.join(path, "cgroup.procs")):
+        return None
+    return path
+
+def service_pids(service, cgroup=None):
+    """
+    List the processes of a service.
+
+    Args:
+        service (str): The systemd unit, or the process name when no such unit runs.
+        cgroup (str): The cgroup directory of the unit, None to match the process names
+            (or the script an interpreter runs).
+
+    Returns:
+        list: The process IDs.
+    """
+    if cgroup:
+        try:
+            with open(os.path.join(cgroup, "cgroup.procs")) as f:
+                return [int(line) for line in f if line.strip()]
+        except OSError:
+            return []
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/comm") as f:
+                comm = f.read().strip()
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                argv = f.read().decode(errors="replace").split("\0")
+        except OSError:
+            continue
+        # comm is truncated to 15 characters, and is the interpreter's for scripts
+        if comm == service[:15] or service in {os.path.basename(arg) for arg in argv[:2]}:
+            pids.append(int(entry))
+    return pids
+
+def child_pids(pid):
+    """
+    List the children of a process.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        list: The process IDs of the children of all its threads, empty if the process
+            exited or the kernel does not expose /proc/<pid>/task/<tid>/children.
+    """
+    children = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return children
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return children
+
+def read_process(pid):
+    """
+    Read the cumulative counters of a process.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        dict: CPU seconds including reaped children ("cpu_seconds"), resident memory
+            ("rss_bytes"), context switches and the bytes read from and written to disk
+            ("disk_read_bytes", "disk_write_bytes", None without the permission to read
+            /proc/<pid>/io). None if the process exited.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces, the fields start after it
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+    except (OSError, IndexError):
+        return None
+    counters = {
+        "cpu_seconds": sum(int(value) for value in fields[11:15]) / clock_ticks,
+        "rss_bytes": int(status.get("VmRSS", "0 kB").split()[0]) * 1024,
+        "context_switches": int(status["voluntary_ctxt_switches"]) + int(status["nonvoluntary_ctxt_switches"]),
+        "disk_read_bytes": None,
+        "disk_write_bytes": None,
+    }
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            io = dict(line.split(":", 1) for line in f if ":" in line)
+        counters["disk_read_bytes"] = int(io["read_bytes"])
+        counters["disk_write_bytes"] = int(io["write_bytes"])
+    except (OSError, KeyError):
+        pass
+    return counters
+
+def read_cgroup(path):
+    """
+    Read the cumulative counters of a cgroup, which include its exited processes.
+
+    Args:
+        path (str): The cgroup directory.
+
+    Returns:
+        dict: CPU seconds and the bytes read from and written to disk, None if unreadable.
+    """
+    try:
+        with open(os.path.join(path, "cpu.stat")) as f:
+            cpu = dict(line.split() for line in f if line.strip())
+        read_bytes = write_bytes = 0
+        with open(os.path.join(path, "io.stat")) as f:
+            # One line per device: "MAJ:MIN rbytes=... wbytes=... rios=..."
+            for line in f:
+                stats = dict(field.split("=", 1) for field in line.split()[1:])
+                read_bytes += int(stats.get("rbytes", 0))
+                write_bytes += int(stats.get("wbytes", 0))
+    except (OSError, ValueError):
+        return None
+    return {"cpu_seconds": int(cpu["usage_usec"]) / 1e6, "disk_read_bytes": read_bytes,
+            "disk_write_bytes": write_bytes}
+
+def read_net(pid):
+    """
+    Read the bytes received and sent on the network namespace of a process.
+
+    Network traffic is not accounted per process, so this covers every process
+    of the namespace, the whole host for services on the host network.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        tuple: The namespace and its received plus sent bytes on all non-loopback
+            interfaces, None if the process exited.
+    """
+    try:
+        namespace = os.readlink(f"/proc/{pid}/ns/net")
+        with open(f"/proc/{pid}/net/dev") as f:
+            lines = f.readlines()[2:]
+    except OSError:
+        return None
+    total = 0
+    for line in lines:
+        interface, fields = line.split(":", 1)
+        if interface.strip() != "lo":
+            fields = fields.split()
+            total += int(fields[0]) + int(fields[8])
+    return namespace, total
+
+class ResourceMonitor(threading.Thread):
+    """
+    Account the resources used by a set of services while a container runs.
+
+    The counters are read when the monitor starts and stops, and resident
+    memory is sampled every interval in between. Processes that start during
+    the run count from zero, and the last sample of processes that exit is
+    kept. Without a cgroup, /proc is scanned for the processes of a service
+    until one is found, then only the processes found and their descendants
+    are followed, and the CPU time of a process that exits between two
+    samples is lost. The wall and CPU time of every poll are measured, so the
+    overhead of the monitor is reported with the resources.
+
+    Args:
+        services (list): systemd units, or process names when no such unit runs.
+        interval (float): Delay in seconds between two samples.
+    """
+
+    def __init__(self, services, interval=sample_interval):
+        super().__init__(daemon=True)
+        self.services = list(services)
+        self.interval = interval
+        self.cgroups = {}
+        self.first = {}
+        # (service, pid) to the counters of the process when first seen
+        self.last = {}
+        # (service, pid) to the counters of the process when last seen
+        self.cgroup_first = {}
+        self.cgroup_last = {}
+        self.net_first = {}
+        self.net_last = {}
+        self.peak_rss = {service: 0 for service in self.services}
+        self.peak_total_rss = 0
+        self.pids = {}
+        # Service without a cgroup to the processes followed
+        self.poll_times = []
+        self.cpu_time = 0.0
+        self.start_time = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def follow(self, service):
+        # Scanning /proc on every poll would cost more than what it measures, so it is
+        # only scanned until a process of the service is found
+        pids = {pid for pid in self.pids[service] if os.path.isdir(f"/proc/{pid}")}
+        if not pids:
+            pids = set(service_pids(service))
+        queue = list(pids)
+        while queue:
+            for child in child_pids(queue.pop()):
+                if child not in pids:
+                    pids.add(child)
+                    queue.append(child)
+        self.pids[service] = pids
+        return sorted(pids)
+
+    def poll(self, initial=False):
+        poll_start, cpu_start = time.perf_counter(), time.thread_time()
+        if initial:
+            self.pids = {service: set() for service in self.services if not self.cgroups.get(service)}
+        total_rss = 0
+        for service in self.services:
+            cgroup = self.cgroups.get(service)
+            rss = 0
+            for pid in service_pids(service, cgroup) if cgroup else self.follow(service):
+                counters = read_process(pid)
+                if counters is None:
+                    continue
+                key = (service, pid)
+                if key not in self.first:
+                    # Started during the run, everything it used belongs to the run
+                    self.first[key] = counters if initial else dict.fromkeys(counters, 0)
+                self.last[key] = counters
+                rss += counters["rss_bytes"]
+                net = read_net(pid)
+                if net is not None:
+                    namespace, total = net
+                    self.net_first.setdefault(namespace, total)
+                    self.net_last[namespace] = total
+            if cgroup:
+                counters = read_cgroup(cgroup)
+                if counters is not None:
+                    self.cgroup_first.setdefault(service, counters)
+                    self.cgroup_last[service] = counters
+            self.peak_rss[service] = max(self.peak_rss[service], rss)
+            total_rss += rss
+        self.peak_total_rss = max(self.peak_total_rss, total_rss)
+        self.poll_times.append(time.perf_counter() - poll_start)
+        self.cpu_time += time.thread_time() - cpu_start
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                self.poll()
+
+    def start(self):
+        # The units are restarted by the resets, so they are looked up again for every run
+        self.cgroups = {service: service_cgroup(service) for service in self.services}
+        self.start_time = time.perf_counter()
+        self.poll(initial=True)
+        super().start()
+
+    def stop(self):
+        """
+        Stop sampling and compute the resources used since the monitor started.
+
+        Returns:
+            dict: The totals of resource_fields over all services, with the totals of
+                every service under "services". A field is None when it could not
+                be read for any process, e.g. disk I/O without root. The overhead of
+                the monitor is under "monitor": number of polls, mean and max poll
+                time in seconds, CPU seconds spent polling and the fraction of the
+                monitored period spent polling ("duty_cycle").
+        """
+        self.stop_event.set()
+        self.join()
+        with self.lock:
+            self.poll()
+
+        services = {}
+        for service in self.services:
+            keys = [key for key in self.last if key[0] == service]
+            if not keys:
+                services[service] = dict.fromkeys(resource_fields)
+                continue
+
+            def delta(field, keys=keys):
+                values = [self.last[key][field] - self.first[key][field]
+                          for key in keys if self.last[key][field] is not None and self.first[key][field] is not None]
+                return sum(values) if values else None
+
+            totals = {field: delta(field) for field in ["cpu_seconds", "disk_read_bytes", "disk_write_bytes",
+                                                        "context_switches"]}
+            if service in self.cgroup_last:
+                first, last = self.cgroup_first[service], self.cgroup_last[service]
+                totals.update({field: last[field] - first[field] for field in last})
+            totals["peak_rss_bytes"] = self.peak_rss[service]
+            totals["net_bytes"] = None
+            services[service] = {field: totals[field] for field in resource_fields}
+
+        def total(field):
+            values = [totals[field] for totals in services.values() if totals[field] is not None]
+            return sum(values) if values else None
+
+        result = {field: total(field) for field in resource_fields}
+        if self.last:
+            result["peak_rss_bytes"] = self.peak_total_rss
+            # Services sharing a network namespace see the same traffic, count it once
+            result["net_bytes"] = sum(self.net_last[namespace] - self.net_first[namespace]
+                                      for namespace in self.net_last)
+        result["services"] = services
+        duration = time.perf_counter() - self.start_time
+        busy = sum(self.poll_times)
+        result["monitor"] = {
+            "polls": len(self.poll_times),
+            "mean_poll": busy / len(self.poll_times),
+            "max_poll": max(self.poll_times),
+            "cpu_time": self.cpu_time,
+            "duty_cycle": busy / duration if duration > 0 else 0.0,
+        }
+        return result
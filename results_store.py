@@ -0,0 +1,290 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import socket
+import sqlite3
+import time
+import uuid
+
+# Typed results store: one SQLite row per run, with the network conditions
+# and durations as numbers instead of the "100ms" / "1m2.345s" strings of
+# the CSV files, and the metrics next to the time they belong to.
+
+results_db = "fleetbench.sqlite"
+# Default results database
+
+columns = [
+    ("run_id", "TEXT PRIMARY KEY"),
+    ("host", "TEXT"),
+    ("worker", "TEXT"),
+    ("timestamp", "REAL"),
+    ("snapshotter", "TEXT"),
+    ("container", "TEXT"),
+    ("image", "TEXT"),
+    ("bandwidth_mbps", "REAL"),
+    ("rtt_ms", "REAL"),
+    ("iteration", "INTEGER"),
+    ("iteration_id", "TEXT"),
+    ("parallel", "INTEGER"),
+    ("batch", "TEXT"),
+    ("status", "TEXT"),
+    ("seconds", "REAL"),
+    ("resolve_seconds", "REAL"),
+    ("fetch_seconds", "REAL"),
+    ("prepare_seconds", "REAL"),
+    ("start_seconds", "REAL"),
+    ("ready_seconds", "REAL"),
+    ("reset_seconds", "REAL"),
+    ("ready_signal", "TEXT"),
+    ("cache_state", "TEXT"),
+    ("base_images", "TEXT"),
+    ("metrics_sum", "INTEGER"),
+    ("fetch_p50_ms", "REAL"),
+    ("fetch_p95_ms", "REAL"),
+    ("fetch_p99_ms", "REAL"),
+    ("metrics", "TEXT"),
+    ("shaping", "TEXT"),
+    ("measured_rtt_ms", "REAL"),
+    ("measured_mbps", "REAL"),
+    ("registry_requests", "INTEGER"),
+    ("registry_bytes", "INTEGER"),
+    ("cpu_seconds", "REAL"),
+    ("peak_rss_bytes", "INTEGER"),
+    ("disk_read_bytes", "INTEGER"),
+    ("disk_write_bytes", "INTEGER"),
+    ("net_bytes", "INTEGER"),
+    ("context_switches", "INTEGER"),
+    ("resources", "TEXT"),
+    ("source", "TEXT"),
+]
+# Columns of the runs table; metrics holds the per-family deltas and resources the
+# per-service usage as JSON. The attempts of an iteration retried with --resume share
+# their iteration_id, and the one with the latest timestamp supersedes the others
+
+phase_columns = {
+    "Resolve": "resolve_seconds",
+    "Fetch": "fetch_seconds",
+    "Prepare": "prepare_seconds",
+    "Start": "start_seconds",
+    "Ready": "ready_seconds",
+}
+# Phase names of phases.py mapped to their column
+
+legacy_file_pattern = re.compile(r"provisioning_times_(overlayfs|stargz|fleet)_(.*)fleetbench\.csv$")
+# Result file name written by bench.py, with an optional tag such as "200bw_"
+
+def new_run_id():
+    """
+    Generate a unique run ID.
+
+    Returns:
+        str: A random hexadecimal ID.
+    """
+    return uuid.uuid4().hex
+
+def parse_time(time_str):
+    """
+    Parse a time of the result files.
+
+    Args:
+        time_str (str): A time such as "1m2.345s", or a timeout marker.
+
+    Returns:
+        float: The time in seconds, None if the run did not complete.
+    """
+    match = re.fullmatch(r"(\d+)m([\d.]+)s", time_str.strip())
+    if not match:
+        return None
+    return int(match.group(1)) * 60 + float(match.group(2))
+
+def parse_unit(value, unit):
+    """
+    Parse a value of the result files with a unit suffix.
+
+    Args:
+        value (str): A value such as "100ms" or "500Mbps".
+        unit (str): The unit suffix.
+
+    Returns:
+        float: The number without its unit.
+    """
+    return float(value.strip().removesuffix(unit))
+
+def parse_float(value):
+    """
+    Parse an optional number of the result files.
+
+    Args:
+        value (str): The value, possibly empty or missing.
+
+    Returns:
+        float: The number, None if empty.
+    """
+    return float(value) if value not in (None, "") else None
+
+class ResultsStore:
+    """
+    SQLite store with one row per run.
+
+    Columns added to the schema in later versions are added to existing
+    databases when they are opened.
+
+    Args:
+        path (str): The database file.
+    """
+
+    def __init__(self, path=results_db):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS runs ({})".format(
+                ", ".join(f"{name} {kind}" for name, kind in columns)
+            )
+        )
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(runs)")}
+        for name, kind in columns:
+            if name not in existing:
+                self.connection.execute(f"ALTER TABLE runs ADD COLUMN {name} {kind}")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS runs_cell ON runs (snapshotter, container, bandwidth_mbps, rtt_ms)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS runs_iteration ON runs (iteration_id)")
+        self.connection.commit()
+
+    def insert(self, row, replace=False):
+        """
+        Insert a run.
+
+        Args:
+            row (dict): Column name to value; missing columns are NULL, metrics and resources may be dicts.
+            replace (bool): Replace a run with the same run_id instead of ignoring the new one.
+        """
+        row = dict(row)
+        row.setdefault("run_id", new_run_id())
+        row.setdefault("host", socket.gethostname())
+        row.setdefault("timestamp", time.time())
+        for name in ("metrics", "resources"):
+            if isinstance(row.get(name), dict):
+                row[name] = json.dumps(row[name])
+        names = [name for name, _ in columns if name in row]
+        self.connection.execute(
+            "INSERT OR {} INTO runs ({}) VALUES ({})".format(
+                "REPLACE" if replace else "IGNORE", ", ".join(names), ", ".join("?" * len(names))
+            ),
+            [row[name] for name in names],
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+def load_frame(path=results_db, where=None, params=()):
+    """
+    Load the runs of a results database into a DataFrame in one query.
+
+    Args:
+        path (str): The database file.
+        where (str): SQL condition to filter the runs, optional.
+        params (tuple): Parameters of the condition.
+
+    Returns:
+        pandas.DataFrame: One row per run with the typed columns of the store.
+    """
+    # pandas is only needed to analyse the results, not on the benchmark nodes
+    import pandas as pd
+
+    connection = sqlite3.connect(path)
+    try:
+        query = "SELECT * FROM runs" + (f" WHERE {where}" if where else "")
+        return pd.read_sql_query(query, connection, params=params)
+    finally:
+        connection.close()
+
+def import_legacy(store, result_file, metrics_file=None, snapshotter=None):
+    """
+    Import the CSV files written by bench.py into the store.
+
+    Metrics rows are matched to result rows by (container, iteration, RTT,
+    bandwidth, cache state), in file order when a sweep was run several times. Imported
+    runs get an ID derived from the file and row, so importing the same file
+    twice does not duplicate them.
+
+    Args:
+        store (ResultsStore): The store to import into.
+        result_file (str): A provisioning_times_*.csv file.
+        metrics_file (str): The matching metrics_sum_*.csv file, optional.
+        snapshotter (str): The snapshotter, inferred from the file name if omitted.
+
+    Returns:
+        int: The number of runs read from the file.
+    """
+    if snapshotter is None:
+        match = legacy_file_pattern.search(os.path.basename(result_file))
+        if not match:
+            raise ValueError(f"Cannot infer the snapshotter from {result_file}, pass it explicitly")
+        snapshotter = match.group(1)
+
+    metrics_rows = {}
+    if metrics_file and os.path.isfile(metrics_file):
+        with open(metrics_file, newline="") as f:
+            for row in csv.DictReader(f):
+                key = (row["Container"], row["Iteration"], row["RTT"], row["Bandwidth"], row.get("Cache State") or "")
+                metrics_rows.setdefault(key, []).append(row)
+
+    source = os.path.basename(result_file)
+    count = 0
+    with open(result_file, newline="") as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            seconds = parse_time(row["Time"]) if row["Time"] else None
+            status = row.get("Status") or ("ok" if seconds is not None else "timeout")
+            key = (row["Container"], row["Iteration"], row["RTT"], row["Bandwidth"])
+            # Metrics rows written before the metrics file had a cache state come first and match by order alone
+            metrics = metrics_rows.get(key + ("",)) or metrics_rows.get(key + (row.get("Cache State") or "cold",), [])
+            metrics_row = metrics.pop(0) if metrics else {}
+            run = {
+                "run_id": hashlib.sha1(f"{source}:{index}".encode()).hexdigest(),
+                "host": None,
+                "timestamp": None,
+                "snapshotter": snapshotter,
+                "container": row["Container"],
+                "image": f"{row['Container']}:{snapshotter[:3]}",
+                "bandwidth_mbps": parse_unit(row["Bandwidth"], "Mbps"),
+                "rtt_ms": parse_unit(row["RTT"], "ms"),
+                "iteration": int(row["Iteration"]),
+                "iteration_id": row.get("Iteration ID") or None,
+                "parallel": 1,
+                "status": status,
+                "seconds": seconds,
+                "reset_seconds": parse_float(row.get("Reset")),
+                "ready_signal": row.get("Ready Signal") or None,
+                "cache_state": row.get("Cache State") or "cold",
+                "metrics_sum": int(metrics_row["Metrics Sum"]) if metrics_row.get("Metrics Sum") else None,
+                "fetch_p50_ms": parse_float(metrics_row.get("Fetch P50")),
+                "fetch_p95_ms": parse_float(metrics_row.get("Fetch P95")),
+                "fetch_p99_ms": parse_float(metrics_row.get("Fetch P99")),
+                "source": source,
+            }
+            for phase, column in phase_columns.items():
+                run[column] = parse_float(row.get(phase))
+            store.insert(run)
+            count += 1
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import legacy bench.py CSV files into the results store.")
+    parser.add_argument('files', nargs='+', help="provisioning_times_*.csv files to import.")
+    parser.add_argument('--db', type=str, default=results_db, help="The results database.")
+    parser.add_argument('--snapshotter', type=str, choices=['overlayfs', 'stargz', 'fleet'],
+                        help="The snapshotter of the files, inferred from their names by default.")
+    args = parser.parse_args()
+    store = ResultsStore(args.db)
+    for result_file in args.files:
+        # metrics_sum_<snapshotter>_<tag>fleetbench.csv next to the result file
+        directory, name = os.path.split(result_file)
+        metrics_file = os.path.join(directory, name.replace("provisioning_times_", "metrics_sum_", 1))
+        count = import_legacy(store, result_file, metrics_file, args.snapshotter)
+        print(f"Imported {count} runs from {result_file}")
+    store.close()
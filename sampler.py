@@ -0,0 +1,127 @@
+import csv
+import math
+import threading
+import time
+
+def read_proc_counters():
+    """
+    Read host-wide counters from /proc.
+
+    Returns:
+        dict: Bytes received on all non-loopback interfaces ("rx_bytes") and
+            busy CPU time in clock ticks ("cpu_busy").
+    """
+    rx_bytes = 0
+    with open("/proc/net/dev") as f:
+        for line in f.readlines()[2:]:
+            interface, fields = line.split(":", 1)
+            if interface.strip() != "lo":
+                rx_bytes += int(fields.split()[0])
+    with open("/proc/stat") as f:
+        cpu = [int(value) for value in f.readline().split()[1:]]
+    # Everything except idle and iowait
+    cpu_busy = sum(cpu) - cpu[3] - cpu[4]
+    return {"rx_bytes": rx_bytes, "cpu_busy": cpu_busy}
+
+class MetricsSampler(threading.Thread):
+    """
+    Poll the snapshotter metrics endpoint, and optionally /proc counters, in
+    the background while a container runs.
+
+    Only the requested series are parsed from each scrape. The time spent in
+    every poll and the CPU time of the sampler thread are measured so its
+    overhead can be reported next to the timing it runs alongside.
+
+    Args:
+        collector (MetricsCollector): Collector of the snapshotter, None to only sample /proc.
+        series (dict): Column name to (family, operation_type) of the counters to sample.
+        interval (float): Delay in seconds between the start of two polls.
+        proc (bool): Also sample the /proc counters.
+    """
+
+    def __init__(self, collector, series, interval=0.1, proc=False):
+        super().__init__(daemon=True)
+        self.collector = collector
+        self.series = series
+        self.interval = interval
+        self.proc = proc
+        self.families = {family for family, _ in series.values()}
+        self.columns = list(series) if collector else []
+        if proc:
+            self.columns += ["rx_bytes", "cpu_busy"]
+        self.rows = []
+        self.poll_times = []
+        self.errors = 0
+        self.cpu_time = 0.0
+        self.start_time = None
+        self.stop_event = threading.Event()
+
+    def poll(self):
+        values = {}
+        if self.collector:
+            try:
+                scrape = self.collector.scrape(self.families)
+            except Exception:
+                self.errors += 1
+                return
+            for column, (family, operation) in self.series.items():
+                values[column] = sum(
+                    value for (name, labels), value in scrape["samples"].items()
+                    if name == family and ("operation_type", operation) in labels
+                )
+        if self.proc:
+            values.update(read_proc_counters())
+        self.rows.append([time.perf_counter() - self.start_time] + [values[c] for c in self.columns])
+
+    def run(self):
+        thread_start = time.thread_time()
+        next_poll = self.start_time
+        while not self.stop_event.is_set():
+            poll_start = time.perf_counter()
+            self.poll()
+            self.poll_times.append(time.perf_counter() - poll_start)
+            next_poll += self.interval
+            self.stop_event.wait(max(next_poll - time.perf_counter(), 0))
+        self.cpu_time = time.thread_time() - thread_start
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        super().start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the last poll to finish.
+
+        Returns:
+            dict: The sampler overhead: number of polls, failed scrapes, mean and
+                max poll time in seconds, CPU seconds used by the sampler thread and
+                the fraction of the sampled period spent polling ("duty_cycle").
+        """
+        self.stop_event.set()
+        self.join()
+        duration = time.perf_counter() - self.start_time
+        busy = sum(self.poll_times)
+        return {
+            "polls": len(self.poll_times),
+            "errors": self.errors,
+            "mean_poll": busy / len(self.poll_times) if self.poll_times else 0.0,
+            "max_poll": max(self.poll_times, default=0.0),
+            "cpu_time": self.cpu_time,
+            "duty_cycle": busy / duration if duration > 0 else 0.0,
+        }
+
+    def write(self, path):
+        """
+        Write the time series as CSV, one row per poll.
+
+        Args:
+            path (str): The output file.
+        """
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["t"] + self.columns)
+            for row in self.rows:
+                # NaN and inf have no integer value and are written as they are
+                writer.writerow([f"{row[0]:.4f}"] + [
+                    f"{value:.0f}" if math.isfinite(value) and value == int(value) else value for value in row[1:]
+                ])
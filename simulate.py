@@ -0,0 +1,313 @@
+import argparse
+import bisect
+import collections
+import csv
+import glob
+import heapq
+
+from bench import latency_set, bandwidth_set
+from registry_trace import load_trace
+
+# Trace-driven provisioning simulator: replays the registry trace of a run
+# (bench.py --trace) against other network conditions to predict the
+# provisioning time of every cell of the sweep without running it.
+#
+# Every request of the trace depends on the latest request that completed
+# before it started; the time between the two is compute time of the
+# container or snapshotter, which does not depend on the network. A request
+# costs one RTT plus the server time before its first byte (one more RTT on
+# a new connection), then its bytes share the bandwidth with the other
+# transfers in progress. The time after the last response is kept as is.
+# Fetch counts and bytes are those of the trace, which assumes the requests
+# made do not depend on the network conditions.
+
+prediction_header = [
+    "snapshotter", "bandwidth_mbps", "container", "rtt_ms", "seconds", "fetches", "bytes",
+    "acceleration", "traces",
+]
+# Columns of the predictions file
+
+validation_header = [
+    "snapshotter", "bandwidth_mbps", "container", "rtt_ms", "predicted", "measured", "runs",
+    "error", "predicted_fetches", "measured_fetches", "captured",
+]
+# Columns of the validation file; error is relative to the measured time
+
+def build_model(trace):
+    """
+    Turn a run trace into a dependency graph of requests.
+
+    Args:
+        trace (dict): A trace loaded with registry_trace.load_trace.
+
+    Returns:
+        dict: The requests ("requests", each with its parent index, compute gap,
+            server time, length and whether it opened a connection), the compute
+            time after the last response ("tail") and the captured run.
+    """
+    rtt = (trace.get("rtt_ms") or 0) / 1000
+    records = sorted(trace["requests"], key=lambda record: record["t"])
+    ends = sorted((record["t"] + record["latency"], index) for index, record in enumerate(records))
+    end_times = [end for end, _ in ends]
+    connections = set()
+    requests = []
+    for record in records:
+        # Latest request completed before this one started
+        position = bisect.bisect_right(end_times, record["t"]) - 1
+        parent, parent_end = (ends[position][1], ends[position][0]) if position >= 0 else (None, 0.0)
+        new_connection = record["connection"] not in connections
+        connections.add(record["connection"])
+        gap = record["t"] - parent_end - (rtt if new_connection else 0)
+        requests.append({
+            "parent": parent,
+            "gap": max(gap, 0.0),
+            "server": max(record["ttfb"] - rtt, 0.0),
+            "length": record["length"],
+            "new_connection": new_connection,
+            "blob": record["kind"] == "blob",
+        })
+    last_end = max(end_times, default=0.0)
+    seconds = trace.get("seconds")
+    return {
+        "requests": requests,
+        "tail": max(seconds - last_end, 0.0) if seconds else 0.0,
+        "seconds": seconds,
+        "container": trace["container"],
+        "snapshotter": trace["snapshotter"],
+        "rtt_ms": trace.get("rtt_ms"),
+        "bandwidth_mbps": trace.get("bandwidth_mbps"),
+    }
+
+def replay(model, rtt, bandwidth):
+    """
+    Predict the provisioning time of a run under other network conditions.
+
+    Transfers in progress at the same time share the bandwidth equally.
+
+    Args:
+        model (dict): The model returned by build_model.
+        rtt (float): The RTT in milliseconds.
+        bandwidth (float): The bandwidth in Mbps, None or 0 for no limit.
+
+    Returns:
+        float: The predicted provisioning time in seconds.
+    """
+    requests = model["requests"]
+    if not requests:
+        return model["seconds"]
+    rtt /= 1000
+    rate = bandwidth * 1e6 / 8 if bandwidth else None
+    children = collections.defaultdict(list)
+    for index, request in enumerate(requests):
+        children[request["parent"]].append(index)
+
+    starts = []
+    # Heap of (time the first byte arrives, request)
+
+    def schedule(parent, now):
+        for index in children[parent]:
+            request = requests[index]
+            start = now + request["gap"] + (rtt if request["new_connection"] else 0)
+            heapq.heappush(starts, (start + rtt + request["server"], index))
+
+    schedule(None, 0.0)
+    active = {}
+    # Bytes left of every transfer in progress
+    now = 0.0
+    finished = 0.0
+    while starts or active:
+        next_start = starts[0][0] if starts else float("inf")
+        share = rate / len(active) if active else None
+        next_done = now + min(active.values()) / share if active else float("inf")
+        step = min(next_start, next_done) - now
+        for index in active:
+            active[index] -= step * share
+        now += step
+        # Less than a byte left is rounding error
+        done = [index for index, left in active.items() if left < 0.5]
+        if next_start <= next_done:
+            _, index = heapq.heappop(starts)
+            if requests[index]["length"] == 0 or not rate:
+                done.append(index)
+            else:
+                active[index] = requests[index]["length"]
+        for index in done:
+            active.pop(index, None)
+            finished = max(finished, now)
+            schedule(index, now)
+    return finished + model["tail"]
+
+def load_models(patterns, cache_state="cold"):
+    """
+    Load the traces matching glob patterns and group their models by cell.
+
+    Args:
+        patterns (list): Trace files or glob patterns.
+        cache_state (str): Only keep the traces of runs started from this cache state.
+
+    Returns:
+        dict: (container, snapshotter) to the list of models of its traces.
+    """
+    models = collections.defaultdict(list)
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            trace = load_trace(path)
+            if trace.get("status", "ok") != "ok" or trace.get("cache_state", "cold") != cache_state:
+                continue
+            model = build_model(trace)
+            models[(model["container"], model["snapshotter"])].append(model)
+    return models
+
+def predict(models, latencies, bandwidths, baseline="overlayfs"):
+    """
+    Predict every cell of the latency x bandwidth grid.
+
+    The prediction of a cell is the mean of the replays of all traces of its
+    (container, snapshotter).
+
+    Args:
+        models (dict): The models returned by load_models.
+        latencies (list): RTTs in milliseconds.
+        bandwidths (list): Bandwidths in Mbps.
+        baseline (str): The snapshotter the acceleration rate is relative to.
+
+    Returns:
+        list: One dict per cell with the prediction_header keys.
+    """
+    cells = []
+    for (container, snapshotter), group in sorted(models.items()):
+        fetches = sum(sum(request["blob"] for request in model["requests"]) for model in group) / len(group)
+        size = sum(sum(request["length"] for request in model["requests"]) for model in group) / len(group)
+        for bandwidth in bandwidths:
+            for latency in latencies:
+                seconds = sum(replay(model, latency, bandwidth) for model in group) / len(group)
+                cells.append({
+                    "snapshotter": snapshotter,
+                    "bandwidth_mbps": bandwidth,
+                    "container": container,
+                    "rtt_ms": latency,
+                    "seconds": seconds,
+                    "fetches": fetches,
+                    "bytes": size,
+                    "acceleration": None,
+                    "traces": len(group),
+                })
+    baseline_seconds = {
+        (cell["container"], cell["bandwidth_mbps"], cell["rtt_ms"]): cell["seconds"]
+        for cell in cells if cell["snapshotter"] == baseline
+    }
+    for cell in cells:
+        reference = baseline_seconds.get((cell["container"], cell["bandwidth_mbps"], cell["rtt_ms"]))
+        if reference is not None and cell["seconds"]:
+            cell["acceleration"] = reference / cell["seconds"]
+    return cells
+
+def validate(models, runs):
+    """
+    Compare predictions with measured cells.
+
+    Args:
+        models (dict): The models returned by load_models.
+        runs (pandas.DataFrame): Runs loaded with analysis.load_runs and select_runs.
+
+    Returns:
+        list: One dict per measured cell with a trace, with the validation_header keys.
+    """
+    measured = runs.groupby(["snapshotter", "bandwidth_mbps", "container", "rtt_ms"]).agg(
+        measured=("seconds", "mean"), runs=("seconds", "size"), measured_fetches=("metrics_sum", "mean"),
+    )
+    rows = []
+    for (snapshotter, bandwidth, container, latency), cell in measured.iterrows():
+        group = models.get((container, snapshotter))
+        if not group:
+            continue
+        predicted = sum(replay(model, latency, bandwidth) for model in group) / len(group)
+        captured = any(
+            model["rtt_ms"] == latency and model["bandwidth_mbps"] == bandwidth for model in group
+        )
+        rows.append({
+            "snapshotter": snapshotter,
+            "bandwidth_mbps": bandwidth,
+            "container": container,
+            "rtt_ms": latency,
+            "predicted": predicted,
+            "measured": cell["measured"],
+            "runs": int(cell["runs"]),
+            "error": (predicted - cell["measured"]) / cell["measured"],
+            "predicted_fetches": sum(
+                sum(request["blob"] for request in model["requests"]) for model in group
+            ) / len(group),
+            "measured_fetches": cell["measured_fetches"],
+            "captured": captured,
+        })
+    return rows
+
+def write_rows(path, header, rows):
+    """
+    Write dict rows as CSV.
+
+    Args:
+        path (str): The output file.
+        header (list): The columns.
+        rows (list): The rows, missing values are left empty.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow([
+                "" if row[column] is None else f"{row[column]:.6g}" if isinstance(row[column], float)
+                else row[column]
+                for column in header
+            ])
+    print(f"Saved {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict provisioning times by replaying registry traces.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    predict_parser = commands.add_parser("predict", help="Predict the whole latency x bandwidth grid.")
+    predict_parser.add_argument('traces', nargs='+', help="Trace files or glob patterns written by bench.py --trace.")
+    predict_parser.add_argument('--latencies', nargs='+', type=float, default=latency_set,
+                                help="RTTs to predict in milliseconds.")
+    predict_parser.add_argument('--bandwidths', nargs='+', type=float, default=bandwidth_set,
+                                help="Bandwidths to predict in Mbps.")
+    predict_parser.add_argument('--baseline', type=str, default="overlayfs",
+                                help="Snapshotter the acceleration rate is relative to.")
+    predict_parser.add_argument('--out', type=str, default="predictions.csv", help="Output CSV file.")
+    predict_parser.add_argument('--plot', type=str, help="Also plot the predictions to this figure.")
+
+    validate_parser = commands.add_parser("validate", help="Compare predictions with measured cells.")
+    validate_parser.add_argument('traces', nargs='+', help="Trace files or glob patterns written by bench.py --trace.")
+    validate_parser.add_argument('--runs', nargs='+', required=True,
+                                 help="Result files, results databases or glob patterns with the measured cells.")
+    validate_parser.add_argument('--out', type=str, default="validation.csv", help="Output CSV file.")
+    for command_parser in (predict_parser, validate_parser):
+        command_parser.add_argument('--cache-state', type=str, default="cold",
+                                    help="Cache state of the traces and runs: cold, base, images, pagecache or warm.")
+    args = parser.parse_args()
+
+    models = load_models(args.traces, args.cache_state)
+    print(f"Loaded {sum(len(group) for group in models.values())} traces of {len(models)} images")
+    if args.command == "predict":
+        cells = predict(models, args.latencies, args.bandwidths, args.baseline)
+        write_rows(args.out, prediction_header, cells)
+        if args.plot:
+            # pandas and matplotlib are only needed for the figure
+            import pandas as pd
+            from analysis import aggregate, plot_cells
+
+            runs = pd.DataFrame(cells).rename(columns={"fetches": "metrics_sum"}).assign(status="ok")
+            plot_cells(aggregate(runs, args.baseline), runs, args.plot, baseline=args.baseline, show=False)
+    else:
+        from analysis import load_runs, select_runs
+
+        rows = validate(models, select_runs(load_runs(args.runs), cache_state=args.cache_state))
+        write_rows(args.out, validation_header, rows)
+        unseen = [row for row in rows if not row["captured"]]
+        if unseen:
+            mape = sum(abs(row["error"]) for row in unseen) / len(unseen)
+            worst = max(unseen, key=lambda row: abs(row["error"]))
+            print(f"Mean absolute error over {len(unseen)} cells not used for the traces: {mape:.1%}, "
+                  f"worst {worst['error']:+.1%} ({worst['snapshotter']} {worst['container']} "
+                  f"{worst['bandwidth_mbps']:g}Mbps {worst['rtt_ms']:g}ms)")